@@ -0,0 +1,6 @@
+"""admin urls imported on first use when LAZY_ADMIN is set"""
+from django.contrib import admin
+
+admin.autodiscover()
+
+urlpatterns = admin.site.get_urls()
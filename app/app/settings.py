@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -31,8 +32,13 @@ ALLOWED_HOSTS = []
 
 # Application definition
 
+# with LAZY_ADMIN the admin modules are imported by the first admin
+# request instead of at startup, api workers never load them
+LAZY_ADMIN = bool(int(os.environ.get('LAZY_ADMIN', 1)))
+
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    'django.contrib.admin.apps.SimpleAdminConfig'
+    if LAZY_ADMIN else 'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -43,17 +49,39 @@ INSTALLED_APPS = [
     'core',
     'users',
     'recipes',
+    'benchmarks',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestProfilingMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.SlowQueryMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+]
+
+# middleware only browser facing pages (the admin) need. With
+# LEAN_MIDDLEWARE requests under LEAN_PATH_PREFIXES skip it, they
+# authenticate with tokens and use no session, csrf cookie or message
+
+BROWSER_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+LEAN_MIDDLEWARE = bool(int(os.environ.get('LEAN_MIDDLEWARE', 1)))
+LEAN_PATH_PREFIXES = ['/api/', '/metrics']
+
+if LEAN_MIDDLEWARE:
+    MIDDLEWARE.append('core.middleware.PathDispatchMiddleware')
+    # the admin finds its middleware behind the dispatcher
+    SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+else:
+    MIDDLEWARE += BROWSER_MIDDLEWARE
 
 ROOT_URLCONF = 'app.urls'
 
@@ -79,16 +107,88 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'HOST': os.environ.get('DB_HOST'),
+# connections are kept in a per process pool (core.db.pool), closing them
+# at the end of a request hands them back to the pool.
+# DB_SQLITE_DIR switches every database to SQLite files in that directory
+# to try multi database setups (replicas) locally.
+
+DB_SQLITE_DIR = os.environ.get('DB_SQLITE_DIR')
+
+
+def database(name, host=None, **extra):
+    """return the settings of one database"""
+    if DB_SQLITE_DIR:
+        return dict({
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(DB_SQLITE_DIR, f'{name}.sqlite3'),
+        }, **extra)
+    return dict({
+        'ENGINE': 'core.db.backends.postgresql',
+        'HOST': host or os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
-    }
+        'OPTIONS': {
+            'POOL': {
+                'max_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+                'max_lifetime': float(
+                    os.environ.get('DB_POOL_MAX_LIFETIME', 1800)
+                ),
+                'pre_ping': bool(int(os.environ.get('DB_POOL_PRE_PING', 1))),
+                'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            },
+        },
+    }, **extra)
+
+
+DATABASES = {
+    'default': database('default'),
 }
 
+# read replicas as comma separated host[=weight], e.g. DB_REPLICAS=r1=3,r2
+# safe reads of views with `use_replicas` go to them (core.routers), users
+# read from the primary for REPLICA_PIN_SECONDS after they write. The pins
+# live in REPLICA_PIN_STORE, 'sqlite' shares them between the worker
+# processes of a host, 'locmem' only suits a single process.
+
+DATABASE_REPLICAS = {}
+for index, replica in enumerate(
+        filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    host, _, weight = replica.partition('=')
+    alias = f'replica{index}'
+    DATABASES[alias] = database(alias, host, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS[alias] = int(weight or 1)
+
+# user keyed shards as comma separated hosts, e.g. DB_SHARDS=s1,s2
+# recipes, tags and ingredients of a user live on the shard assigned to
+# them (core.sharding), users and everything else stay on default
+
+DATABASE_SHARDS = ['default']
+for index, host in enumerate(
+        filter(None, os.environ.get('DB_SHARDS', '').split(',')), 1):
+    alias = f'shard{index}'
+    DATABASES[alias] = database(alias, host)
+    DATABASE_SHARDS.append(alias)
+
+# processes cache the shard of a user this long, move_user_shard keeps the
+# user inactive for as long so no worker writes to the old shard
+SHARD_ASSIGNMENT_CACHE_SECONDS = float(
+    os.environ.get('DB_SHARD_CACHE_SECONDS', 30)
+)
+
+DATABASE_ROUTERS = ['core.routers.ShardRouter', 'core.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = float(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+REPLICA_PIN_STORE = os.environ.get('DB_REPLICA_PIN_STORE', 'sqlite')
+REPLICA_PIN_SQLITE_PATH = os.environ.get(
+    'DB_REPLICA_PIN_SQLITE_PATH',
+    os.path.join(tempfile.gettempdir(), 'recipe-app-replica-pins.sqlite3')
+)
+
+# under asgi, serve reads of views with `async_reads` on a pool of this
+# many threads, it also caps the database connections they use
+ASYNC_READS = bool(int(os.environ.get('ASYNC_READS', 1)))
+ASYNC_READ_THREADS = int(os.environ.get('ASYNC_READ_THREADS', 8))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -108,6 +208,29 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# new passwords are hashed with PASSWORD_HASHER, hashes made by any of the
+# others (or with other pbkdf2 iterations) are upgraded on the next login
+# https://docs.djangoproject.com/en/3.1/topics/auth/passwords/
+
+PASSWORD_HASHER = os.environ.get(
+    'PASSWORD_HASHER', 'core.hashers.PBKDF2PasswordHasher'
+)
+PASSWORD_HASH_ITERATIONS = int(
+    os.environ.get('PASSWORD_HASH_ITERATIONS', 260000)
+)
+PASSWORD_HASHERS = [PASSWORD_HASHER] + [
+    hasher for hasher in (
+        'core.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    ) if hasher != PASSWORD_HASHER
+]
+
+# seconds repeated logins with the same credentials reuse the issued token
+# without hashing the password again (users.login_cache), 0 disables
+LOGIN_CACHE_SECONDS = int(os.environ.get('LOGIN_CACHE_SECONDS', 300))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.1/topics/i18n/
@@ -133,3 +256,137 @@ MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
 AUTH_USER_MODEL = 'core.user'
+
+# Request profiling
+# emits Server-Timing headers and per request logs tagged with view/action,
+# the middleware unloads itself when this is off
+
+REQUEST_PROFILING = bool(int(os.environ.get('REQUEST_PROFILING', 0)))
+
+# Metrics
+# prometheus text metrics served on /metrics, workers of the same host
+# share them by dumping snapshots into METRICS_DIR
+
+METRICS_ENABLED = bool(int(os.environ.get('METRICS_ENABLED', 0)))
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+# Slow query log
+# queries slower than the threshold (in ms) during api requests are stored
+# with their EXPLAIN plan, unset to disable. ANALYZE runs the query again.
+
+SLOW_QUERY_THRESHOLD_MS = (
+    float(os.environ['SLOW_QUERY_THRESHOLD_MS'])
+    if os.environ.get('SLOW_QUERY_THRESHOLD_MS') else None
+)
+SLOW_QUERY_EXPLAIN_ANALYZE = bool(
+    int(os.environ.get('SLOW_QUERY_EXPLAIN_ANALYZE', 0))
+)
+SLOW_QUERY_PATHS = ['/api/recipes/', '/api/users/']
+SLOW_QUERY_STACK_DEPTH = 10
+SLOW_QUERY_LOG_FILE = os.environ.get('SLOW_QUERY_LOG_FILE')
+
+# Query budgets
+# views declare `query_budget`, requests going over it or repeating the
+# same query more than QUERY_BUDGET_DUPLICATE_LIMIT times (N+1) raise
+# QueryBudgetExceeded, or only log when QUERY_BUDGET_RAISE is off
+
+QUERY_BUDGET_ENABLED = bool(
+    int(os.environ.get('QUERY_BUDGET_ENABLED', int(DEBUG)))
+)
+QUERY_BUDGET_RAISE = bool(int(os.environ.get('QUERY_BUDGET_RAISE', 1)))
+QUERY_BUDGET_DUPLICATE_LIMIT = 3
+
+# Throttling
+# token buckets per user, per ip for anonymous requests and per scope for
+# logins and image uploads (core.throttling). THROTTLE_STORE=sqlite shares
+# the buckets between the worker processes of a host.
+
+THROTTLE_ENABLED = bool(
+    int(os.environ.get('THROTTLE_ENABLED', int(not DEBUG)))
+)
+THROTTLE_STORE = os.environ.get('THROTTLE_STORE', 'locmem')
+THROTTLE_SQLITE_PATH = os.environ.get(
+    'THROTTLE_SQLITE_PATH',
+    os.path.join(tempfile.gettempdir(), 'recipe-app-throttle.sqlite3')
+)
+
+# Change events
+# server-sent at EVENTS_PATH by the asgi application (core.events).
+# EVENTS_STORE=sqlite fans the events out to every worker process of a
+# host, with locmem only streams of the worker that saved a change get it.
+
+EVENTS_ENABLED = bool(int(os.environ.get('EVENTS_ENABLED', 1)))
+EVENTS_PATH = '/api/recipes/events/'
+EVENTS_STORE = os.environ.get('EVENTS_STORE', 'locmem')
+EVENTS_SQLITE_PATH = os.environ.get(
+    'EVENTS_SQLITE_PATH',
+    os.path.join(tempfile.gettempdir(), 'recipe-app-events.sqlite3')
+)
+# kept for clients resuming with Last-Event-ID
+EVENTS_RETENTION_SECONDS = 300
+EVENTS_POLL_INTERVAL = 0.25
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_RETRY_MS = 3000
+# events waiting for a slow client before its stream is ended
+EVENTS_QUEUE_SIZE = 100
+
+# Recipe index
+# per user indexes of recipe ingredients and tags (recipes.index) and of
+# tag and ingredient names (recipes.autocomplete), kept for the most
+# recently used users of each process and rebuilt after
+# RECIPE_INDEX_SECONDS or once a change bumps their generation
+# (core.generations). GENERATIONS_STORE=sqlite shares the generations
+# between the worker processes of a host, with locmem other workers only
+# see a change after RECIPE_INDEX_SECONDS.
+
+RECIPE_INDEX_MAX_USERS = int(os.environ.get('RECIPE_INDEX_MAX_USERS', 1000))
+RECIPE_INDEX_SECONDS = int(os.environ.get('RECIPE_INDEX_SECONDS', 300))
+GENERATIONS_STORE = os.environ.get('GENERATIONS_STORE', 'sqlite')
+GENERATIONS_SQLITE_PATH = os.environ.get(
+    'GENERATIONS_SQLITE_PATH',
+    os.path.join(tempfile.gettempdir(), 'recipe-app-generations.sqlite3')
+)
+
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.AnonRateThrottle',
+        'core.throttling.UserRateThrottle',
+        'core.throttling.ScopedRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': os.environ.get('THROTTLE_ANON_RATE', '60/min'),
+        'user': os.environ.get('THROTTLE_USER_RATE', '600/min'),
+        'login': os.environ.get('THROTTLE_LOGIN_RATE', '10/min'),
+        'upload': os.environ.get('THROTTLE_UPLOAD_RATE', '20/min'),
+    },
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': os.environ.get('CORE_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+if SLOW_QUERY_LOG_FILE:
+    LOGGING['handlers']['slow_queries'] = {
+        'class': 'logging.handlers.RotatingFileHandler',
+        'filename': SLOW_QUERY_LOG_FILE,
+        'maxBytes': 10 * 1024 * 1024,
+        'backupCount': 5,
+    }
+    LOGGING['loggers']['core.slow_queries'] = {
+        'handlers': ['slow_queries'],
+        'level': 'WARNING',
+        'propagate': False,
+    }
@@ -13,13 +13,27 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
 from django.urls import path, include
+from django.urls.resolvers import RoutePattern, URLResolver
 from django.conf.urls.static import static
 from django.conf import settings
+from core import views as core_views
+
+if settings.LAZY_ADMIN:
+    # the resolver imports app.admin_urls when a url under admin/ is
+    # resolved or any url is reversed
+    admin_urls = URLResolver(
+        RoutePattern('admin/'), 'app.admin_urls',
+        app_name='admin', namespace='admin'
+    )
+else:
+    from django.contrib import admin
+
+    admin_urls = path('admin/', admin.site.urls)
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    admin_urls,
     path('api/users/', include('users.urls')),
     path('api/recipes/', include('recipes.urls')),
+    path('metrics', core_views.metrics, name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,232 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import StringIO
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from core.asgi import AsyncReadHandler
+from core.models import User
+from benchmarks.management.commands.loadtest import (
+    Request, call_asgi, call_wsgi
+)
+from benchmarks.utils import (
+    benchmark_databases, compare_results, save_results, summarize
+)
+
+SERVERS = ('wsgi', 'asgi', 'async_reads')
+
+
+class ThreadSampler:
+    """record the highest number of live threads while running"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+        self._thread.join()
+
+
+def run_wsgi(requests, clients, delay, threads):
+    """clients share a pool like a threaded wsgi server, a thread stays
+    busy while its slow client reads the response"""
+    from app.wsgi import application
+
+    durations, statuses = [], []
+    start = time.perf_counter()
+
+    def client(index):
+        ready = start
+        for request in requests[index]:
+            statuses.append(call_wsgi(application, request))
+            time.sleep(delay)
+            now = time.perf_counter()
+            durations.append(now - ready)
+            ready = now
+
+    with ThreadPoolExecutor(threads) as executor:
+        for future in [executor.submit(client, i) for i in range(clients)]:
+            future.result()
+    return durations, statuses, time.perf_counter() - start
+
+
+def run_asgi(application, requests, clients, delay):
+    """clients are coroutines, slow ones only delay the send"""
+    durations, statuses = [], []
+
+    async def client(index, start):
+        ready = start
+        for request in requests[index]:
+            statuses.append(
+                await call_asgi(application, request, send_delay=delay)
+            )
+            now = time.perf_counter()
+            durations.append(now - ready)
+            ready = now
+
+    async def main():
+        start = time.perf_counter()
+        await asyncio.gather(*(client(i, start) for i in range(clients)))
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(main())
+    return durations, statuses, elapsed
+
+
+class Command(BaseCommand):
+    """Django command to compare how many slow clients servers handle"""
+    help = (
+        'Drive increasing numbers of concurrent slow clients reading '
+        'recipes, tags and recipe details through a threaded WSGI '
+        'server, django\'s ASGI handler and the ASGI handler serving '
+        'reads on a thread pool, and report throughput, latency and the '
+        'threads each needed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clients', default='10,100,1000',
+            help='comma separated numbers of concurrent clients'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=3,
+            help='requests made by each client one after the other'
+        )
+        parser.add_argument(
+            '--client-delay', type=float, default=50,
+            help='ms a client takes to read each response'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=8,
+            help='threads of the wsgi server and of the read pool'
+        )
+        parser.add_argument(
+            '--servers', default=','.join(SERVERS),
+            help='comma separated servers to measure'
+        )
+        parser.add_argument('--output', help='save results as json')
+        parser.add_argument('--compare', help='previous json results')
+        parser.add_argument(
+            '--use-configured-db', action='store_true',
+            help='create the user in the configured database'
+        )
+
+    def handle(self, *args, **options):
+        servers = options['servers'].split(',')
+        unknown = set(servers) - set(SERVERS)
+        if unknown:
+            raise CommandError(
+                f'unknown servers: {", ".join(sorted(unknown))}'
+            )
+        levels = [int(c) for c in options['clients'].split(',')]
+        delay = options['client_delay'] / 1000
+        results = {}
+        self.stdout.write(
+            f'{"server":<12}{"clients":>8}{"rps":>10}{"p50 ms":>10}'
+            f'{"p99 ms":>10}{"threads":>9}'
+        )
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['localhost'],
+                               QUERY_BUDGET_ENABLED=False,
+                               THROTTLE_ENABLED=False), \
+                benchmark_databases(not options['use_configured_db']):
+            reads = self._seed()
+            for server in servers:
+                results[server] = {}
+                with self._server(server, options['threads'], delay) as run:
+                    # warm up the pools and connections
+                    run([reads], 1)
+                    for clients in levels:
+                        requests = [
+                            [reads[(c + i) % len(reads)]
+                             for i in range(options['requests'])]
+                            for c in range(clients)
+                        ]
+                        stats = self._measure(server, run, requests, clients)
+                        results[server][str(clients)] = stats
+                        self.stdout.write(
+                            f'{server:<12}{clients:>8}{stats["rps"]:>10}'
+                            f'{stats["p50_ms"]:>10}{stats["p99_ms"]:>10}'
+                            f'{stats["peak_threads"]:>9}'
+                        )
+
+        if options['output']:
+            save_results(
+                options['output'], 'asyncbench', results,
+                requests=options['requests'],
+                client_delay=options['client_delay'],
+                threads=options['threads']
+            )
+        if options['compare']:
+            for line in compare_results(
+                options['compare'], results, ('rps', 'p99_ms')
+            ):
+                self.stdout.write(line)
+
+    @contextmanager
+    def _server(self, server, threads, delay):
+        """yield a function running clients through the server"""
+        if server == 'wsgi':
+            yield lambda requests, clients: run_wsgi(
+                requests, clients, delay, threads
+            )
+            return
+        if server == 'asgi':
+            application = ASGIHandler()
+        else:
+            application = AsyncReadHandler(threads)
+        try:
+            yield lambda requests, clients: run_asgi(
+                application, requests, clients, delay
+            )
+        finally:
+            if server == 'async_reads':
+                application.executor.shutdown()
+
+    def _measure(self, server, run, requests, clients):
+        with ThreadSampler() as sampler:
+            durations, statuses, elapsed = run(requests, clients)
+        errors = sum(1 for status in statuses if status != 200)
+        if errors:
+            raise CommandError(f'{server}: {errors} requests failed')
+        return dict(
+            summarize(durations),
+            rps=round(len(durations) / elapsed, 2),
+            peak_threads=sampler.peak,
+        )
+
+    def _seed(self):
+        first_user = User.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        call_command(
+            'generate_data', users=1, recipes=20, seed=1,
+            distribution='uniform', stdout=StringIO()
+        )
+        user = User.objects.filter(id__gt=first_user).get()
+        token = Token.objects.get_or_create(user=user)[0].key
+        recipe = user.recipe_set.values_list('id', flat=True).first()
+        return [
+            Request('recipe_list', 'GET', '/api/recipes/recipes/',
+                    token=token),
+            Request('tag_list', 'GET', '/api/recipes/tags/', token=token),
+            Request('recipe_detail', 'GET',
+                    f'/api/recipes/recipes/{recipe}/', token=token),
+        ]
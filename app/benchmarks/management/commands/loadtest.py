@@ -0,0 +1,443 @@
+import asyncio
+import io
+import json
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from core.models import User
+from benchmarks.utils import (
+    benchmark_databases, compare_results, save_results, summarize
+)
+
+PASSWORD = 'synthetic123'
+
+# relative frequency of each endpoint in the traffic mix
+DEFAULT_MIX = {
+    'token': 5,
+    'recipe_list': 30,
+    'recipe_detail': 30,
+    'recipe_create': 10,
+    'tag_list': 10,
+    'ingredient_list': 10,
+    'upload_image': 5,
+}
+
+
+def _jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def _multipart(field, filename, content, content_type):
+    boundary = 'loadtestboundary'
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; '
+        f'filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class Request:
+    """a single http request of the traffic mix"""
+
+    def __init__(self, endpoint, method, path, token=None, body=b'',
+                 content_type=''):
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.body = body
+        self.content_type = content_type
+        self.headers = [(b'host', b'localhost')]
+        if token:
+            self.headers.append(
+                (b'authorization', f'Token {token}'.encode())
+            )
+        if content_type:
+            self.headers.append((b'content-type', content_type.encode()))
+            self.headers.append(
+                (b'content-length', str(len(body)).encode())
+            )
+
+
+class TrafficMix:
+    """builds requests of seeded users according to endpoint weights"""
+
+    def __init__(self, accounts, mix, seed):
+        self.accounts = accounts
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.seed = seed
+        self.image = _jpeg()
+
+    def requests(self, worker):
+        """yield an endless stream of requests for one worker"""
+        rng = random.Random(self.seed + worker)
+        while True:
+            endpoint = rng.choices(self.endpoints, self.weights)[0]
+            account = rng.choice(self.accounts)
+            yield getattr(self, f'_{endpoint}')(rng, account)
+
+    def _token(self, rng, account):
+        body = json.dumps(
+            {'email': account['email'], 'password': PASSWORD}
+        ).encode()
+        return Request(
+            'token', 'POST', '/api/users/token/',
+            body=body, content_type='application/json'
+        )
+
+    def _recipe_list(self, rng, account):
+        return Request(
+            'recipe_list', 'GET', '/api/recipes/recipes/', account['token']
+        )
+
+    def _recipe_detail(self, rng, account):
+        recipe = rng.choice(account['recipes'])
+        return Request(
+            'recipe_detail', 'GET', f'/api/recipes/recipes/{recipe}/',
+            account['token']
+        )
+
+    def _recipe_create(self, rng, account):
+        payload = {
+            'title': f'load test {rng.randint(0, 10 ** 6)}',
+            'time_minute': rng.randint(5, 120),
+            'price': f'{rng.randint(100, 9999) / 100:.2f}',
+            'tags': rng.sample(account['tags'], min(2, len(account['tags']))),
+            'ingredients': rng.sample(
+                account['ingredients'], min(5, len(account['ingredients']))
+            ),
+        }
+        return Request(
+            'recipe_create', 'POST', '/api/recipes/recipes/',
+            account['token'], json.dumps(payload).encode(),
+            'application/json'
+        )
+
+    def _tag_list(self, rng, account):
+        return Request(
+            'tag_list', 'GET', '/api/recipes/tags/', account['token']
+        )
+
+    def _ingredient_list(self, rng, account):
+        return Request(
+            'ingredient_list', 'GET', '/api/recipes/ingredients/',
+            account['token']
+        )
+
+    def _upload_image(self, rng, account):
+        recipe = rng.choice(account['recipes'])
+        body, content_type = _multipart(
+            'image', 'load.jpg', self.image, 'image/jpeg'
+        )
+        return Request(
+            'upload_image', 'POST',
+            f'/api/recipes/recipes/{recipe}/upload-image/',
+            account['token'], body, content_type
+        )
+
+
+def call_wsgi(application, request):
+    """run a request through a wsgi application, return the status code"""
+    url = urlsplit(request.path)
+    environ = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(request.body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in request.headers:
+        key = name.decode().upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        environ[key] = value.decode()
+    status = []
+
+    def start_response(response_status, headers, exc_info=None):
+        status.append(int(response_status.split()[0]))
+
+    body = application(environ, start_response)
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return status[0]
+
+
+async def call_asgi(application, request, send_delay=0):
+    """run a request through an asgi application, return the status code
+
+    send_delay seconds are spent receiving the body, like a slow client
+    """
+    url = urlsplit(request.path)
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': request.method,
+        'scheme': 'http',
+        'path': url.path,
+        'raw_path': url.path.encode(),
+        'query_string': url.query.encode(),
+        'root_path': '',
+        'headers': request.headers,
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    sent = False
+    status = []
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            # nothing more to read, wait like a client keeping the socket
+            await asyncio.sleep(3600)
+        sent = True
+        return {'type': 'http.request', 'body': request.body,
+                'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif send_delay and not message.get('more_body', False):
+            await asyncio.sleep(send_delay)
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+class Recorder:
+    """thread safe collection of latencies per endpoint"""
+
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, duration, status):
+        with self._lock:
+            self.durations[endpoint].append(duration)
+            if status >= 400:
+                self.errors[endpoint] += 1
+
+    def results(self, elapsed):
+        results = {}
+        for endpoint, durations in sorted(self.durations.items()):
+            results[endpoint] = dict(
+                summarize(durations),
+                errors=self.errors[endpoint],
+                rps=round(len(durations) / elapsed, 2),
+            )
+        total = sum(len(d) for d in self.durations.values())
+        results['total'] = dict(
+            summarize([d for ds in self.durations.values() for d in ds]),
+            errors=sum(self.errors.values()),
+            rps=round(total / elapsed, 2),
+        )
+        return results
+
+
+def run_wsgi(traffic, concurrency, duration):
+    from app.wsgi import application
+
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        for request in traffic.requests(index):
+            if time.perf_counter() >= deadline:
+                return
+            start = time.perf_counter()
+            status = call_wsgi(application, request)
+            recorder.record(
+                request.endpoint, time.perf_counter() - start, status
+            )
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for future in [executor.submit(worker, i)
+                       for i in range(concurrency)]:
+            future.result()
+    return recorder.results(time.perf_counter() - start)
+
+
+def run_asgi(traffic, concurrency, duration):
+    from app.asgi import application
+
+    recorder = Recorder()
+
+    async def worker(index, deadline):
+        for request in traffic.requests(index):
+            if time.perf_counter() >= deadline:
+                return
+            start = time.perf_counter()
+            status = await call_asgi(application, request)
+            recorder.record(
+                request.endpoint, time.perf_counter() - start, status
+            )
+
+    async def main():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            worker(i, deadline) for i in range(concurrency)
+        ))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return recorder.results(time.perf_counter() - start)
+
+
+class Command(BaseCommand):
+    """Django command to load test the api in process"""
+    help = (
+        'Seed data and drive a concurrent traffic mix through the WSGI '
+        'and ASGI applications, reporting throughput and latency per '
+        'endpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--server', choices=('wsgi', 'asgi', 'both'), default='both'
+        )
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument(
+            '--recipes', type=int, default=50,
+            help='mean number of recipes per seeded user'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--mix', default='',
+            help='endpoint weights, e.g. recipe_list=10,token=1'
+        )
+        parser.add_argument('--output', help='save results as json')
+        parser.add_argument('--compare', help='previous json results')
+        parser.add_argument(
+            '--use-configured-db', action='store_true',
+            help='seed the configured database instead of a test database'
+        )
+
+    def handle(self, *args, **options):
+        mix = self._parse_mix(options['mix'])
+        servers = (
+            ('wsgi', 'asgi') if options['server'] == 'both'
+            else (options['server'],)
+        )
+        results = {}
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root, DEBUG=False,
+                                  ALLOWED_HOSTS=['localhost'],
+                                  QUERY_BUDGET_ENABLED=False,
+                                  THROTTLE_ENABLED=False), \
+                benchmark_databases(not options['use_configured_db']):
+            traffic = TrafficMix(self._seed(options), mix, options['seed'])
+            for server in servers:
+                self.stdout.write(
+                    f'{server}: {options["concurrency"]} clients for '
+                    f'{options["duration"]}s'
+                )
+                run = run_wsgi if server == 'wsgi' else run_asgi
+                results[server] = run(
+                    traffic, options['concurrency'], options['duration']
+                )
+                self._report(results[server])
+
+        if options['output']:
+            save_results(
+                options['output'], 'loadtest', results,
+                mix=mix, **{
+                    key: options[key] for key in (
+                        'concurrency', 'duration', 'users', 'recipes',
+                        'seed',
+                    )
+                }
+            )
+        if options['compare']:
+            for line in compare_results(
+                options['compare'], results, ('rps', 'p95_ms')
+            ):
+                self.stdout.write(line)
+
+    def _parse_mix(self, value):
+        if not value:
+            return dict(DEFAULT_MIX)
+        mix = {}
+        for item in value.split(','):
+            name, _, weight = item.partition('=')
+            if name.strip() not in DEFAULT_MIX:
+                raise CommandError(f'unknown endpoint {name}')
+            mix[name.strip()] = float(weight or 1)
+        return mix
+
+    def _seed(self, options):
+        """generate users and return what clients need to call the api"""
+        first_user = User.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        call_command(
+            'generate_data',
+            users=options['users'],
+            recipes=options['recipes'],
+            seed=options['seed'],
+            password=PASSWORD,
+            distribution='uniform',
+            stdout=self.stdout,
+        )
+        accounts = []
+        users = User.objects.filter(id__gt=first_user).prefetch_related(
+            'recipe_set', 'tag_set', 'ingredient_set'
+        )
+        for user in users:
+            recipes = [recipe.id for recipe in user.recipe_set.all()]
+            if not recipes:
+                continue
+            accounts.append({
+                'email': user.email,
+                'token': Token.objects.get_or_create(user=user)[0].key,
+                'recipes': recipes,
+                'tags': [tag.id for tag in user.tag_set.all()],
+                'ingredients': [i.id for i in user.ingredient_set.all()],
+            })
+        if not accounts:
+            raise CommandError('no seeded user has recipes')
+        return accounts
+
+    def _report(self, results):
+        self.stdout.write(
+            f'{"endpoint":<16}{"requests":>9}{"errors":>8}{"rps":>9}'
+            f'{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+        )
+        for endpoint, stats in results.items():
+            self.stdout.write(
+                f'{endpoint:<16}{stats["count"]:>9}{stats["errors"]:>8}'
+                f'{stats["rps"]:>9}{stats["p50_ms"]:>10}'
+                f'{stats["p95_ms"]:>10}{stats["p99_ms"]:>10}'
+            )
@@ -0,0 +1,106 @@
+import json
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from core.models import User
+from benchmarks.management.commands.loadtest import Request, call_wsgi
+from benchmarks.utils import (
+    benchmark_databases, compare_results, save_results, summarize
+)
+
+PASSWORD = 'login-bench-123'
+
+
+class Command(BaseCommand):
+    """Django command to benchmark token requests on a single core"""
+    help = (
+        'Time sequential POST /api/users/token/ requests for several '
+        'PBKDF2 iteration counts, hashing every login and with the login '
+        'cache, and report logins per second of one core.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument(
+            '--iterations', default='260000,100000',
+            help='comma separated PBKDF2 iteration counts'
+        )
+        parser.add_argument('--output', help='save results as json')
+        parser.add_argument('--compare', help='previous json results')
+        parser.add_argument(
+            '--use-configured-db', action='store_true',
+            help='create the user in the configured database'
+        )
+
+    def handle(self, *args, **options):
+        from app.wsgi import application
+
+        iterations = [int(i) for i in options['iterations'].split(',')]
+        results = {}
+        self.stdout.write(
+            f'{"iterations":>10}{"mode":>8}{"logins/s":>10}'
+            f'{"cpu ms":>9}{"p50 ms":>9}{"p99 ms":>9}'
+        )
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['localhost'],
+                               QUERY_BUDGET_ENABLED=False,
+                               THROTTLE_ENABLED=False), \
+                benchmark_databases(not options['use_configured_db']):
+            for count in iterations:
+                results[str(count)] = {}
+                for mode, cache_seconds in (('hashed', 0), ('cached', 300)):
+                    with override_settings(
+                            PASSWORD_HASH_ITERATIONS=count,
+                            LOGIN_CACHE_SECONDS=cache_seconds):
+                        stats = self._run(application, options['requests'])
+                    results[str(count)][mode] = stats
+                    self.stdout.write(
+                        f'{count:>10}{mode:>8}{stats["rps"]:>10}'
+                        f'{stats["cpu_ms"]:>9}{stats["p50_ms"]:>9}'
+                        f'{stats["p99_ms"]:>9}'
+                    )
+
+        if options['output']:
+            save_results(
+                options['output'], 'loginbench', results,
+                iterations=iterations, requests=options['requests']
+            )
+        if options['compare']:
+            for line in compare_results(
+                options['compare'], results, ('rps', 'cpu_ms')
+            ):
+                self.stdout.write(line)
+
+    def _run(self, application, requests):
+        """time logins of a user hashed with the current settings"""
+        cache.clear()
+        User.objects.filter(email='loginbench@example.com').delete()
+        User.objects.create_user('loginbench@example.com', PASSWORD)
+        body = json.dumps(
+            {'email': 'loginbench@example.com', 'password': PASSWORD}
+        ).encode()
+        request = Request(
+            'token', 'POST', '/api/users/token/',
+            body=body, content_type='application/json'
+        )
+        # first login creates the token and fills the cache
+        call_wsgi(application, request)
+
+        durations = []
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        for _ in range(requests):
+            begin = time.perf_counter()
+            status = call_wsgi(application, request)
+            durations.append(time.perf_counter() - begin)
+            if status != 200:
+                raise CommandError(f'token request failed with {status}')
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        return dict(
+            summarize(durations),
+            rps=round(requests / elapsed, 2),
+            cpu_ms=round(cpu / requests * 1000, 3),
+        )
@@ -0,0 +1,201 @@
+import json
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.models import User, Tag, Ingredient, Recipe
+from recipes import serializers
+from recipes.views import RecipeViewSet
+from users.serializers import UserSerializer
+from benchmarks.utils import compare_results, save_results
+
+TAGS_PER_RECIPE = 3
+INGREDIENTS_PER_RECIPE = 5
+
+
+def _prefetch(instance, name, objects):
+    """fill the prefetch cache of a m2m so serializing it runs no query"""
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    instance._prefetched_objects_cache[name] = queryset
+
+
+def build_recipes(count):
+    """return unsaved recipes with their tags and ingredients prefetched"""
+    user = User(id=1, email='bench@example.com', name='Bench')
+    tags = [
+        Tag(id=i, user=user, name=f'tag {i}')
+        for i in range(1, TAGS_PER_RECIPE + 1)
+    ]
+    ingredients = [
+        Ingredient(id=i, user=user, name=f'ingredient {i}')
+        for i in range(1, INGREDIENTS_PER_RECIPE + 1)
+    ]
+    recipes = []
+    for i in range(1, count + 1):
+        recipe = Recipe(
+            id=i, user=user, title=f'recipe {i}', time_minute=30,
+            price=Decimal('12.50'), link='https://example.com/recipe'
+        )
+        recipe._prefetched_objects_cache = {}
+        _prefetch(recipe, 'tags', tags)
+        _prefetch(recipe, 'ingredients', ingredients)
+        recipes.append(recipe)
+    return recipes
+
+
+def build_tags(count):
+    user = User(id=1, email='bench@example.com', name='Bench')
+    return [Tag(id=i, user=user, name=f'tag {i}') for i in range(count)]
+
+
+def build_users(count):
+    return [
+        User(id=i, email=f'user{i}@example.com', name=f'User {i}')
+        for i in range(count)
+    ]
+
+
+def build_recipe_view(count):
+    """return a viewset ready to build a queryset filtering on count ids"""
+    ids = ','.join(str(i) for i in range(1, count + 1))
+    request = Request(APIRequestFactory().get(
+        '/api/recipes/recipes/', {'tags': ids, 'ingredients': ids}
+    ))
+    request.user = User(id=1, email='bench@example.com')
+    return RecipeViewSet(request=request, action='list', kwargs={},
+                         format_kwarg=None)
+
+
+# name -> (build fixtures of a size, code being measured)
+CASES = {
+    'RecipeSerializer': (
+        build_recipes,
+        lambda objs: serializers.RecipeSerializer(objs, many=True).data,
+    ),
+    'RecipeDetailSerializer': (
+        build_recipes,
+        lambda objs: serializers.RecipeDetailSerializer(
+            objs, many=True
+        ).data,
+    ),
+    'TagSerializer': (
+        build_tags,
+        lambda objs: serializers.TagSerializer(objs, many=True).data,
+    ),
+    'UserSerializer': (
+        build_users,
+        lambda objs: UserSerializer(objs, many=True).data,
+    ),
+    'RecipeViewSet.get_queryset': (
+        build_recipe_view,
+        lambda view: str(view.get_queryset().query),
+    ),
+}
+
+
+def measure(func, fixture, repeat):
+    """return timings and allocations of running func on fixture"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(fixture)
+        durations.append(time.perf_counter() - start)
+
+    # separate run, tracing allocations slows the code down
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    result = func(fixture)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {
+        'best_ms': round(min(durations) * 1000, 3),
+        'median_ms': round(statistics.median(durations) * 1000, 3),
+        'peak_kib': round((peak - baseline) / 1024, 1),
+        'retained_kib': round((current - baseline) / 1024, 1),
+    }
+
+
+class Command(BaseCommand):
+    """Django command to microbenchmark serializers and querysets"""
+    help = (
+        'Time serializers and RecipeViewSet.get_queryset on in-memory '
+        'fixtures of growing size and track their allocations.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,10,100,1000,10000')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--cases', default=','.join(CASES),
+            help='comma separated cases to run'
+        )
+        parser.add_argument('--output', help='save results as json')
+        parser.add_argument('--compare', help='previous json results')
+        parser.add_argument(
+            '--max-regression', type=float,
+            help='fail if a case got slower than this percentage '
+                 'compared with --compare'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        names = [name.strip() for name in options['cases'].split(',')]
+        unknown = set(names) - set(CASES)
+        if unknown:
+            raise CommandError(f'unknown cases: {", ".join(unknown)}')
+
+        results = {}
+        self.stdout.write(
+            f'{"case":<28}{"size":>7}{"best ms":>11}{"median ms":>11}'
+            f'{"us/item":>10}{"peak KiB":>11}'
+        )
+        for name in names:
+            build, func = CASES[name]
+            results[name] = {}
+            for size in sizes:
+                stats = measure(func, build(size), options['repeat'])
+                results[name][str(size)] = stats
+                self.stdout.write(
+                    f'{name:<28}{size:>7}{stats["best_ms"]:>11}'
+                    f'{stats["median_ms"]:>11}'
+                    f'{stats["best_ms"] * 1000 / size:>10.1f}'
+                    f'{stats["peak_kib"]:>11}'
+                )
+
+        if options['output']:
+            save_results(
+                options['output'], 'microbench', results,
+                sizes=sizes, repeat=options['repeat']
+            )
+        if options['compare']:
+            for line in compare_results(
+                options['compare'], results, ('best_ms', 'peak_kib')
+            ):
+                self.stdout.write(line)
+            if options['max_regression'] is not None:
+                self._check_regressions(
+                    options['compare'], results, options['max_regression']
+                )
+
+    def _check_regressions(self, path, results, max_regression):
+        with open(path) as f:
+            previous = json.load(f)['results']
+        slower = []
+        for name, by_size in results.items():
+            for size, stats in by_size.items():
+                old = previous.get(name, {}).get(size)
+                if not old or not old['best_ms']:
+                    continue
+                change = (stats['best_ms'] / old['best_ms'] - 1) * 100
+                if change > max_regression:
+                    slower.append(f'{name}[{size}] {change:+.1f}%')
+        if slower:
+            raise CommandError(f'regressions: {", ".join(slower)}')
@@ -0,0 +1,143 @@
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.authtoken.models import Token
+
+from core.models import User, Tag
+from benchmarks.management.commands.loadtest import Request, call_wsgi
+from benchmarks.utils import (
+    benchmark_databases, compare_results, save_results, summarize
+)
+
+DISPATCHER = 'core.middleware.PathDispatchMiddleware'
+
+
+def stacks():
+    """return the full and the lean middleware lists"""
+    base = [
+        path for path in settings.MIDDLEWARE
+        if path != DISPATCHER and path not in settings.BROWSER_MIDDLEWARE
+    ]
+    return {
+        'full': base + list(settings.BROWSER_MIDDLEWARE),
+        'lean': base + [DISPATCHER],
+    }
+
+
+def build_handler(middleware):
+    with override_settings(MIDDLEWARE=middleware):
+        return WSGIHandler()
+
+
+class Command(BaseCommand):
+    """Django command to measure the cost of the middleware stack"""
+    help = (
+        'Time api requests through the full middleware stack and through '
+        'the lean one skipping browser middleware, and report the time '
+        'saved per request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument(
+            '--rounds', type=int, default=5,
+            help='alternate the stacks this many times to spread noise'
+        )
+        parser.add_argument('--output', help='save results as json')
+        parser.add_argument('--compare', help='previous json results')
+        parser.add_argument(
+            '--use-configured-db', action='store_true',
+            help='create the user in the configured database'
+        )
+
+    def handle(self, *args, **options):
+        durations = {}
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['localhost'],
+                               QUERY_BUDGET_ENABLED=False,
+                               THROTTLE_ENABLED=False), \
+                benchmark_databases(not options['use_configured_db']):
+            requests = self._seed()
+            handlers = {
+                name: build_handler(middleware)
+                for name, middleware in stacks().items()
+            }
+            for _ in range(options['rounds']):
+                for stack, handler in handlers.items():
+                    for request in requests:
+                        durations.setdefault(stack, {}).setdefault(
+                            request.endpoint, []
+                        ).extend(
+                            self._time(handler, request, options['requests'])
+                        )
+
+        results = {
+            stack: {
+                endpoint: summarize(values)
+                for endpoint, values in by_endpoint.items()
+            }
+            for stack, by_endpoint in durations.items()
+        }
+        results['saved'] = {
+            endpoint: {
+                'mean_ms': round(
+                    results['full'][endpoint]['mean_ms']
+                    - results['lean'][endpoint]['mean_ms'], 3
+                ),
+                'p50_ms': round(
+                    results['full'][endpoint]['p50_ms']
+                    - results['lean'][endpoint]['p50_ms'], 3
+                ),
+            }
+            for endpoint in results['full']
+        }
+        self._report(results)
+
+        if options['output']:
+            save_results(
+                options['output'], 'middlewarebench', results,
+                requests=options['requests'], rounds=options['rounds']
+            )
+        if options['compare']:
+            for line in compare_results(
+                options['compare'], results, ('mean_ms', 'p50_ms')
+            ):
+                self.stdout.write(line)
+
+    def _seed(self):
+        user = User.objects.create_user(
+            'middlewarebench@example.com', 'bench123456'
+        )
+        Tag.objects.bulk_create(
+            Tag(user=user, name=f'tag {i}') for i in range(5)
+        )
+        token = Token.objects.create(user=user).key
+        return [
+            Request('tag_list', 'GET', '/api/recipes/tags/', token=token),
+            Request('user', 'GET', '/api/users/user/', token=token),
+        ]
+
+    def _time(self, handler, request, count):
+        durations = []
+        for _ in range(count):
+            start = time.perf_counter()
+            status = call_wsgi(handler, request)
+            durations.append(time.perf_counter() - start)
+            if status != 200:
+                raise CommandError(
+                    f'{request.endpoint} failed with {status}'
+                )
+        return durations
+
+    def _report(self, results):
+        self.stdout.write(
+            f'{"endpoint":<12}{"full ms":>10}{"lean ms":>10}{"saved us":>10}'
+        )
+        for endpoint, saved in results['saved'].items():
+            self.stdout.write(
+                f'{endpoint:<12}{results["full"][endpoint]["mean_ms"]:>10}'
+                f'{results["lean"][endpoint]["mean_ms"]:>10}'
+                f'{saved["mean_ms"] * 1000:>10.1f}'
+            )
@@ -0,0 +1,234 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.utils import compare_results, save_results
+
+PROJECT_PACKAGES = ('app', 'core', 'users', 'recipes', 'benchmarks')
+THIRD_PARTY_PACKAGES = ('django', 'rest_framework', 'PIL', 'psycopg2')
+
+# modules whose presence after the first response shows what was loaded
+MARKERS = {
+    'admin': 'django.contrib.auth.admin',
+    'pillow': 'PIL.Image',
+}
+
+# run in a fresh interpreter under -X importtime, prints the timings of
+# each startup phase as json on its last line
+CHILD = '''
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import django
+from django.conf import settings
+
+settings.INSTALLED_APPS
+marks = {'settings': time.perf_counter()}
+django.setup(set_prefix=False)
+marks['setup'] = time.perf_counter()
+from django.core.handlers.wsgi import WSGIHandler
+from wsgiref import util
+
+application = WSGIHandler()
+marks['handler'] = time.perf_counter()
+hosts = [
+    host for host in settings.ALLOWED_HOSTS
+    if '*' not in host and not host.startswith('.')
+]
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1],
+    'HTTP_HOST': hosts[0] if hosts else 'localhost',
+}
+util.setup_testing_defaults(environ)
+statuses = []
+body = application(environ, lambda status, *args: statuses.append(status))
+b''.join(body)
+body.close()
+marks['first_response'] = time.perf_counter()
+print(json.dumps({
+    'marks': {name: value - start for name, value in marks.items()},
+    'status': int(statuses[0].split()[0]),
+    'modules': len(sys.modules),
+    'loaded': {
+        name: module in sys.modules
+        for name, module in json.loads(sys.argv[2]).items()
+    },
+}))
+'''
+
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def module_group(module):
+    """return the package an import is accounted to"""
+    if module == 'app.settings':
+        return module
+    top = module.split('.')[0]
+    if top in PROJECT_PACKAGES or top in THIRD_PARTY_PACKAGES:
+        return top
+    return 'other'
+
+
+def parse_import_times(lines):
+    """return the self time (ms) of every module in -X importtime output"""
+    times = {}
+    for line in lines:
+        match = IMPORT_TIME.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(1)) / 1000
+    return times
+
+
+class Command(BaseCommand):
+    """Django command to measure the cold start of a worker"""
+    help = (
+        'Start fresh interpreters that import the project and serve one '
+        'request, with the admin loaded eagerly and lazily, and report '
+        'the time of each phase and the import time of every package.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument(
+            '--path', default='/api/recipes/tags/',
+            help='path of the first request'
+        )
+        parser.add_argument(
+            '--modes', default='eager,lazy',
+            help='comma separated admin loading modes to measure'
+        )
+        parser.add_argument(
+            '--top', type=int, default=10,
+            help='list this many modules with the longest imports'
+        )
+        parser.add_argument('--output', help='save results as json')
+        parser.add_argument('--compare', help='previous json results')
+
+    def handle(self, *args, **options):
+        modes = options['modes'].split(',')
+        unknown = set(modes) - {'eager', 'lazy'}
+        if unknown:
+            raise CommandError(f'unknown modes: {", ".join(sorted(unknown))}')
+
+        results = {
+            mode: self._measure(mode, options)
+            for mode in modes
+        }
+        self._report(results, options['top'])
+
+        if options['output']:
+            save_results(
+                options['output'], 'startupbench', results,
+                runs=options['runs'], first_path=options['path']
+            )
+        if options['compare']:
+            for line in compare_results(
+                options['compare'], results, ('total_ms',)
+            ):
+                self.stdout.write(line)
+
+    def _run(self, mode, path):
+        env = dict(os.environ, LAZY_ADMIN=str(int(mode == 'lazy')))
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD,
+             path, json.dumps(MARKERS)],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if process.returncode:
+            raise CommandError(process.stderr.strip().splitlines()[-1])
+        run = json.loads(process.stdout.strip().splitlines()[-1])
+        run['imports'] = parse_import_times(process.stderr.splitlines())
+        return run
+
+    def _measure(self, mode, options):
+        runs = [
+            self._run(mode, options['path']) for _ in range(options['runs'])
+        ]
+
+        def median_ms(values):
+            return round(statistics.median(values) * 1000, 3)
+
+        phases, previous = {}, None
+        for mark in ('settings', 'setup', 'handler', 'first_response'):
+            phases[f'{mark}_ms'] = median_ms([
+                run['marks'][mark] - (run['marks'][previous] if previous
+                                      else 0)
+                for run in runs
+            ])
+            previous = mark
+        phases['total_ms'] = median_ms(
+            [run['marks']['first_response'] for run in runs]
+        )
+
+        groups = {}
+        for run in runs:
+            totals = {}
+            for module, ms in run['imports'].items():
+                group = module_group(module)
+                totals[group] = totals.get(group, 0) + ms
+            for group, ms in totals.items():
+                groups.setdefault(group, []).append(ms)
+        modules = {}
+        for run in runs:
+            for module, ms in run['imports'].items():
+                modules.setdefault(module, []).append(ms)
+
+        return {
+            'phases': phases,
+            'imports': {
+                group: {'self_ms': round(statistics.median(values), 3)}
+                for group, values in groups.items()
+            },
+            'slowest': sorted(
+                (
+                    (module, round(statistics.median(values), 3))
+                    for module, values in modules.items()
+                ),
+                key=lambda item: -item[1]
+            )[:options['top']],
+            'status': runs[-1]['status'],
+            'modules': runs[-1]['modules'],
+            'loaded': runs[-1]['loaded'],
+        }
+
+    def _report(self, results, top):
+        modes = list(results)
+        header = ''.join(f'{mode:>10}' for mode in modes)
+        self.stdout.write(f'{"phase ms":<20}{header}')
+        for phase in next(iter(results.values()))['phases']:
+            self.stdout.write(f'{phase[:-3]:<20}' + ''.join(
+                f'{results[mode]["phases"][phase]:>10.1f}' for mode in modes
+            ))
+        self.stdout.write(f'\n{"imports ms":<20}{header}')
+        groups = sorted(
+            {group for mode in modes for group in results[mode]['imports']},
+            key=lambda group: -max(
+                results[mode]['imports'].get(group, {}).get('self_ms', 0)
+                for mode in modes
+            )
+        )
+        for group in groups:
+            self.stdout.write(f'{group:<20}' + ''.join(
+                f'{imports.get(group, {}).get("self_ms", 0):>10.1f}'
+                for imports in (results[mode]['imports'] for mode in modes)
+            ))
+        self.stdout.write(f'\n{"":<20}{header}')
+        self.stdout.write(f'{"modules":<20}' + ''.join(
+            f'{results[mode]["modules"]:>10}' for mode in modes
+        ))
+        for name in MARKERS:
+            self.stdout.write(f'{name + " loaded":<20}' + ''.join(
+                f'{str(results[mode]["loaded"][name]):>10}' for mode in modes
+            ))
+        for mode in modes:
+            self.stdout.write(f'\nslowest imports ({mode})')
+            for module, ms in results[mode]['slowest'][:top]:
+                self.stdout.write(f'{ms:>10.1f}  {module}')
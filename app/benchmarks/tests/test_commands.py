@@ -0,0 +1,160 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase
+
+from core.testing import single_database
+
+
+class LoadTestCommandTest(TransactionTestCase):
+    databases = '__all__'
+
+    def test_loadtest_saves_results(self):
+        """test the load test reports every endpoint of the mix"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'loadtest',
+                duration=0.5,
+                concurrency=1,
+                users=1,
+                recipes=3,
+                mix='recipe_list=1,recipe_detail=1,tag_list=1',
+                output=output,
+                use_configured_db=True,
+                stdout=StringIO()
+            )
+            with open(output) as f:
+                results = json.load(f)['results']
+
+        for server in ('wsgi', 'asgi'):
+            self.assertEqual(results[server]['total']['errors'], 0)
+            self.assertGreater(results[server]['total']['count'], 0)
+            self.assertIn('p99_ms', results[server]['recipe_list'])
+
+
+@single_database
+class MicrobenchCommandTest(TestCase):
+
+    def test_microbench_results(self):
+        """test every case is measured for every size"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'microbench', sizes='1,5', repeat=1, output=output,
+                stdout=StringIO()
+            )
+            with open(output) as f:
+                results = json.load(f)['results']
+
+        self.assertEqual(
+            set(results['RecipeDetailSerializer']), {'1', '5'}
+        )
+        self.assertIn('peak_kib', results['TagSerializer']['5'])
+
+    def test_microbench_runs_no_queries(self):
+        """test serializers are measured without hitting the database"""
+        with self.assertNumQueries(0):
+            call_command('microbench', sizes='3', repeat=1,
+                         stdout=StringIO())
+
+    def test_regression_detected(self):
+        """test slower results than a previous run fail the command"""
+        with tempfile.TemporaryDirectory() as directory:
+            previous = os.path.join(directory, 'previous.json')
+            call_command(
+                'microbench', sizes='10', repeat=1, cases='TagSerializer',
+                output=previous, stdout=StringIO()
+            )
+            with open(previous) as f:
+                document = json.load(f)
+            document['results']['TagSerializer']['10']['best_ms'] = 1e-6
+            with open(previous, 'w') as f:
+                json.dump(document, f)
+
+            with self.assertRaises(CommandError):
+                call_command(
+                    'microbench', sizes='10', repeat=1,
+                    cases='TagSerializer', compare=previous,
+                    max_regression=10, stdout=StringIO()
+                )
+
+
+class LoginBenchCommandTest(TransactionTestCase):
+
+    def test_loginbench_results(self):
+        """test both modes are measured for every iteration count"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'loginbench', requests=2, iterations='1000,2000',
+                output=output, use_configured_db=True, stdout=StringIO()
+            )
+            with open(output) as f:
+                results = json.load(f)['results']
+
+        self.assertEqual(set(results), {'1000', '2000'})
+        self.assertEqual(set(results['1000']), {'hashed', 'cached'})
+        self.assertIn('rps', results['2000']['cached'])
+
+
+class MiddlewareBenchCommandTest(TransactionTestCase):
+    databases = '__all__'
+
+    def test_middlewarebench_results(self):
+        """test both stacks are measured and compared"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'middlewarebench', requests=2, rounds=1, output=output,
+                use_configured_db=True, stdout=StringIO()
+            )
+            with open(output) as f:
+                results = json.load(f)['results']
+
+        self.assertEqual(set(results), {'full', 'lean', 'saved'})
+        self.assertIn('mean_ms', results['saved']['tag_list'])
+
+
+class StartupBenchCommandTest(TestCase):
+
+    def test_startupbench_results(self):
+        """test both modes are measured and only eager loads the admin"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'startupbench', runs=1, output=output, stdout=StringIO()
+            )
+            with open(output) as f:
+                results = json.load(f)['results']
+
+        self.assertEqual(set(results), {'eager', 'lazy'})
+        self.assertIn('total_ms', results['lazy']['phases'])
+        self.assertIn('recipes', results['lazy']['imports'])
+        self.assertTrue(results['eager']['loaded']['admin'])
+        self.assertFalse(results['lazy']['loaded']['admin'])
+        self.assertEqual(results['lazy']['status'], 401)
+
+
+class AsyncBenchCommandTest(TransactionTestCase):
+    databases = '__all__'
+
+    def test_asyncbench_results(self):
+        """test every server is measured for every number of clients"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'asyncbench', clients='1,3', requests=1, client_delay=1,
+                threads=2, output=output, use_configured_db=True,
+                stdout=StringIO()
+            )
+            with open(output) as f:
+                results = json.load(f)['results']
+
+        self.assertEqual(set(results), {'wsgi', 'asgi', 'async_reads'})
+        self.assertEqual(set(results['async_reads']), {'1', '3'})
+        self.assertIn('peak_threads', results['wsgi']['3'])
@@ -0,0 +1,104 @@
+import json
+import os
+import platform
+import subprocess
+import time
+from contextlib import contextmanager
+
+import django
+from django.conf import settings
+from django.test.utils import setup_databases, teardown_databases
+
+
+def percentile(values, pct):
+    """return the pct percentile of sorted values (linear interpolation)"""
+    if not values:
+        return 0.0
+    rank = (len(values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(durations):
+    """return count and latency percentiles (ms) of durations in seconds"""
+    values = sorted(d * 1000 for d in durations)
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values), 3) if values else 0.0,
+        'p50_ms': round(percentile(values, 50), 3),
+        'p95_ms': round(percentile(values, 95), 3),
+        'p99_ms': round(percentile(values, 99), 3),
+        'max_ms': round(values[-1], 3) if values else 0.0,
+    }
+
+
+def git_revision():
+    """return the current commit, if running from a git checkout"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(path, benchmark, results, **params):
+    """write results as json so runs of different commits can be compared"""
+    document = {
+        'benchmark': benchmark,
+        'revision': git_revision(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'cpu_count': os.cpu_count(),
+        'params': params,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+
+
+def compare_results(previous_path, results, metrics):
+    """yield lines comparing results with a previously saved run
+
+    results are nested dicts whose leaves hold the given metrics
+    """
+    with open(previous_path) as f:
+        previous = json.load(f)
+    yield f'compared with {previous.get("revision") or previous_path}'
+
+    def walk(old, new, prefix):
+        for key, value in sorted(new.items()):
+            if key not in old:
+                continue
+            if any(metric in value for metric in metrics):
+                for metric in metrics:
+                    if metric not in value or not old[key].get(metric):
+                        continue
+                    change = (value[metric] / old[key][metric] - 1) * 100
+                    yield (
+                        f'{prefix}{key} {metric}: {old[key][metric]} -> '
+                        f'{value[metric]} ({change:+.1f}%)'
+                    )
+            elif isinstance(value, dict):
+                yield from walk(old[key], value, f'{prefix}{key} ')
+
+    yield from walk(previous['results'], results, '')
+
+
+@contextmanager
+def benchmark_databases(use_test_database=True):
+    """run on throwaway test databases like the test runner does"""
+    if not use_test_database:
+        yield
+        return
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
@@ -2,11 +2,13 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from . import models
 from django.utils.translation import gettext as _
+from .deletion import schedule_user_deletion
 
 
 class UserAdmin(BaseUserAdmin):
     ordering = ['id']
     list_display = ['email', 'name']
+    actions = ['schedule_deletion']
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         (_('Personal Info'), {'fields': ('name',)}),
@@ -25,8 +27,30 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+    @admin.action(description=_('Delete in the background'))
+    def schedule_deletion(self, request, queryset):
+        for user in queryset:
+            schedule_user_deletion(user)
+
+
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['view', 'duration_ms', 'path', 'created_at']
+    list_filter = ['view']
+    search_fields = ['sql']
+    readonly_fields = [
+        'created_at', 'duration_ms', 'view', 'path', 'sql', 'plan', 'stack'
+    ]
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at', 'finished_at', 'worker', 'error']
+
 
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Tag)
 admin.site.register(models.Ingredient)
 admin.site.register(models.Recipe)
+admin.site.register(models.SlowQuery, SlowQueryAdmin)
+admin.site.register(models.Job, JobAdmin)
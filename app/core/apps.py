@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import sharding
+        from .models import ShardAssignment
+
+        post_save.connect(sharding.assignment_changed, sender=ShardAssignment)
+        post_delete.connect(
+            sharding.assignment_changed, sender=ShardAssignment
+        )
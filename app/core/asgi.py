@@ -0,0 +1,128 @@
+"""
+ASGI handler serving the api reads on a bounded thread pool.
+
+Django 3.2 runs everything synchronous under ASGI (middleware, views,
+the request signals) with thread_sensitive=True, which outside of an
+async_to_sync call means one thread shared by every request. DRF views
+and the ORM are synchronous, so instead of awaiting them there, GET and
+HEAD requests to views with `async_reads` go through the synchronous
+middleware chain on a pool of ASYNC_READ_THREADS threads while reading
+the request and sending the response stay on the event loop. Slow
+clients hold a coroutine, not a thread, and a worker never opens more
+than ASYNC_READ_THREADS database connections for them.
+
+Everything else is handled by django's ASGIHandler, but for the change
+event streams (core.events).
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.core import signals
+from django.core.exceptions import RequestAborted
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.base import BaseHandler
+from django.urls import Resolver404, get_resolver, set_script_prefix
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class AsyncReadHandler(ASGIHandler):
+    """ASGIHandler running reads of `async_reads` views on a thread pool"""
+
+    def __init__(self, threads=None):
+        super().__init__()
+        self.sync_handler = BaseHandler()
+        self.sync_handler.load_middleware()
+        self.executor = ThreadPoolExecutor(
+            threads or settings.ASYNC_READ_THREADS,
+            thread_name_prefix='async-read'
+        )
+
+    def is_async_read(self, scope):
+        if scope['type'] != 'http' or scope['method'] not in SAFE_METHODS:
+            return False
+        path = scope['path']
+        root_path = scope.get('root_path', '')
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        try:
+            match = get_resolver().resolve(path)
+        except Resolver404:
+            return False
+        return getattr(getattr(match.func, 'cls', None), 'async_reads', False)
+
+    async def __call__(self, scope, receive, send):
+        if not self.is_async_read(scope):
+            return await super().__call__(scope, receive, send)
+        try:
+            body_file = await self.read_body(receive)
+        except RequestAborted:
+            return
+        # the context carries contextvars (shard, replica) to the thread
+        context = contextvars.copy_context()
+        response = await asyncio.get_running_loop().run_in_executor(
+            self.executor, context.run, self.get_response_sync,
+            scope, body_file
+        )
+        await self.send_rendered(response, send)
+
+    def get_response_sync(self, scope, body_file):
+        """handle a request like WSGIHandler does, in a pool thread"""
+        set_script_prefix(self.get_script_prefix(scope))
+        signals.request_started.send(sender=self.__class__, scope=scope)
+        request, response = self.create_request(scope, body_file)
+        if request is not None:
+            response = self.sync_handler.get_response(request)
+        response.content
+        # sends request_finished, which recycles this thread's connections
+        response.close()
+        return response
+
+    async def send_rendered(self, response, send):
+        headers = [
+            (name.encode('ascii'), value.encode('latin1'))
+            for name, value in response.items()
+        ]
+        for cookie in response.cookies.values():
+            headers.append(
+                (b'Set-Cookie', cookie.output(header='').encode('ascii')
+                 .strip())
+            )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        await send({'type': 'http.response.body', 'body': response.content})
+
+
+class EventStreamRouter:
+    """send requests for EVENTS_PATH to the event stream"""
+
+    def __init__(self, application):
+        # needs the apps loaded, unlike this module
+        from .events import EventStream
+
+        self.application = application
+        self.event_stream = EventStream()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and \
+                scope['path'] == settings.EVENTS_PATH:
+            return await self.event_stream(scope, receive, send)
+        return await self.application(scope, receive, send)
+
+
+def get_asgi_application():
+    """return the project's asgi application"""
+    django.setup(set_prefix=False)
+    if settings.ASYNC_READS:
+        application = AsyncReadHandler()
+    else:
+        application = ASGIHandler()
+    if settings.EVENTS_ENABLED:
+        application = EventStreamRouter(application)
+    return application
@@ -0,0 +1,107 @@
+"""
+PostgreSQL backend that keeps connections open in a per process pool.
+
+Configured through DATABASES[alias]['OPTIONS']['POOL'], see
+core.db.pool.ConnectionPool for the available keys. Closing the Django
+connection (at the end of every request with CONN_MAX_AGE = 0) returns
+it to the pool instead of disconnecting. Pools are keyed by host, port,
+database name and user, so switching to the test database never hands
+out a session of the real one.
+"""
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from core.db.pool import ConnectionPool
+
+from .creation import DatabaseCreation
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _ping(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    if connection.get_transaction_status() != \
+            extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    return True
+
+
+def _reset(connection):
+    """roll back leftovers so the next user gets a clean session"""
+    if connection.closed:
+        return False
+    status = connection.get_transaction_status()
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            connection.rollback()
+        except Exception:
+            return False
+    return True
+
+
+def get_pool(key, options=None):
+    """return the pool of a (host, port, name, user) key, creating it on
+    first use"""
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(
+                ping=_ping, reset=_reset, **(options or {})
+            )
+        return _pools[key]
+
+
+def close_pools():
+    """close every idle pooled connection of this process"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+    # pool the current connection was taken from, NAME changes between
+    # the real and the test database while it is open
+    _pool = None
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('POOL', None)
+        return conn_params
+
+    @property
+    def pool_key(self):
+        return tuple(
+            self.settings_dict.get(key) or None
+            for key in ('HOST', 'PORT', 'NAME', 'USER')
+        )
+
+    @property
+    def pool(self):
+        return get_pool(
+            self.pool_key, self.settings_dict['OPTIONS'].get('POOL')
+        )
+
+    def get_new_connection(self, conn_params):
+        self._pool = self.pool
+        connection = self._pool.acquire(
+            lambda: super(DatabaseWrapper, self).get_new_connection(
+                conn_params
+            )
+        )
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            pool, self._pool = self._pool or self.pool, None
+            with self.wrap_database_errors:
+                pool.release(self.connection, discard=self.errors_occurred)
@@ -0,0 +1,20 @@
+from django.db.backends.postgresql import creation
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """close idle pooled sessions around creating and dropping the test
+    database, PostgreSQL refuses to drop or copy a database in use"""
+
+    def create_test_db(self, *args, **kwargs):
+        from .base import close_pools
+        close_pools()
+        try:
+            return super().create_test_db(*args, **kwargs)
+        finally:
+            close_pools()
+
+    def destroy_test_db(self, *args, **kwargs):
+        from .base import close_pools
+        self.connection.close()
+        close_pools()
+        return super().destroy_test_db(*args, **kwargs)
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """no connection became available within the pool timeout"""
+
+
+class ConnectionPool:
+    """bounded per process pool of dbapi connections
+
+    idle connections are reused newest first, checked with `ping` when
+    they sat idle longer than `ping_interval` and closed once older than
+    `max_lifetime` seconds
+    """
+
+    def __init__(self, ping=None, reset=None, max_size=10,
+                 max_lifetime=1800, pre_ping=True, ping_interval=5,
+                 timeout=10):
+        self.ping = ping
+        self.reset = reset
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._start()
+
+    def _start(self):
+        self._pid = os.getpid()
+        # (connection, opened at, returned at)
+        self._idle = deque()
+        # id(connection) -> opened at
+        self._in_use = {}
+        self._size = 0
+
+    def _check_pid(self):
+        """forget connections inherited from the parent after a fork"""
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid != os.getpid():
+                # keep them referenced, closing or collecting them would
+                # terminate the sessions the parent process still uses
+                self._inherited = (list(self._idle), self._in_use)
+                self._start()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'max_size': self.max_size,
+            }
+
+    def acquire(self, connect):
+        """return a healthy connection, opening one with connect() if needed"""
+        self._check_pid()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            idle = self._checkout(deadline)
+            if idle is None:
+                return self._open(connect)
+            connection, opened, returned = idle
+            stale = time.monotonic() - returned > self.ping_interval
+            if self.pre_ping and stale and not self._alive(connection):
+                self._discard(connection)
+                continue
+            with self._cond:
+                self._in_use[id(connection)] = opened
+            return connection
+
+    def _checkout(self, deadline):
+        """pop a fresh idle connection or reserve a slot for a new one"""
+        with self._cond:
+            while True:
+                while self._idle:
+                    connection, opened, returned = self._idle.pop()
+                    if not self._expired(opened):
+                        return connection, opened, returned
+                    self._size -= 1
+                    self._close(connection)
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f'no connection available within {self.timeout}s '
+                        f'({self.max_size} in use)'
+                    )
+                self._cond.wait(remaining)
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._in_use[id(connection)] = time.monotonic()
+        return connection
+
+    def release(self, connection, discard=False):
+        """give a connection back, closing it if broken or too old"""
+        self._check_pid()
+        with self._cond:
+            opened = self._in_use.pop(id(connection), None)
+        if opened is None:
+            # opened before a fork or by another pool
+            self._close(connection)
+            return
+        reusable = (
+            not discard
+            and not self._expired(opened)
+            and (self.reset is None or self.reset(connection))
+        )
+        with self._cond:
+            if reusable:
+                self._idle.append((connection, opened, time.monotonic()))
+            else:
+                self._size -= 1
+            self._cond.notify()
+        if not reusable:
+            self._close(connection)
+
+    def close_all(self):
+        """close idle connections, e.g. before forking workers"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+        for connection, _, _ in idle:
+            self._close(connection)
+
+    def _expired(self, opened):
+        return (
+            self.max_lifetime is not None
+            and time.monotonic() - opened > self.max_lifetime
+        )
+
+    def _alive(self, connection):
+        if self.ping is None:
+            return True
+        try:
+            return self.ping(connection)
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+        self._close(connection)
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
@@ -0,0 +1,81 @@
+"""
+Deleting a user in one go cascades through every recipe, link row and
+file it owns inside a single transaction. Accounts are instead
+deactivated right away by schedule_user_deletion and purged in small
+transactions by a background job (core.tasks).
+"""
+import logging
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import events, jobs
+from .models import User, Tag, Ingredient, Recipe, RecipeStats
+from .sharding import shard_for_user
+
+logger = logging.getLogger(__name__)
+
+
+def schedule_user_deletion(user):
+    """lock a user out now and mark it to be purged in the background"""
+    user.is_active = False
+    user.deletion_requested_at = timezone.now()
+    with transaction.atomic():
+        user.save(update_fields=['is_active', 'deletion_requested_at'])
+        Token.objects.filter(user=user).delete()
+        jobs.enqueue('core.purge_user', user_id=user.pk)
+
+
+def _batches(queryset, batch_size, *fields):
+    """yield the values of fields for successive batches until empty"""
+    queryset = queryset.order_by('pk').values_list('pk', *fields)
+    while True:
+        batch = list(queryset[:batch_size])
+        if not batch:
+            return
+        yield batch
+
+
+def purge_user(user, batch_size=500):
+    """delete the rows and files of a user batch by batch, return counts"""
+    # the user can't sign in anymore, nobody is streaming their changes
+    with events.muted():
+        counts = _purge_rows(user, batch_size)
+    # nothing large is left to cascade to
+    User.objects.filter(pk=user.pk).delete()
+    logger.info('purged user %s: %s', user.pk, counts)
+    return counts
+
+
+def _purge_rows(user, batch_size):
+    """delete recipes, tags and ingredients of user, streaming no event"""
+    using = shard_for_user(user.pk)
+    counts = {'recipes': 0, 'tags': 0, 'ingredients': 0, 'images': 0}
+    # first, so that deleting the recipes doesn't update them
+    RecipeStats.objects.using(using).filter(user=user).delete()
+
+    recipes = Recipe.objects.using(using).filter(user=user)
+    for batch in _batches(recipes, batch_size, 'image'):
+        # also deletes the tag and ingredient links of the batch
+        with transaction.atomic(using=using):
+            recipes.filter(pk__in=[pk for pk, _ in batch]).delete()
+        # removed after the rows so a crash leaves orphaned files rather
+        # than recipes pointing at missing images
+        images = [image for _, image in batch if image]
+        for image in images:
+            default_storage.delete(image)
+        counts['recipes'] += len(batch)
+        counts['images'] += len(images)
+        # large libraries outlast the lease of the purge job
+        jobs.heartbeat()
+
+    for name, model in (('tags', Tag), ('ingredients', Ingredient)):
+        rows = model.objects.using(using).filter(user=user)
+        for batch in _batches(rows, batch_size):
+            with transaction.atomic(using=using):
+                rows.filter(pk__in=[pk for pk, in batch]).delete()
+            counts[name] += len(batch)
+            jobs.heartbeat()
+    return counts
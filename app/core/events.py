@@ -0,0 +1,400 @@
+"""
+Change events streamed to clients as server-sent events.
+
+Model signals publish events once their transaction commits. Events are
+appended to EVENTS_STORE: 'locmem' for one process, 'sqlite' to fan them
+out to every worker of a host through EVENTS_SQLITE_PATH. The hub of a
+process polls the store and hands the events to the open streams of
+their user. Stores keep the events of EVENTS_RETENTION_SECONDS, so a
+client reconnecting with Last-Event-ID gets what it missed.
+"""
+import asyncio
+import collections
+import io
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, transaction
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from . import metrics
+
+
+class LocMemEventStore:
+    """recent events of the current process"""
+
+    def __init__(self):
+        self._events = collections.deque()
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def append(self, user_id, event, now=None):
+        now = time.time() if now is None else now
+        expired = now - settings.EVENTS_RETENTION_SECONDS
+        with self._lock:
+            self._last_id = next(self._ids)
+            self._events.append((self._last_id, user_id, event, now))
+            while self._events[0][3] < expired:
+                self._events.popleft()
+        return self._last_id
+
+    def since(self, last_id, user_id=None, limit=1000):
+        """return (id, user_id, event) of events after last_id"""
+        with self._lock:
+            events = [
+                (event_id, user, event)
+                for event_id, user, event, _ in self._events
+                if event_id > last_id and user_id in (None, user)
+            ]
+        return events[:limit]
+
+    def last_id(self):
+        return self._last_id
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+
+class SQLiteEventStore:
+    """recent events shared by the processes of a host"""
+    # one append in this many also deletes expired events
+    cleanup_every = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # connections are per thread and can't be inherited by forks
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            # AUTOINCREMENT never reuses the ids clients resume from
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS event ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'user_id INTEGER NOT NULL, data TEXT NOT NULL, '
+                'created REAL NOT NULL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.appends = 0
+        return self._local.connection
+
+    def append(self, user_id, event, now=None):
+        now = time.time() if now is None else now
+        connection = self._connection()
+        event_id = connection.execute(
+            'INSERT INTO event (user_id, data, created) VALUES (?, ?, ?)',
+            (user_id, json.dumps(event), now)
+        ).lastrowid
+        self._local.appends += 1
+        if self._local.appends % self.cleanup_every == 0:
+            connection.execute(
+                'DELETE FROM event WHERE created < ?',
+                (now - settings.EVENTS_RETENTION_SECONDS,)
+            )
+        return event_id
+
+    def since(self, last_id, user_id=None, limit=1000):
+        """return (id, user_id, event) of events after last_id"""
+        sql = 'SELECT id, user_id, data FROM event WHERE id > ?'
+        params = [last_id]
+        if user_id is not None:
+            sql += ' AND user_id = ?'
+            params.append(user_id)
+        rows = self._connection().execute(
+            sql + ' ORDER BY id LIMIT ?', params + [limit]
+        )
+        return [
+            (event_id, user, json.loads(data))
+            for event_id, user, data in rows
+        ]
+
+    def last_id(self):
+        row = self._connection().execute(
+            'SELECT seq FROM sqlite_sequence WHERE name = ?', ('event',)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def clear(self):
+        self._connection().execute('DELETE FROM event')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    """return the event store configured by EVENTS_STORE"""
+    if settings.EVENTS_STORE == 'sqlite':
+        key = ('sqlite', settings.EVENTS_SQLITE_PATH)
+    else:
+        key = ('locmem',)
+    with _stores_lock:
+        if key not in _stores:
+            if key[0] == 'sqlite':
+                _stores[key] = SQLiteEventStore(key[1])
+            else:
+                _stores[key] = LocMemEventStore()
+        return _stores[key]
+
+
+_muted = threading.local()
+
+
+@contextmanager
+def muted():
+    """publish no events for the changes made in the block"""
+    previous = getattr(_muted, 'active', False)
+    _muted.active = True
+    try:
+        yield
+    finally:
+        _muted.active = previous
+
+
+def publish(user_id, event_type, object_id, using=DEFAULT_DB_ALIAS):
+    """publish a change of a user's object when the transaction commits
+
+    a change published several times in a transaction is sent once
+    """
+    if not settings.EVENTS_ENABLED or getattr(_muted, 'active', False):
+        return
+    event = {'type': event_type, 'id': object_id}
+    key = (user_id, event_type, object_id)
+    connection = transaction.get_connection(using)
+    if any(getattr(func, 'event_key', None) == key
+           for _, func in connection.run_on_commit):
+        return
+
+    def store():
+        get_store().append(user_id, event)
+        metrics.EVENTS_PUBLISHED.inc(event=event_type)
+        hub.notify()
+
+    store.event_key = key
+    transaction.on_commit(store, using=using)
+
+
+class Subscription:
+    """the queue of events of one stream"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.queue = asyncio.Queue(settings.EVENTS_QUEUE_SIZE)
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # the client can't keep up, end its stream so that it
+            # reconnects and resumes from the store
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class Hub:
+    """hand the events of the store to the streams of this process"""
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._task = None
+        self._loop = None
+        self._wake = None
+        self.last_id = 0
+
+    async def subscribe(self, user_id):
+        """return a subscription to the events of a user stored from now"""
+        if self._task is None or self._task.done():
+            loop = asyncio.get_running_loop()
+            last_id = await loop.run_in_executor(None, get_store().last_id)
+            # unless another stream started the poller meanwhile
+            if self._task is None or self._task.done():
+                self.last_id = last_id
+                self._loop = loop
+                self._wake = asyncio.Event()
+                self._task = loop.create_task(self._poll())
+        subscription = Subscription(user_id)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscriptions = self._subscriptions.get(subscription.user_id, set())
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            self._subscriptions.pop(subscription.user_id, None)
+
+    def notify(self):
+        """wake the poller, called from any thread after storing events"""
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None:
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            # the loop of the last streams is closed
+            pass
+
+    def dispatch(self, events):
+        for event_id, user_id, event in events:
+            self.last_id = event_id
+            for subscription in list(self._subscriptions.get(user_id, ())):
+                subscription.put((event_id, event))
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        store = get_store()
+        while self._subscriptions:
+            self.dispatch(
+                await loop.run_in_executor(None, store.since, self.last_id)
+            )
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(
+                    self._wake.wait(), settings.EVENTS_POLL_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                pass
+
+
+hub = Hub()
+
+
+def format_event(event_id, event):
+    """return an event in the text/event-stream format"""
+    return (
+        f'id: {event_id}\nevent: {event["type"]}\n'
+        f'data: {json.dumps(event)}\n\n'
+    ).encode()
+
+
+def authenticate(request):
+    """return the user of the token in the Authorization header, or in
+    the token parameter for EventSource clients that can't set headers"""
+    try:
+        header = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(header) == 2 and header[0].lower() == 'token':
+            key = header[1]
+        else:
+            key = request.GET.get('token')
+        if not key:
+            raise exceptions.NotAuthenticated()
+        return TokenAuthentication().authenticate_credentials(key)[0]
+    finally:
+        close_old_connections()
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class EventStream:
+    """asgi application streaming the change events of the user"""
+
+    async def __call__(self, scope, receive, send):
+        request = ASGIRequest(scope, io.BytesIO())
+        try:
+            request.get_host()
+            user = await asyncio.get_running_loop().run_in_executor(
+                None, authenticate, request
+            )
+        except DisallowedHost:
+            return await self.reject(send, 400, 'Invalid host header.')
+        except exceptions.APIException as exc:
+            return await self.reject(send, exc.status_code, exc.detail)
+        if request.method not in ('GET', 'HEAD'):
+            return await self.reject(send, 405, 'Method not allowed.')
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # stop nginx from buffering the stream
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        if request.method == 'HEAD':
+            return await send({'type': 'http.response.body', 'body': b''})
+        await send({
+            'type': 'http.response.body',
+            'body': f'retry: {settings.EVENTS_RETRY_MS}\n\n'.encode(),
+            'more_body': True,
+        })
+        metrics.EVENT_STREAMS.inc()
+        subscription = await hub.subscribe(user.pk)
+        disconnected = asyncio.ensure_future(_disconnected(receive))
+        try:
+            await self.stream(request, subscription, disconnected, send)
+        finally:
+            hub.unsubscribe(subscription)
+            disconnected.cancel()
+
+    async def stream(self, request, subscription, disconnected, send):
+        last_id = request.META.get('HTTP_LAST_EVENT_ID') or \
+            request.GET.get('last_event_id')
+        sent = 0
+        if last_id and last_id.isdigit():
+            missed = await asyncio.get_running_loop().run_in_executor(
+                None, get_store().since, int(last_id), subscription.user_id
+            )
+            for event_id, _, event in missed:
+                await self.send_chunk(send, format_event(event_id, event))
+                sent = event_id
+
+        while True:
+            get = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait(
+                {get, disconnected},
+                timeout=settings.EVENTS_HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if get not in done:
+                get.cancel()
+                if disconnected in done:
+                    return
+                # comments keep proxies from closing idle streams
+                await self.send_chunk(send, b': ping\n\n')
+                continue
+            item = get.result()
+            if item is None:
+                break
+            event_id, event = item
+            # the replay and the hub may both have the latest events
+            if event_id > sent:
+                await self.send_chunk(send, format_event(event_id, event))
+                sent = event_id
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def send_chunk(self, send, body):
+        await send({
+            'type': 'http.response.body', 'body': body, 'more_body': True
+        })
+
+    async def reject(self, send, status, detail):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': json.dumps({'detail': str(detail)}).encode(),
+        })
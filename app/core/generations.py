@@ -0,0 +1,107 @@
+"""
+Counters processes compare to tell whether data they cache in memory was
+changed by another process, e.g. the per user recipe and name indexes.
+
+A writer bumps the counter of a key, a reader keeps the value it built
+its copy at and rebuilds once the counter moved. Counters live in
+GENERATIONS_STORE: 'locmem' for one process, 'sqlite' to share them
+between the workers of a host through GENERATIONS_SQLITE_PATH.
+"""
+import os
+import sqlite3
+import threading
+
+from django.conf import settings
+
+
+class LocMemGenerationStore:
+    """counters of the current process"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._values.get(key, 0)
+
+    def bump(self, key):
+        """increment the counter of key, returns its new value"""
+        with self._lock:
+            value = self._values[key] = self._values.get(key, 0) + 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class SQLiteGenerationStore:
+    """counters shared by the processes of a host through a sqlite file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # connections are per thread and can't be inherited by forks
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS generation ('
+                'key TEXT PRIMARY KEY, value INTEGER NOT NULL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM generation WHERE key = ?', (key,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, key):
+        """increment the counter of key, returns its new value"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT OR IGNORE INTO generation VALUES (?, 0)', (key,)
+            )
+            connection.execute(
+                'UPDATE generation SET value = value + 1 WHERE key = ?',
+                (key,)
+            )
+            value = connection.execute(
+                'SELECT value FROM generation WHERE key = ?', (key,)
+            ).fetchone()[0]
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return value
+
+    def clear(self):
+        self._connection().execute('DELETE FROM generation')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    """return the generation store configured by GENERATIONS_STORE"""
+    if settings.GENERATIONS_STORE == 'sqlite':
+        key = ('sqlite', settings.GENERATIONS_SQLITE_PATH)
+    else:
+        key = ('locmem',)
+    with _stores_lock:
+        if key not in _stores:
+            if key[0] == 'sqlite':
+                _stores[key] = SQLiteGenerationStore(key[1])
+            else:
+                _stores[key] = LocMemGenerationStore()
+        return _stores[key]
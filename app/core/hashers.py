@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """pbkdf2_sha256 with the iterations of PASSWORD_HASH_ITERATIONS
+
+    hashes with a different count are rehashed when their user logs in
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
@@ -0,0 +1,200 @@
+"""
+Background jobs stored in the database and run by the run_worker command.
+
+Job functions live in the tasks module of an app and are registered by
+name with @task, e.g.
+
+    @jobs.task('core.purge_user')
+    def purge_user(user_id):
+        ...
+
+    jobs.enqueue('core.purge_user', user_id=user.pk)
+
+Enqueuing inside a transaction only makes the job visible once it
+commits. Failed jobs are retried with exponential backoff until
+max_attempts, jobs of a worker that died are picked up again once their
+lease expires. Tasks running longer than the lease call heartbeat() now
+and then to keep it.
+"""
+import logging
+import time
+import traceback
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from . import metrics
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+# job run by the current thread
+_current = ContextVar('job', default=None)
+
+RETRY_DELAY = 10
+MAX_RETRY_DELAY = 3600
+
+
+class LeaseLost(Exception):
+    """the lease of the running job expired and another worker took it"""
+
+
+def task(name):
+    """register a function as the job called name"""
+    def decorator(func):
+        _tasks[name] = func
+        return func
+    return decorator
+
+
+def autodiscover():
+    """import the tasks module of every installed app"""
+    autodiscover_modules('tasks')
+
+
+def enqueue(name, delay=0, max_attempts=3, **kwargs):
+    """store a job running func(**kwargs) in delay seconds"""
+    return Job.objects.create(
+        name=name,
+        kwargs=kwargs,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts,
+    )
+
+
+def retry_delay(attempts):
+    """seconds to wait before running a job again after a failure"""
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def _ready(now):
+    return (
+        Q(status=Job.PENDING, run_at__lte=now)
+        | Q(status=Job.RUNNING, locked_until__lt=now)
+    )
+
+
+def claim(worker, limit=1, lease=300):
+    """mark up to limit ready jobs as run by worker and return them"""
+    now = timezone.now()
+    claimed = {
+        'status': Job.RUNNING,
+        'worker': worker,
+        'locked_until': now + timedelta(seconds=lease),
+        'attempts': F('attempts') + 1,
+    }
+    ready = Job.objects.filter(_ready(now)).order_by('run_at')
+    connection = connections[ready.db]
+    if connection.features.has_select_for_update_skip_locked:
+        # workers skip the rows another one is claiming instead of
+        # waiting for its transaction
+        with transaction.atomic(using=ready.db):
+            ids = list(
+                ready.select_for_update(skip_locked=True)
+                .values_list('pk', flat=True)[:limit]
+            )
+            Job.objects.filter(pk__in=ids).update(**claimed)
+    else:
+        # e.g. sqlite: compare and set, only one worker's update still
+        # matches the state it read
+        ids = []
+        candidates = ready.values_list('pk', 'status', 'locked_until')
+        for pk, status, locked_until in candidates[:limit * 2]:
+            if Job.objects.filter(
+                    pk=pk, status=status, locked_until=locked_until
+            ).update(**claimed):
+                ids.append(pk)
+                if len(ids) == limit:
+                    break
+    claimed = list(Job.objects.filter(pk__in=ids).order_by('run_at'))
+    for job in claimed:
+        job.lease = lease
+    return claimed
+
+
+def _owned(job):
+    """the row of job while the worker running it still holds it"""
+    return Job.objects.filter(
+        pk=job.pk, worker=job.worker, attempts=job.attempts,
+        status=Job.RUNNING
+    )
+
+
+def heartbeat():
+    """extend the lease of the job run by this thread, if any
+
+    cheap enough to call after every unit of work, the row is only
+    updated once half of the lease is used. Raises LeaseLost when another
+    worker claimed the job meanwhile, the task must stop
+    """
+    job = _current.get()
+    if job is None:
+        return
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(job, 'lease', 300))
+    if job.locked_until is not None and job.locked_until - now > lease / 2:
+        return
+    if not _owned(job).update(locked_until=now + lease):
+        raise LeaseLost(f'job {job.name} #{job.pk} was claimed again')
+    job.locked_until = now + lease
+
+
+def run(job):
+    """run a claimed job and record its outcome, return the new status"""
+    func = _tasks.get(job.name)
+    if func is None:
+        autodiscover()
+        func = _tasks.get(job.name)
+    now = timezone.now()
+    metrics.JOB_LAG.observe(
+        max((now - job.run_at).total_seconds(), 0), job=job.name
+    )
+    update = {'locked_until': None, 'error': ''}
+    start = time.perf_counter()
+    token = _current.set(job)
+    try:
+        if func is None:
+            raise LookupError(f'no task registered as {job.name}')
+        if job.attempts > job.max_attempts:
+            # claimed again after workers died running it
+            raise RuntimeError(f'lease expired {job.attempts - 1} times')
+        func(**job.kwargs)
+    except LeaseLost:
+        # the worker holding the job now records its outcome
+        logger.warning('job %s #%s lost its lease', job.name, job.pk)
+        metrics.JOB_DURATION.observe(
+            time.perf_counter() - start, job=job.name, result='lost'
+        )
+        return Job.RUNNING
+    except Exception:
+        update['error'] = traceback.format_exc()
+        if func is not None and job.attempts < job.max_attempts:
+            update['status'] = Job.PENDING
+            update['run_at'] = timezone.now() + timedelta(
+                seconds=retry_delay(job.attempts)
+            )
+            result = 'retry'
+        else:
+            update['status'] = Job.FAILED
+            update['finished_at'] = timezone.now()
+            result = 'failed'
+        logger.exception('job %s #%s failed (%s)', job.name, job.pk, result)
+    else:
+        update['status'] = Job.DONE
+        update['finished_at'] = timezone.now()
+        result = 'done'
+    finally:
+        _current.reset(token)
+    metrics.JOB_DURATION.observe(
+        time.perf_counter() - start, job=job.name, result=result
+    )
+    # a job claimed again meanwhile belongs to another worker now
+    if not _owned(job).update(**update):
+        logger.warning('job %s #%s lost its lease', job.name, job.pk)
+        return Job.RUNNING
+    return update['status']
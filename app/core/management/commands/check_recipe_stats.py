@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import stats
+from core.models import RecipeStats
+
+
+class Command(BaseCommand):
+    """Django command to compare recipe statistics with the recipes"""
+    help = (
+        'Recompute the recipe statistics of every user having them on '
+        'every shard and report those that differ from the stored ones.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='rebuild the statistics found inconsistent'
+        )
+
+    def handle(self, *args, **options):
+        checked, inconsistent = 0, []
+        for using in settings.DATABASE_SHARDS:
+            rows = RecipeStats.objects.using(using).filter(
+                built=True
+            ).order_by('pk')
+            for user_stats in rows.iterator():
+                checked += 1
+                problems = stats.check(user_stats)
+                if not problems:
+                    continue
+                inconsistent.append(user_stats.user_id)
+                self.stdout.write(f'user {user_stats.user_id} ({using}):')
+                for problem in problems:
+                    self.stdout.write(f'  {problem}')
+                if options['fix']:
+                    stats.rebuild(user_stats.user_id, using)
+
+        if inconsistent and not options['fix']:
+            raise CommandError(
+                f'{len(inconsistent)} of {checked} users have inconsistent '
+                'recipe stats, run with --fix to rebuild them'
+            )
+        message = f'Checked the recipe stats of {checked} users'
+        if options['fix']:
+            message += f', rebuilt {len(inconsistent)}'
+        self.stdout.write(self.style.SUCCESS(message))
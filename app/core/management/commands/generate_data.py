@@ -0,0 +1,236 @@
+import random
+import time
+from contextlib import ExitStack
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Max
+
+from core.models import User, Tag, Ingredient, Recipe
+from core.sharding import shard_for_user
+
+WORDS = (
+    'apple', 'basil', 'butter', 'carrot', 'cheese', 'chicken', 'chili',
+    'cinnamon', 'coconut', 'cream', 'curry', 'egg', 'garlic', 'ginger',
+    'honey', 'lemon', 'lentil', 'mint', 'mushroom', 'noodle', 'onion',
+    'pepper', 'potato', 'rice', 'salmon', 'spinach', 'steak', 'tahini',
+    'tomato', 'vanilla',
+)
+TAG_WORDS = (
+    'vegan', 'dessert', 'breakfast', 'lunch', 'dinner', 'quick', 'spicy',
+    'healthy', 'oriental', 'fruity', 'snack', 'baking', 'grill', 'soup',
+)
+DISTRIBUTIONS = ('fixed', 'uniform', 'exponential')
+
+
+def draw(rng, mean, distribution):
+    """draw a non negative count with the given mean"""
+    if mean <= 0:
+        return 0
+    if distribution == 'fixed':
+        return mean
+    if distribution == 'uniform':
+        return rng.randint(0, 2 * mean)
+    # long tail, most users have few rows and some have a lot
+    return int(round(rng.expovariate(1 / mean)))
+
+
+class Command(BaseCommand):
+    """Django command to generate synthetic data for scale testing"""
+    help = (
+        'Generate users with recipes, tags and ingredients. Rows are '
+        'bulk inserted with explicit ids so runs are deterministic by seed. '
+        'Users go to --database, their rows to the shard assigned to them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument(
+            '--recipes', type=int, default=20,
+            help='mean number of recipes per user'
+        )
+        parser.add_argument(
+            '--tags', type=int, default=10,
+            help='mean number of tags per user'
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=30,
+            help='mean number of ingredients per user'
+        )
+        parser.add_argument(
+            '--tags-per-recipe', type=int, default=2,
+            help='mean number of tags linked to each recipe'
+        )
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=5,
+            help='mean number of ingredients linked to each recipe'
+        )
+        parser.add_argument(
+            '--distribution', choices=DISTRIBUTIONS, default='exponential',
+            help='distribution of the per user and per recipe counts'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='synthetic123')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.using = options['database']
+        self.distribution = options['distribution']
+        self.batch_size = options['batch_size']
+        # hashing once keeps pbkdf2 out of the loop
+        self.password = make_password(options['password'])
+        # (model, alias) -> next free id, filled as aliases are used
+        self.next_ids = {}
+        self.aliases = set()
+        self.counts = dict.fromkeys(
+            ('users', 'tags', 'ingredients', 'recipes', 'links'), 0
+        )
+
+        start = time.perf_counter()
+        remaining = options['users']
+        while remaining > 0:
+            chunk = min(remaining, max(1, self.batch_size // 100))
+            with ExitStack() as stack:
+                for alias in self._all_aliases():
+                    stack.enter_context(transaction.atomic(using=alias))
+                self._generate_users(chunk)
+            remaining -= chunk
+        self._reset_sequences()
+        elapsed = time.perf_counter() - start
+
+        total = sum(self.counts.values())
+        summary = ', '.join(f'{v} {k}' for k, v in self.counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {summary} in {elapsed:.1f}s '
+            f'({total / max(elapsed, 1e-9):.0f} rows/s)'
+        ))
+
+    def _all_aliases(self):
+        """the users database and every shard"""
+        return dict.fromkeys(
+            [self.using] + [
+                self._shard_alias(shard)
+                for shard in settings.DATABASE_SHARDS
+            ]
+        )
+
+    def _shard_alias(self, shard):
+        # a single database setup keeps everything on --database
+        return self.using if shard == 'default' else shard
+
+    def _take_ids(self, model, count, alias):
+        key = (model, alias)
+        if key not in self.next_ids:
+            manager = model.objects.using(alias)
+            self.next_ids[key] = (
+                manager.aggregate(Max('id'))['id__max'] or 0
+            ) + 1
+            self.aliases.add(alias)
+        start = self.next_ids[key]
+        self.next_ids[key] += count
+        return range(start, start + count)
+
+    def _generate_users(self, count):
+        rng = self.rng
+        users = []
+        # alias -> rows to insert there, in insertion order
+        shard_rows = {}
+        tag_link = Recipe.tags.through
+        ingredient_link = Recipe.ingredients.through
+
+        for user_id in self._take_ids(User, count, self.using):
+            users.append(User(
+                id=user_id,
+                email=f'synthetic{user_id}@example.com',
+                name=f'Synthetic User {user_id}',
+                password=self.password,
+            ))
+            alias = self._shard_alias(shard_for_user(user_id))
+            tags, ingredients, recipes, recipe_tags, recipe_ingredients = (
+                shard_rows.setdefault(alias, ([], [], [], [], []))
+            )
+            tag_ids = list(self._take_ids(
+                Tag, draw(rng, self.options['tags'], self.distribution),
+                alias
+            ))
+            tags.extend(
+                Tag(id=tag_id, user_id=user_id,
+                    name=f'{rng.choice(TAG_WORDS)} {tag_id}')
+                for tag_id in tag_ids
+            )
+            ingredient_ids = list(self._take_ids(
+                Ingredient,
+                draw(rng, self.options['ingredients'], self.distribution),
+                alias
+            ))
+            ingredients.extend(
+                Ingredient(id=ingredient_id, user_id=user_id,
+                           name=f'{rng.choice(WORDS)} {ingredient_id}')
+                for ingredient_id in ingredient_ids
+            )
+            recipe_ids = self._take_ids(
+                Recipe, draw(rng, self.options['recipes'], self.distribution),
+                alias
+            )
+            for recipe_id in recipe_ids:
+                recipes.append(Recipe(
+                    id=recipe_id,
+                    user_id=user_id,
+                    title=f'{rng.choice(WORDS)} {rng.choice(WORDS)} '
+                          f'{recipe_id}',
+                    time_minute=rng.randint(5, 180),
+                    price=Decimal(rng.randint(100, 99999)) / 100,
+                ))
+                recipe_tags.extend(
+                    tag_link(recipe_id=recipe_id, tag_id=tag_id)
+                    for tag_id in self._sample(
+                        tag_ids, self.options['tags_per_recipe']
+                    )
+                )
+                recipe_ingredients.extend(
+                    ingredient_link(
+                        recipe_id=recipe_id, ingredient_id=ingredient_id
+                    )
+                    for ingredient_id in self._sample(
+                        ingredient_ids,
+                        self.options['ingredients_per_recipe']
+                    )
+                )
+
+        # parents first so foreign keys are satisfied on every backend
+        self._insert(self.using, (('users', users),))
+        for alias, rows in shard_rows.items():
+            self._insert(alias, zip(
+                ('tags', 'ingredients', 'recipes', 'links', 'links'), rows
+            ))
+
+    def _insert(self, alias, rows_by_key):
+        for key, rows in rows_by_key:
+            if rows:
+                type(rows[0]).objects.using(alias).bulk_create(
+                    rows, batch_size=self.batch_size
+                )
+            self.counts[key] += len(rows)
+
+    def _sample(self, ids, mean):
+        """pick distinct ids to link to a recipe"""
+        count = min(len(ids), draw(self.rng, mean, self.distribution))
+        return self.rng.sample(ids, count)
+
+    def _reset_sequences(self):
+        """move id sequences past the explicit ids (no-op on sqlite)"""
+        for alias in self.aliases:
+            connection = connections[alias]
+            statements = connection.ops.sequence_reset_sql(
+                no_style(), [User, Tag, Ingredient, Recipe]
+            )
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
@@ -0,0 +1,149 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Max
+
+from core import events
+from core.models import (
+    User, Tag, Ingredient, Recipe, RecipeStats, ShardAssignment
+)
+from core.sharding import forget_assignment, shard_for_user
+from recipes.autocomplete import ingredient_names, tag_names
+from recipes.index import indexes
+
+
+class Command(BaseCommand):
+    """Django command to move the recipe data of a user to another shard"""
+    help = (
+        'Copy the tags, ingredients and recipes of a user to another '
+        'shard, point the user at it and delete the old rows. Rows get new '
+        'ids on the target shard, so clients holding recipe, tag or '
+        'ingredient ids of the user must list them again. The user is '
+        'deactivated while moving.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='email or id of the user')
+        parser.add_argument('shard', help='database alias to move to')
+
+    def handle(self, *args, **options):
+        target = options['shard']
+        if target not in settings.DATABASE_SHARDS:
+            raise CommandError(
+                f'{target} is not one of {", ".join(settings.DATABASE_SHARDS)}'
+            )
+        user = self._get_user(options['user'])
+        source = shard_for_user(user.pk)
+        if source == target:
+            self.stdout.write(f'{user.email} is already on {target}')
+            return
+
+        # token authentication rejects inactive users, so no request can
+        # write to the source shard while its rows are copied
+        was_active = user.is_active
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        # moved rows aren't changes to stream to the user
+        try:
+            with events.muted():
+                with transaction.atomic(using=target):
+                    counts = self._copy(user, source, target)
+                ShardAssignment.objects.using('default').update_or_create(
+                    user=user, defaults={'shard': target}
+                )
+                forget_assignment(user.pk)
+                moved_at = time.monotonic()
+                # the user already reads from target, leftovers on a
+                # failure here are unreachable and removed by running the
+                # move again
+                with transaction.atomic(using=source):
+                    for model in (RecipeStats, Recipe, Tag, Ingredient):
+                        model.objects.using(source).filter(
+                            user=user
+                        ).delete()
+            # the indexes of every process hold the old ids
+            for index_cache in (indexes, tag_names, ingredient_names):
+                index_cache.invalidate(user.pk)
+            # other processes may still have the source cached
+            remaining = settings.SHARD_ASSIGNMENT_CACHE_SECONDS - (
+                time.monotonic() - moved_at
+            )
+            if remaining > 0:
+                self.stdout.write(
+                    f'Waiting {remaining:.0f}s for cached assignments '
+                    'to expire'
+                )
+                time.sleep(remaining)
+        finally:
+            User.objects.filter(pk=user.pk).update(is_active=was_active)
+
+        summary = ', '.join(f'{v} {k}' for k, v in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {summary} of {user.email} from {source} to {target}'
+        ))
+
+    def _get_user(self, value):
+        lookup = {'pk': value} if value.isdigit() else {'email': value}
+        try:
+            return User.objects.using('default').get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f'no user {value}')
+
+    def _copy(self, user, source, target):
+        """copy the rows of user with fresh ids, return the counts"""
+        # rows left over by an earlier interrupted move, the stats are
+        # rebuilt on the target when next read
+        for model in (RecipeStats, Recipe, Tag, Ingredient):
+            model.objects.using(target).filter(user=user).delete()
+
+        connection = connections[target]
+        # ids from the sequences of the target can't collide with rows
+        # inserted there meanwhile. Backends that don't return them
+        # (sqlite) get explicit ids; the deletes above already took the
+        # write lock there, so no other writer inserts until commit
+        returns_ids = connection.features.can_return_rows_from_bulk_insert
+        ids = {}
+        for model in (Tag, Ingredient, Recipe):
+            objects = list(model.objects.using(source).filter(user=user))
+            old_ids = [obj.pk for obj in objects]
+            if returns_ids:
+                for obj in objects:
+                    obj.pk = None
+            else:
+                next_id = (
+                    model.objects.using(target).aggregate(
+                        Max('id')
+                    )['id__max'] or 0
+                ) + 1
+                for new_id, obj in enumerate(objects, next_id):
+                    obj.pk = new_id
+            model.objects.using(target).bulk_create(objects)
+            ids[model] = {
+                old_id: obj.pk for old_id, obj in zip(old_ids, objects)
+            }
+
+        recipe_ids = ids[Recipe]
+        for name, model in (('tags', Tag), ('ingredients', Ingredient)):
+            through = getattr(Recipe, name).through
+            column = f'{model._meta.model_name}_id'
+            links = through.objects.using(source).filter(
+                recipe__user=user
+            ).values_list('recipe_id', column)
+            through.objects.using(target).bulk_create(
+                through(recipe_id=recipe_ids[recipe_id],
+                        **{column: ids[model][other_id]})
+                for recipe_id, other_id in links
+            )
+
+        if not returns_ids:
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                        no_style(), [Tag, Ingredient, Recipe]):
+                    cursor.execute(sql)
+        return {
+            'tags': len(ids[Tag]),
+            'ingredients': len(ids[Ingredient]),
+            'recipes': len(recipe_ids),
+        }
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.deletion import purge_user
+from core.models import User
+
+
+class Command(BaseCommand):
+    """Django command to purge users whose deletion was requested"""
+    help = (
+        'Delete the recipes, tags, ingredients and images of users marked '
+        'for deletion in small batches, then the users themselves.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='keep polling for new deletions'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=10,
+            help='seconds between two polls with --loop'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            users = User.objects.filter(
+                deletion_requested_at__isnull=False
+            ).order_by('deletion_requested_at')
+            for user in users.iterator():
+                counts = purge_user(user, options['batch_size'])
+                summary = ', '.join(f'{v} {k}' for k, v in counts.items())
+                self.stdout.write(f'Purged {user.email}: {summary}')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
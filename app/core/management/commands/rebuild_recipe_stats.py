@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import stats
+from core.models import User
+
+
+class Command(BaseCommand):
+    """Django command to recompute the recipe statistics of users"""
+    help = (
+        'Recompute the materialized recipe statistics of the given users, '
+        'or of every user, from their recipes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'users', nargs='*', help='emails or ids, all users by default'
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.using('default').order_by('pk')
+        if options['users']:
+            ids = {value for value in options['users'] if value.isdigit()}
+            emails = set(options['users']) - ids
+            users = users.filter(pk__in=ids) | users.filter(email__in=emails)
+            if users.count() != len(options['users']):
+                raise CommandError('unknown users')
+        rebuilt = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            stats.rebuild(user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the recipe stats of {rebuilt} users'
+        ))
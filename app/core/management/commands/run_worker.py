@@ -0,0 +1,118 @@
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from core import jobs
+from core.metrics import registry
+
+
+class Command(BaseCommand):
+    """Django command to run background jobs"""
+    help = (
+        'Claim and run jobs queued with core.jobs.enqueue. Every process '
+        'runs --threads workers, SIGTERM finishes the running jobs first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='forked worker processes, each with --threads threads'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1,
+            help='seconds to wait when no job is ready'
+        )
+        parser.add_argument(
+            '--lease', type=float, default=300,
+            help='seconds after which a running job is assumed lost'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='exit once no job is ready instead of polling'
+        )
+
+    def handle(self, *args, **options):
+        jobs.autodiscover()
+        self.options = options
+        self.stop = threading.Event()
+        self.children = []
+        handlers = {
+            signum: signal.signal(signum, self._shutdown)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        try:
+            if options['processes'] > 1:
+                self._fork(options['processes'])
+            else:
+                self._run_threads()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def _shutdown(self, signum, frame):
+        self.stop.set()
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+
+    def _fork(self, processes):
+        # children must open their own connections
+        connections.close_all()
+        for _ in range(processes):
+            pid = os.fork()
+            if pid == 0:
+                self.children = []
+                code = 1
+                try:
+                    self._run_threads()
+                    code = 0
+                finally:
+                    os._exit(code)
+            self.children.append(pid)
+        while self.children:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            self.children.remove(pid)
+
+    def _run_threads(self):
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+        if self.options['threads'] == 1:
+            self._work(f'{prefix}:0')
+            return
+        threads = [
+            threading.Thread(target=self._work_in_thread,
+                             args=(f'{prefix}:{i}',))
+            for i in range(self.options['threads'])
+        ]
+        for thread in threads:
+            thread.start()
+        # join with a timeout so signals reach the main thread
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.5)
+
+    def _work_in_thread(self, worker):
+        try:
+            self._work(worker)
+        finally:
+            connections.close_all()
+
+    def _work(self, worker):
+        while not self.stop.is_set():
+            close_old_connections()
+            claimed = jobs.claim(worker, lease=self.options['lease'])
+            if not claimed:
+                if self.options['burst']:
+                    return
+                self.stop.wait(self.options['poll_interval'])
+                continue
+            for job in claimed:
+                status = jobs.run(job)
+                self.stdout.write(f'{job.name} #{job.pk}: {status}')
+            registry.maybe_flush()
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.server import PreforkServer
+
+
+class Command(BaseCommand):
+    """Django command to serve the project with pre-forked workers"""
+    help = (
+        'Load and warm up the project once, then fork workers serving it '
+        'over wsgi (thread pool) or asgi (uvicorn). SIGHUP reloads the '
+        'code, stopping the old workers once the new ones are forked. '
+        'SIGTERM stops gracefully. The wsgi workers speak HTTP/1.0, run '
+        'them behind a proxy.'
+    )
+    # like other application servers, leave the checks to deployment
+    # commands, they import libraries (Pillow) the api rarely needs
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default='0.0.0.0:8000')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='request threads of each wsgi worker'
+        )
+        parser.add_argument(
+            '--interface', choices=('wsgi', 'asgi'), default='wsgi'
+        )
+        parser.add_argument(
+            '--max-requests', type=int, default=0,
+            help='restart a worker after this many requests, 0 never'
+        )
+        parser.add_argument(
+            '--graceful-timeout', type=float, default=30,
+            help='seconds workers get to finish requests when stopping'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help='seconds a wsgi worker waits on a client sending a request'
+        )
+        parser.add_argument(
+            '--max-body-size', type=int, default=10 * 1024 * 1024,
+            help='largest request body in bytes a wsgi worker accepts'
+        )
+        parser.add_argument('--access-log', action='store_true')
+
+    def handle(self, *args, **options):
+        server = PreforkServer(
+            options['bind'],
+            workers=options['workers'],
+            threads=options['threads'],
+            interface=options['interface'],
+            max_requests=options['max_requests'],
+            graceful_timeout=options['graceful_timeout'],
+            access_log=options['access_log'],
+            request_timeout=options['timeout'],
+            max_body_size=options['max_body_size'],
+            stdout=self.stdout,
+        )
+        try:
+            server.run()
+        except RuntimeError as exc:
+            raise CommandError(exc)
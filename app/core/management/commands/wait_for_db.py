@@ -1,20 +1,41 @@
 import time
 from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 
 class Command(BaseCommand):
     """Django command to pause execution until db is available"""
 
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='seconds to keep trying before giving up'
+        )
+        parser.add_argument(
+            '--max-delay', type=float, default=5,
+            help='longest pause between two attempts'
+        )
+
     def handle(self, *args, **options):
         self.stdout.write('Waiting for db...')
-        db_conn = None
-        while not db_conn:
+        connection = connections[options['database']]
+        deadline = time.monotonic() + options['timeout']
+        delay = 1
+        while True:
             try:
-                db_conn = connections['default']
+                # actually open a connection, not only look up the alias
+                connection.ensure_connection()
+                break
             except OperationalError:
-                self.stdout.write('DB is unavailable, waiting 1 second...')
-                time.sleep(1)
+                if time.monotonic() + delay > deadline:
+                    raise CommandError('DB is unavailable, giving up')
+                self.stdout.write(
+                    f'DB is unavailable, waiting {delay} second(s)...'
+                )
+                time.sleep(delay)
+                delay = min(delay * 2, options['max_delay'])
+        connection.close()
 
         self.stdout.write(self.style.SUCCESS('DB is available!!'))
@@ -0,0 +1,339 @@
+"""
+In-process metrics registry exposed in the Prometheus text format.
+
+Every thread updates its own shard of a metric, so the hot path never
+takes a lock; shards are only summed when the metrics are collected.
+With METRICS_DIR set each worker process periodically dumps a snapshot
+there and the /metrics endpoint merges the snapshots of all workers.
+"""
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (
+    .005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Metric:
+    """base metric storing one value per label set in per-thread shards"""
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        """return the values owned by the current thread"""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            # only taken once per thread
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _merge(self, a, b):
+        return a + b
+
+    def collect(self):
+        """return {label values: value} summed over all threads"""
+        with self._lock:
+            shards = list(self._shards)
+        values = {}
+        for shard in shards:
+            for key, value in shard.copy().items():
+                if key in values:
+                    values[key] = self._merge(values[key], value)
+                else:
+                    values[key] = self._copy(value)
+        return values
+
+    def _copy(self, value):
+        return value
+
+    def describe(self):
+        return {
+            'type': self.type,
+            'help': self.documentation,
+            'labelnames': list(self.labelnames),
+        }
+
+
+class Counter(Metric):
+    """monotonically increasing value"""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    """observations counted into cumulative buckets"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        # [count per bucket..., count above last bucket, sum]
+        counts = shard.get(key)
+        if counts is None:
+            counts = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """observe the duration of the block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _merge(self, a, b):
+        return [x + y for x, y in zip(a, b)]
+
+    def _copy(self, value):
+        return list(value)
+
+    def describe(self):
+        return dict(super().describe(), buckets=list(self.buckets))
+
+
+class Registry:
+    """collection of named metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._last_flush = 0.0
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), **kwargs):
+        return self.register(
+            Histogram(name, documentation, labelnames, **kwargs)
+        )
+
+    def snapshot(self):
+        """return a json serializable copy of every metric"""
+        return {
+            name: dict(
+                metric.describe(),
+                samples=[
+                    [list(key), value]
+                    for key, value in metric.collect().items()
+                ]
+            )
+            for name, metric in self._metrics.items()
+        }
+
+    def write_snapshot(self, directory, worker=None):
+        """atomically dump the snapshot of this worker to a directory"""
+        worker = worker or os.getpid()
+        path = os.path.join(directory, f'metrics-{worker}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        """write a snapshot if the flush interval elapsed"""
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        interval = settings.METRICS_FLUSH_INTERVAL
+        if time.monotonic() - self._last_flush >= interval:
+            self.write_snapshot(directory)
+
+    def exposition(self):
+        """return metrics of every worker in the prometheus text format"""
+        directory = settings.METRICS_DIR
+        if not directory:
+            return render(self.snapshot())
+        self.write_snapshot(directory)
+        return render(merge_snapshots(read_snapshots(directory)))
+
+
+def read_snapshots(directory):
+    """load the snapshots written by every worker"""
+    snapshots = []
+    for filename in sorted(os.listdir(directory)):
+        if not (filename.startswith('metrics-')
+                and filename.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            # a worker is replacing its file, skip it this time
+            continue
+    return snapshots
+
+
+def merge_snapshots(snapshots):
+    """sum samples with the same name and labels across workers"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, data in snapshot.items():
+            target = merged.setdefault(name, dict(data, samples={}))
+            samples = target['samples']
+            for labels, value in data['samples']:
+                key = tuple(labels)
+                if key not in samples:
+                    samples[key] = value
+                elif isinstance(value, list):
+                    samples[key] = [
+                        x + y for x, y in zip(samples[key], value)
+                    ]
+                else:
+                    samples[key] += value
+    for data in merged.values():
+        data['samples'] = [
+            [list(key), value] for key, value in data['samples'].items()
+        ]
+    return merged
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{n}="{v}"' for n, v in escaped) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def render(snapshot):
+    """render a snapshot in the prometheus text exposition format"""
+    lines = []
+    for name in sorted(snapshot):
+        data = snapshot[name]
+        names = data['labelnames']
+        lines.append(f'# HELP {name} {data["help"]}')
+        lines.append(f'# TYPE {name} {data["type"]}')
+        for labels, value in sorted(data['samples']):
+            if data['type'] != 'histogram':
+                lines.append(
+                    f'{name}{_format_labels(names, labels)} '
+                    f'{_format_value(value)}'
+                )
+                continue
+            cumulative = 0
+            bounds = list(data['buckets']) + [math.inf]
+            for bound, count in zip(bounds, value[:-1]):
+                cumulative += count
+                le = (('le', _format_value(bound)),)
+                lines.append(
+                    f'{name}_bucket{_format_labels(names, labels, le)} '
+                    f'{_format_value(cumulative)}'
+                )
+            lines.append(
+                f'{name}_sum{_format_labels(names, labels)} '
+                f'{_format_value(value[-1])}'
+            )
+            lines.append(
+                f'{name}_count{_format_labels(names, labels)} '
+                f'{_format_value(cumulative)}'
+            )
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds',
+    'Time spent serving requests, by view and action.',
+    ('view', 'method', 'status'),
+)
+REQUEST_QUERIES = registry.histogram(
+    'http_request_db_queries',
+    'Database queries executed per request, by view and action.',
+    ('view',),
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 250),
+)
+CACHE_REQUESTS = registry.counter(
+    'cache_requests_total',
+    'Lookups in application caches, by cache and hit/miss.',
+    ('cache', 'result'),
+)
+IMAGE_UPLOAD_BYTES = registry.histogram(
+    'recipe_image_upload_bytes',
+    'Size of recipe images uploaded.',
+    buckets=(
+        16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2,
+        16 * 1024 ** 2,
+    ),
+)
+IMAGE_UPLOAD_DURATION = registry.histogram(
+    'recipe_image_upload_duration_seconds',
+    'Time spent validating and storing recipe images.',
+)
+TOKEN_AUTH_DURATION = registry.histogram(
+    'auth_token_duration_seconds',
+    'Time spent authenticating token requests, by result.',
+    ('result',),
+)
+JOB_DURATION = registry.histogram(
+    'job_duration_seconds',
+    'Time spent running background jobs, by job and result.',
+    ('job', 'result'),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+JOB_LAG = registry.histogram(
+    'job_lag_seconds',
+    'Time background jobs waited past their run time before starting.',
+    ('job',),
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800),
+)
+EVENTS_PUBLISHED = registry.counter(
+    'events_published_total',
+    'Change events published to the event streams, by event.',
+    ('event',),
+)
+EVENT_STREAMS = registry.counter(
+    'event_streams_total',
+    'Event streams opened by clients.',
+)
+
+
+def record_cache(cache, hit):
+    """count a hit or miss of an application cache"""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
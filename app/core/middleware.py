@@ -0,0 +1,240 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.utils.module_loading import import_string
+
+from . import metrics, routers
+from .query_budget import budget_for, check_budget, QueryLog
+from .slow_queries import SlowQueryRecorder, save_slow_queries
+from .profiling import (
+    profile_request, current_profile, view_label, wrap_queries
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfilingMiddleware:
+    """report where request time goes as Server-Timing headers and logs"""
+
+    def __init__(self, get_response):
+        # unloaded entirely when disabled so it costs nothing per request
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with profile_request() as profile:
+            response = self.get_response(request)
+        response['Server-Timing'] = profile.server_timing()
+        record = dict(
+            profile.as_dict(),
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+        )
+        logger.info(json.dumps(record), extra={'profile': record})
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_profile().view = view_label(view_func, request)
+
+    def process_template_response(self, request, response):
+        # rendering happens right after the template response hooks
+        profile = current_profile()
+        start = time.perf_counter()
+
+        def rendered(response):
+            profile.render_time += time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class MetricsMiddleware:
+    """record latency and query count of every request"""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(None)
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with wrap_queries(count_query):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        view = getattr(request, 'metrics_view', 'unresolved')
+        metrics.REQUEST_LATENCY.observe(
+            duration,
+            view=view,
+            method=request.method,
+            status=response.status_code
+        )
+        metrics.REQUEST_QUERIES.observe(len(queries), view=view)
+        metrics.registry.maybe_flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = view_label(view_func, request)
+
+
+class SlowQueryMiddleware:
+    """record queries over SLOW_QUERY_THRESHOLD_MS with their plans"""
+
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_THRESHOLD_MS is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith(tuple(settings.SLOW_QUERY_PATHS)):
+            return self.get_response(request)
+
+        recorder = SlowQueryRecorder(settings.SLOW_QUERY_THRESHOLD_MS)
+        with wrap_queries(recorder):
+            response = self.get_response(request)
+        if recorder.queries:
+            save_slow_queries(
+                recorder.queries,
+                getattr(request, 'slow_query_view', ''),
+                request.path
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.slow_query_view = view_label(view_func, request)
+
+
+class QueryBudgetMiddleware:
+    """enforce the query budget declared by views in development/tests"""
+
+    def __init__(self, get_response):
+        if not settings.QUERY_BUDGET_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        log = QueryLog()
+        with wrap_queries(log):
+            response = self.get_response(request)
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None:
+            check_budget(
+                log,
+                budget,
+                settings.QUERY_BUDGET_DUPLICATE_LIMIT,
+                request.query_budget_view,
+                settings.QUERY_BUDGET_RAISE
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = budget_for(view_func, request)
+        request.query_budget_view = view_label(view_func, request)
+
+
+class ReplicaRoutingMiddleware:
+    """read from replicas on safe requests to views with `use_replicas`"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        token = getattr(request, 'db_replica_token', None)
+        if token is not None:
+            routers.reset_replica(token)
+        elif request.method not in ('GET', 'HEAD', 'OPTIONS') \
+                and response.status_code < 400 \
+                and settings.DATABASE_REPLICAS:
+            # read your writes: stay on the primary for a while
+            routers.pin_to_primary(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD') \
+                or not getattr(view_func, 'cls', None) \
+                or not getattr(view_func.cls, 'use_replicas', False) \
+                or not settings.DATABASE_REPLICAS \
+                or routers.is_pinned(request):
+            return
+        request.db_replica = routers.choose_replica()
+        request.db_replica_token = routers.use_replica(request.db_replica)
+
+
+class PathDispatchMiddleware:
+    """run BROWSER_MIDDLEWARE only for requests outside LEAN_PATH_PREFIXES
+
+    api requests authenticate with tokens and never use sessions, csrf
+    cookies or messages, the admin and other pages get the full stack
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefixes = tuple(settings.LEAN_PATH_PREFIXES)
+        self.view_middleware = []
+        self.template_response_middleware = []
+        self.exception_middleware = []
+        # chain them the way django.core.handlers.base.BaseHandler does
+        handler = get_response
+        for path in reversed(settings.BROWSER_MIDDLEWARE):
+            try:
+                middleware = import_string(path)(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(middleware, 'process_view'):
+                self.view_middleware.insert(0, middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self.template_response_middleware.append(
+                    middleware.process_template_response
+                )
+            if hasattr(middleware, 'process_exception'):
+                self.exception_middleware.append(
+                    middleware.process_exception
+                )
+            handler = convert_exception_to_response(middleware)
+        self.browser_handler = handler
+
+    def _lean(self, request):
+        return request.path_info.startswith(self.prefixes)
+
+    def __call__(self, request):
+        if self._lean(request):
+            return self.get_response(request)
+        return self.browser_handler(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self._lean(request):
+            return None
+        for process_view in self.view_middleware:
+            response = process_view(request, view_func, view_args,
+                                    view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        if not self._lean(request):
+            for process in self.template_response_middleware:
+                response = process(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self._lean(request):
+            return None
+        for process_exception in self.exception_middleware:
+            response = process_exception(request, exception)
+            if response is not None:
+                return response
+        return None
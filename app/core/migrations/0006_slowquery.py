@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-19 00:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('duration_ms', models.FloatField()),
+                ('sql', models.TextField()),
+                ('plan', models.TextField(blank=True)),
+                ('view', models.CharField(blank=True, max_length=255)),
+                ('path', models.CharField(blank=True, max_length=255)),
+                ('stack', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name_plural': 'slow queries',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
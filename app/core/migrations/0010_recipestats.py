@@ -0,0 +1,42 @@
+# Generated by Django 3.2.25 on 2026-10-19 01:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeStats',
+            fields=[
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('recipes', models.PositiveIntegerField(default=0)),
+                ('price_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('time_total', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'recipe stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeStatsCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('price', 'Price'), ('time', 'Time'), ('tag', 'Tag'), ('ingredient', 'Ingredient')], max_length=10)),
+                ('value', models.BigIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('stats', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counts', to='core.recipestats')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='recipestatscount',
+            constraint=models.UniqueConstraint(fields=('stats', 'kind', 'value'), name='unique_recipe_stats_count'),
+        ),
+    ]
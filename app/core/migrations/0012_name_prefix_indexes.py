@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# istartswith compares UPPER(name::text) on PostgreSQL and uses LIKE,
+# case insensitive for ASCII, on SQLite
+INDEXES = {
+    'postgresql': (
+        'CREATE INDEX {table}_user_name_prefix ON {table} '
+        '(user_id, (UPPER(name::text)) text_pattern_ops)'
+    ),
+    'sqlite': (
+        'CREATE INDEX {table}_user_name_prefix ON {table} '
+        '(user_id, name COLLATE NOCASE)'
+    ),
+}
+TABLES = ('core_tag', 'core_ingredient')
+
+
+def create_indexes(apps, schema_editor):
+    sql = INDEXES.get(schema_editor.connection.vendor)
+    if sql is None:
+        return
+    for table in TABLES:
+        schema_editor.execute(sql.format(table=table))
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in INDEXES:
+        return
+    for table in TABLES:
+        schema_editor.execute(f'DROP INDEX {table}_user_name_prefix')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_recipe_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_name_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipestats',
+            name='built',
+            field=models.BooleanField(default=True),
+        ),
+    ]
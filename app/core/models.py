@@ -1,6 +1,7 @@
 import uuid
 import os
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, \
     BaseUserManager, PermissionsMixin
 from django.conf import settings
@@ -43,6 +44,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # set when the account is waiting to be purged (core.deletion)
+    deletion_requested_at = models.DateTimeField(null=True, blank=True)
 
     objects = UserManager()
 
@@ -52,9 +55,11 @@ class User(AbstractBaseUser, PermissionsMixin):
 class Tag(models.Model):
     """tag to be used in recipes"""
     name = models.CharField(max_length=255)
+    # no constraint, the user row may live on another database (shards)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
     )
 
     def __str__(self):
@@ -66,7 +71,8 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False,
     )
 
     def __str__(self):
@@ -77,7 +83,8 @@ class Recipe(models.Model):
     """recipe object"""
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False,
     )
     title = models.CharField(max_length=255)
     time_minute = models.IntegerField()
@@ -87,5 +94,150 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
 
+    class Meta:
+        # the orderings of a user's recipe list, scanned in either
+        # direction instead of sorting the whole library
+        indexes = [
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'price', 'id']),
+            models.Index(fields=['user', 'time_minute', 'id']),
+            models.Index(fields=['user', 'title', 'id']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # price and time as loaded, core.stats adjusts the stats by the
+        # change when the recipe is saved
+        loaded = dict(zip(field_names, values))
+        if 'price' in loaded and 'time_minute' in loaded:
+            instance._stats_loaded = (
+                loaded['price'], loaded['time_minute']
+            )
+        return instance
+
     def __str__(self):
         return self.title
+
+
+class RecipeStats(models.Model):
+    """statistics of the recipes of a user, kept up to date by core.stats"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        db_constraint=False,
+    )
+    recipes = models.PositiveIntegerField(default=0)
+    price_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0
+    )
+    time_total = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    # False while the first build counts the recipes
+    built = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name_plural = 'recipe stats'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipes} recipes'
+
+
+class RecipeStatsCount(models.Model):
+    """number of recipes of a user with a price, time, tag or ingredient"""
+    PRICE = 'price'
+    TIME = 'time'
+    TAG = 'tag'
+    INGREDIENT = 'ingredient'
+    KIND_CHOICES = (
+        (PRICE, 'Price'),
+        (TIME, 'Time'),
+        (TAG, 'Tag'),
+        (INGREDIENT, 'Ingredient'),
+    )
+
+    stats = models.ForeignKey(
+        RecipeStats, on_delete=models.CASCADE, related_name='counts'
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # price in cents, minutes, or the id of the tag or ingredient
+    value = models.BigIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['stats', 'kind', 'value'],
+                name='unique_recipe_stats_count'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.stats_id} {self.kind} {self.value}: {self.count}'
+
+
+class ShardAssignment(models.Model):
+    """database alias holding the recipes, tags and ingredients of a user"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    shard = models.CharField(max_length=100)
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.shard}'
+
+
+class Job(models.Model):
+    """unit of background work, see core.jobs"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # a running job whose lease expired belongs to a dead worker
+    locked_until = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'])]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+
+class SlowQuery(models.Model):
+    """query that exceeded the slow query threshold while serving a request"""
+    created_at = models.DateTimeField(auto_now_add=True)
+    duration_ms = models.FloatField()
+    sql = models.TextField()
+    plan = models.TextField(blank=True)
+    view = models.CharField(max_length=255, blank=True)
+    path = models.CharField(max_length=255, blank=True)
+    stack = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'slow queries'
+
+    def __str__(self):
+        return f'{self.view} {self.duration_ms:.1f}ms'
@@ -0,0 +1,123 @@
+import time
+from contextlib import contextmanager, ExitStack
+from contextvars import ContextVar
+
+from django.db import connections
+
+# profile of the request being served in the current thread/task
+_current_profile = ContextVar('request_profile', default=None)
+# set while instrumentation runs queries of its own
+_untracked = ContextVar('untracked_queries', default=False)
+
+
+def view_label(view_func, request):
+    """return a `ViewSet.action` style label for a resolved view"""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', view_func.__class__.__name__)
+    method = request.method.lower()
+    # viewsets keep their http method -> action mapping on the view
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(method, method)}'
+
+
+@contextmanager
+def untracked_queries():
+    """hide queries run by instrumentation from every execute wrapper"""
+    token = _untracked.set(True)
+    try:
+        yield
+    finally:
+        _untracked.reset(token)
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """install an execute wrapper on every configured database"""
+    def tracked(execute, sql, params, many, context):
+        if _untracked.get():
+            return execute(sql, params, many, context)
+        return wrapper(execute, sql, params, many, context)
+
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(tracked))
+        yield
+
+
+class RequestProfile:
+    """timings collected while serving a single request"""
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+        self.in_serializer = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute wrapper counting queries and time spent in the db"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+    def as_dict(self):
+        """return the profile as a flat dict of milliseconds"""
+        return {
+            'view': self.view,
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 3),
+            'serializer_ms': round(self.serializer_time * 1000, 3),
+            'render_ms': round(self.render_time * 1000, 3),
+            'total_ms': round(self.total_time * 1000, 3),
+        }
+
+    def server_timing(self):
+        """return the profile formatted as a Server-Timing header"""
+        return ', '.join([
+            f'db;desc="{self.queries} queries";dur={self.db_time * 1000:.3f}',
+            f'serializer;dur={self.serializer_time * 1000:.3f}',
+            f'render;dur={self.render_time * 1000:.3f}',
+            f'total;dur={self.total_time * 1000:.3f}',
+        ])
+
+
+@contextmanager
+def profile_request():
+    """make a new profile current and record db queries against it"""
+    profile = RequestProfile()
+    token = _current_profile.set(profile)
+    start = time.perf_counter()
+    try:
+        with wrap_queries(profile):
+            yield profile
+    finally:
+        profile.total_time = time.perf_counter() - start
+        _current_profile.reset(token)
+
+
+def current_profile():
+    """return the profile of the current request, if it is profiled"""
+    return _current_profile.get()
+
+
+class ProfiledSerializerMixin:
+    """record time spent turning instances into primitives"""
+
+    def to_representation(self, instance):
+        profile = _current_profile.get()
+        # nested serializers are already covered by the outermost one
+        if profile is None or profile.in_serializer:
+            return super().to_representation(instance)
+        profile.in_serializer = True
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            profile.serializer_time += time.perf_counter() - start
+            profile.in_serializer = False
@@ -0,0 +1,72 @@
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """a request ran more queries than its view allows"""
+
+
+def query_budget(budget):
+    """set the query budget of a view class or of a viewset action
+
+    the budget is either a number of queries or a dict mapping the
+    action (or http method for plain views) to its number of queries
+    """
+    def decorator(view):
+        view.query_budget = budget
+        return view
+    return decorator
+
+
+def budget_for(view_func, request):
+    """return the query budget of a resolved view, if it has one"""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return None
+    method = request.method.lower()
+    action = (getattr(view_func, 'actions', None) or {}).get(method, method)
+    handler = getattr(cls, action, None)
+    budget = getattr(handler, 'query_budget', None)
+    if budget is None:
+        budget = getattr(cls, 'query_budget', None)
+    if isinstance(budget, dict):
+        budget = budget.get(action)
+    return budget
+
+
+class QueryLog:
+    """execute wrapper keeping the sql of every query"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    def repeated(self, limit):
+        """return statements run more than limit times (N+1 signature)"""
+        return {
+            sql: count for sql, count in Counter(self.statements).items()
+            if count > limit
+        }
+
+
+def check_budget(log, budget, duplicate_limit, view, raise_errors):
+    """raise or log if a request broke its query budget"""
+    problems = []
+    if len(log.statements) > budget:
+        problems.append(
+            f'{view} ran {len(log.statements)} queries, '
+            f'its budget is {budget}'
+        )
+    for sql, count in log.repeated(duplicate_limit).items():
+        problems.append(f'{view} repeated a query {count} times: {sql}')
+    if not problems:
+        return
+    if raise_errors:
+        raise QueryBudgetExceeded('\n'.join(problems))
+    for problem in problems:
+        logger.warning(problem)
@@ -0,0 +1,227 @@
+import hashlib
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar, Token
+
+from django.conf import settings
+
+from . import sharding
+
+# replica serving the reads of the current request, if any
+_replica = ContextVar('db_replica', default=None)
+_counter = itertools.count()
+
+
+def _schedule(replicas):
+    """spread replicas over a cycle proportionally to their weight"""
+    slots = []
+    for alias, weight in replicas.items():
+        slots.extend(
+            ((i + 0.5) / weight, alias) for i in range(weight)
+        )
+    return [alias for _, alias in sorted(slots)]
+
+
+def choose_replica():
+    """return the next replica in weighted round robin order"""
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas:
+        return None
+    schedule = _schedule(replicas)
+    return schedule[next(_counter) % len(schedule)]
+
+
+def current_replica():
+    return _replica.get()
+
+
+def use_replica(alias):
+    """route reads of the current request to alias, returns a reset token"""
+    return _replica.set(alias)
+
+
+def reset_replica(token):
+    try:
+        _replica.reset(token)
+    except ValueError:
+        # under asgi django runs process_view and the end of the
+        # middleware in different contexts
+        old = token.old_value
+        _replica.set(None if old is Token.MISSING else old)
+
+
+class LocMemPinStore:
+    """primary pins of the current process"""
+    # forget expired pins once this many are stored
+    max_entries = 10000
+
+    def __init__(self):
+        self._pins = {}
+        self._lock = threading.Lock()
+
+    def pin(self, key, seconds, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._pins[key] = now + seconds
+            if len(self._pins) > self.max_entries:
+                self._pins = {
+                    k: v for k, v in self._pins.items() if v > now
+                }
+
+    def is_pinned(self, key, now=None):
+        now = time.time() if now is None else now
+        return self._pins.get(key, 0) > now
+
+    def clear(self):
+        with self._lock:
+            self._pins.clear()
+
+
+class SQLitePinStore:
+    """primary pins shared by the processes of a host through a sqlite
+    file, so the read after a write sees it on any worker"""
+    # one pin in this many also deletes expired pins
+    cleanup_every = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # connections are per thread and can't be inherited by forks
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS pin ('
+                'key TEXT PRIMARY KEY, expires REAL NOT NULL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.pins = 0
+        return self._local.connection
+
+    def pin(self, key, seconds, now=None):
+        now = time.time() if now is None else now
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO pin VALUES (?, ?)', (key, now + seconds)
+        )
+        self._local.pins += 1
+        if self._local.pins % self.cleanup_every == 0:
+            connection.execute('DELETE FROM pin WHERE expires <= ?', (now,))
+
+    def is_pinned(self, key, now=None):
+        now = time.time() if now is None else now
+        row = self._connection().execute(
+            'SELECT 1 FROM pin WHERE key = ? AND expires > ?', (key, now)
+        ).fetchone()
+        return row is not None
+
+    def clear(self):
+        self._connection().execute('DELETE FROM pin')
+
+
+_pin_stores = {}
+_pin_stores_lock = threading.Lock()
+
+
+def get_pin_store():
+    """return the pin store configured by REPLICA_PIN_STORE"""
+    if settings.REPLICA_PIN_STORE == 'sqlite':
+        key = ('sqlite', settings.REPLICA_PIN_SQLITE_PATH)
+    else:
+        key = ('locmem',)
+    with _pin_stores_lock:
+        if key not in _pin_stores:
+            if key[0] == 'sqlite':
+                _pin_stores[key] = SQLitePinStore(key[1])
+            else:
+                _pin_stores[key] = LocMemPinStore()
+        return _pin_stores[key]
+
+
+def _pin_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return hashlib.sha256(authorization.encode()).hexdigest()
+
+
+def pin_to_primary(request):
+    """read from the primary for a while after a client wrote"""
+    key = _pin_key(request)
+    if key is not None:
+        get_pin_store().pin(key, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(request):
+    key = _pin_key(request)
+    return key is not None and get_pin_store().is_pinned(key)
+
+
+def reads_primary(model):
+    """tokens and users are read from the primary, a token created by the
+    login just before may not have reached the replicas yet"""
+    return model._meta.app_label in ('auth', 'authtoken') \
+        or model._meta.label_lower == settings.AUTH_USER_MODEL.lower()
+
+
+class ReplicaRouter:
+    """send reads of replica safe requests to the chosen replica"""
+
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        if replica is None or reads_primary(model):
+            return None
+        return replica
+
+    def db_for_write(self, model, **hints):
+        # never write back to the replica an instance was read from
+        instance = hints.get('instance')
+        if instance is not None and \
+                instance._state.db in settings.DATABASE_REPLICAS:
+            return 'default'
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ShardRouter:
+    """send queries on sharded models to the shard of their user"""
+
+    def db_for_read(self, model, **hints):
+        if not sharding.is_sharded(model):
+            return None
+        shard = sharding.shard_for_hints(hints)
+        # let ReplicaRouter spread reads of the primary over its replicas
+        return None if shard == 'default' else shard
+
+    def db_for_write(self, model, **hints):
+        if sharding.is_sharded(model):
+            return sharding.shard_for_hints(hints)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        sharded = [sharding.is_sharded(type(obj)) for obj in (obj1, obj2)]
+        if all(sharded):
+            return obj1._state.db == obj2._state.db
+        if any(sharded):
+            # the user foreign key has no constraint and may cross shards
+            return True
+        return None
@@ -0,0 +1,441 @@
+"""
+Pre-forking application server used by the serve command.
+
+The master process imports the project, warms it up and then forks the
+workers, so everything built during warmup is shared copy on write.
+Workers accept connections from one listening socket and serve them on
+a bounded thread pool (wsgi) or with uvicorn (asgi, when installed).
+
+Signals sent to the master:
+    TERM, INT  stop after the running requests finished
+    HUP        exec a fresh master on the same socket and pid, reloading
+               the code. The old workers keep serving until the new ones
+               are forked, then finish their requests and exit
+
+Workers exiting with an error right after they started are respawned
+with an exponential backoff rather than in a tight loop.
+
+The wsgi workers speak HTTP/1.0 (wsgiref) and serve one request per
+connection, keep them behind a proxy such as nginx.
+"""
+import gc
+import itertools
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref import simple_server, util
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver, reverse
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# file descriptor of the listening socket kept across a reload
+LISTEN_FD_ENV = 'SERVE_LISTEN_FD'
+# pids of the workers of the master before a reload
+OLD_WORKERS_ENV = 'SERVE_OLD_WORKERS'
+
+
+class QuietHandler(simple_server.WSGIRequestHandler):
+
+    def setup(self):
+        # wsgiref answers one request per connection, the timeout frees
+        # the thread of a client that stops sending
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+    def handle(self):
+        try:
+            super().handle()
+        except socket.timeout:
+            self.close_connection = True
+            self.log_message('timed out reading the request')
+
+    def log_message(self, format, *args):
+        if self.server.access_log:
+            super().log_message(format, *args)
+
+
+class PooledWSGIServer(simple_server.WSGIServer):
+    """wsgi server handling connections of a shared socket on a pool
+
+    the accept loop waits for a free thread, until then connections stay
+    in the backlog where other workers can take them. Reading a request
+    times out after request_timeout seconds so idle clients can't hold
+    the threads, bodies over max_body_size bytes are refused
+    """
+
+    def __init__(self, sock, application, threads, max_requests=0,
+                 access_log=False, request_timeout=30,
+                 max_body_size=10 * 1024 * 1024):
+        super().__init__(
+            sock.getsockname()[:2], QuietHandler, bind_and_activate=False
+        )
+        self.socket.close()
+        self.socket = sock
+        host, port = sock.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(application)
+        self.access_log = access_log
+        self.max_requests = max_requests
+        self.request_timeout = request_timeout
+        self.max_body_size = max_body_size
+        self._handled = itertools.count(1)
+        self._slots = threading.Semaphore(threads)
+        self._executor = ThreadPoolExecutor(threads)
+        self._stopping = False
+
+    def get_app(self):
+        return self._bounded_app
+
+    def _bounded_app(self, environ, start_response):
+        """refuse bodies over max_body_size before the application reads
+        them"""
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            status = '400 Bad Request'
+        elif self.max_body_size and length > self.max_body_size:
+            status = '413 Payload Too Large'
+        else:
+            return self.application(environ, start_response)
+        start_response(status, [('Content-Type', 'text/plain')])
+        return [status.encode()]
+
+    def verify_request(self, request, client_address):
+        # blocks the accept loop until a thread is free, so at most one
+        # accepted connection waits here
+        self._slots.acquire()
+        return True
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            request.setblocking(True)
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+        handled = next(self._handled)
+        if self.max_requests and handled >= self.max_requests:
+            self.stop()
+
+    def stop(self):
+        """stop accepting, running requests still complete"""
+        if not self._stopping:
+            self._stopping = True
+            threading.Thread(target=self.shutdown).start()
+
+    def serve(self):
+        self.serve_forever()
+        self._executor.shutdown(wait=True)
+
+
+def _warmup_host():
+    for host in settings.ALLOWED_HOSTS:
+        if '*' not in host and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def warmup(application):
+    """build url resolvers, model metadata and serializer fields and run
+    a request through every recipes route, return the paths requested"""
+    resolver = get_resolver()
+    if not settings.LAZY_ADMIN:
+        # reversing populates every included urlconf, the admin too
+        resolver.reverse_dict
+    for model in apps.get_models():
+        model._meta.get_fields()
+    for serializer_class in _subclasses(serializers.ModelSerializer):
+        if getattr(serializer_class, 'Meta', None) is not None and \
+                serializer_class.__module__.split('.')[0] != 'rest_framework':
+            serializer_class().fields
+
+    from recipes import urls
+
+    prefix = next(
+        str(pattern.pattern) for pattern in resolver.url_patterns
+        if getattr(pattern, 'urlconf_name', None) is urls
+    )
+    host = _warmup_host()
+    paths = []
+    # the 401 responses are expected, keep them out of the logs
+    logging.disable(logging.WARNING)
+    try:
+        for _, _, basename in urls.router.registry:
+            path = '/' + prefix + reverse(
+                f'{basename}-list', urlconf=urls
+            ).lstrip('/')
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': path,
+                'HTTP_HOST': host,
+            }
+            util.setup_testing_defaults(environ)
+            body = application(environ, lambda *args: None)
+            if hasattr(body, 'close'):
+                body.close()
+            paths.append(path)
+    finally:
+        logging.disable(logging.NOTSET)
+    return paths
+
+
+def _subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _subclasses(subclass)
+
+
+def close_connections():
+    """drop database connections so no worker inherits them"""
+    connections.close_all()
+    engines = {db['ENGINE'] for db in settings.DATABASES.values()}
+    if 'core.db.backends.postgresql' in engines:
+        from core.db.backends.postgresql.base import close_pools
+        close_pools()
+
+
+class PreforkServer:
+    """master process supervising forked workers"""
+
+    def __init__(self, bind, workers=2, threads=4, interface='wsgi',
+                 max_requests=0, graceful_timeout=30, access_log=False,
+                 request_timeout=30, max_body_size=10 * 1024 * 1024,
+                 min_worker_lifetime=5, respawn_delay=0.5,
+                 max_respawn_delay=30, stdout=sys.stdout):
+        self.bind = bind
+        self.workers = workers
+        self.threads = threads
+        self.interface = interface
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.access_log = access_log
+        self.request_timeout = request_timeout
+        self.max_body_size = max_body_size
+        self.min_worker_lifetime = min_worker_lifetime
+        self.respawn_delay = respawn_delay
+        self.max_respawn_delay = max_respawn_delay
+        self.stdout = stdout
+        # pid -> start time of the workers
+        self.children = {}
+        # pid -> kill deadline of workers asked to stop
+        self.retiring = {}
+        # times at which to replace exited workers
+        self.respawns = []
+        self.crashes = 0
+        self.stopping = False
+        self.reloading = False
+
+    def listen(self):
+        """open the listening socket or take over the one of a reload"""
+        fd = os.environ.pop(LISTEN_FD_ENV, None)
+        if fd is not None:
+            sock = socket.socket(fileno=int(fd))
+        else:
+            host, _, port = self.bind.rpartition(':')
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host or '0.0.0.0', int(port)))
+            sock.listen(1024)
+        sock.setblocking(False)
+        return sock
+
+    def load(self):
+        """import and warm up the application before forking"""
+        if self.interface == 'asgi':
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                raise RuntimeError('serving asgi requires uvicorn')
+            from app.asgi import application
+            from app.wsgi import application as wsgi_application
+            warmup(wsgi_application)
+        else:
+            from app.wsgi import application
+            warmup(application)
+        close_connections()
+        # keep the gc from touching, and so copying, the shared objects
+        gc.collect()
+        gc.freeze()
+        return application
+
+    def run(self):
+        self.socket = self.listen()
+        # still serving, they are stopped once the new workers are up
+        old_workers = [
+            int(pid)
+            for pid in os.environ.pop(OLD_WORKERS_ENV, '').split(',') if pid
+        ]
+        try:
+            self.application = self.load()
+        except Exception:
+            self.retire(old_workers)
+            self.wait_retired()
+            raise
+        self.stdout.write(
+            f'Serving {self.interface} on {self.bind} with {self.workers} '
+            f'workers (pid {os.getpid()})\n'
+        )
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._reload)
+        for _ in range(self.workers):
+            self.spawn()
+        self.retire(old_workers)
+        while not (self.stopping or self.reloading):
+            self.reap(respawn=True)
+            self.kill_late()
+            self.spawn_due()
+            time.sleep(0.2)
+        if self.reloading:
+            self.exec_new_master()
+        self.terminate()
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+
+    def _reload(self, signum, frame):
+        self.reloading = True
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+        code = 1
+        try:
+            self.serve_worker()
+            code = 0
+        except Exception:
+            logger.exception('worker %s crashed', os.getpid())
+        finally:
+            os._exit(code)
+
+    def serve_worker(self):
+        for signum in (signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, signal.SIG_IGN)
+        if self.interface == 'asgi':
+            import uvicorn
+
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            config = uvicorn.Config(
+                self.application, fd=self.socket.fileno(), lifespan='off',
+                access_log=self.access_log,
+                limit_max_requests=self.max_requests or None,
+            )
+            uvicorn.Server(config).run()
+            return
+        server = PooledWSGIServer(
+            self.socket, self.application, self.threads,
+            self.max_requests, self.access_log,
+            request_timeout=self.request_timeout,
+            max_body_size=self.max_body_size,
+        )
+        signal.signal(signal.SIGTERM, lambda *args: server.stop())
+        server.serve()
+
+    def reap(self, respawn=False):
+        """collect exited workers, scheduling new ones if respawn"""
+        while self.children or self.retiring:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                self.retiring.clear()
+                return
+            if not pid:
+                return
+            self.retiring.pop(pid, None)
+            started = self.children.pop(pid, None)
+            if respawn and started is not None:
+                failed = not os.WIFEXITED(status) or os.WEXITSTATUS(status)
+                self.schedule_respawn(failed, time.monotonic() - started)
+
+    def schedule_respawn(self, failed, lifetime):
+        """replace an exited worker, later if workers keep crashing"""
+        if failed and lifetime < self.min_worker_lifetime:
+            self.crashes += 1
+        else:
+            self.crashes = 0
+        delay = 0
+        if self.crashes:
+            delay = min(
+                self.max_respawn_delay,
+                self.respawn_delay * 2 ** (self.crashes - 1)
+            )
+            logger.warning(
+                'worker crashed %s times in a row, respawning in %.1fs',
+                self.crashes, delay
+            )
+        self.respawns.append(time.monotonic() + delay)
+
+    def spawn_due(self):
+        now = time.monotonic()
+        due = [at for at in self.respawns if at <= now]
+        self.respawns = [at for at in self.respawns if at > now]
+        for _ in due:
+            self.spawn()
+
+    def retire(self, pids):
+        """ask workers to finish their requests and exit"""
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                continue
+            self.retiring[pid] = deadline
+
+    def kill_late(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if deadline <= now:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    self.retiring.pop(pid)
+
+    def wait_retired(self):
+        while self.retiring:
+            self.reap()
+            self.kill_late()
+            time.sleep(0.05)
+
+    def terminate(self):
+        """ask workers to finish their requests, kill the late ones"""
+        self.retire(list(self.children))
+        self.children.clear()
+        self.wait_retired()
+
+    def exec_new_master(self):
+        """replace this process with a fresh one serving the same socket
+
+        the pid stays the same, so the workers remain children of the
+        new master, which stops them once its own workers are forked
+        """
+        self.stdout.write('Reloading\n')
+        self.stdout.flush()
+        self.socket.set_inheritable(True)
+        os.environ[LISTEN_FD_ENV] = str(self.socket.fileno())
+        os.environ[OLD_WORKERS_ENV] = ','.join(
+            str(pid) for pid in [*self.children, *self.retiring]
+        )
+        os.execv(sys.executable, [sys.executable] + sys.argv)
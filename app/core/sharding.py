@@ -0,0 +1,130 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .models import ShardAssignment
+
+# models whose rows live on the shard of their user
+SHARDED_MODELS = {
+    'core.tag',
+    'core.ingredient',
+    'core.recipe',
+    'core.recipe_tags',
+    'core.recipe_ingredients',
+    'core.recipestats',
+    'core.recipestatscount',
+}
+
+# shard of the user making the current request
+_current_shard = ContextVar('db_shard', default=None)
+
+# user id -> (shard, expires), assignments looked up by this process
+_assignments = {}
+# forget expired assignments once this many are cached
+MAX_CACHED_ASSIGNMENTS = 10000
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def shard_for_user(user_id):
+    """return the database alias holding the data of a user
+
+    users are spread by id the first time they are looked up and the
+    choice is stored so adding shards never moves existing users. Each
+    process caches it for SHARD_ASSIGNMENT_CACHE_SECONDS
+    """
+    shards = settings.DATABASE_SHARDS
+    if len(shards) == 1:
+        return shards[0]
+    now = time.monotonic()
+    cached = _assignments.get(user_id)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    assignment, _ = ShardAssignment.objects.using('default').get_or_create(
+        user_id=user_id,
+        defaults={'shard': shards[user_id % len(shards)]}
+    )
+    if len(_assignments) >= MAX_CACHED_ASSIGNMENTS:
+        for key, (_, expires) in list(_assignments.items()):
+            if expires <= now:
+                _assignments.pop(key, None)
+    _assignments[user_id] = (
+        assignment.shard, now + settings.SHARD_ASSIGNMENT_CACHE_SECONDS
+    )
+    return assignment.shard
+
+
+def forget_assignment(user_id=None):
+    """drop the cached shard of a user, of every user if None"""
+    if user_id is None:
+        _assignments.clear()
+    else:
+        _assignments.pop(user_id, None)
+
+
+def assignment_changed(sender, instance, **kwargs):
+    """forget assignments saved or deleted by this process"""
+    forget_assignment(instance.user_id)
+
+
+def current_shard():
+    return _current_shard.get()
+
+
+def activate(alias):
+    """route sharded queries without hints to alias, returns a token"""
+    return _current_shard.set(alias)
+
+
+def deactivate(token):
+    _current_shard.reset(token)
+
+
+@contextmanager
+def user_shard(user_id):
+    """route sharded queries without hints to the shard of a user
+
+    needed outside of requests for e.g. Tag.objects.create(), saving or
+    reading through an instance finds the shard on its own
+    """
+    token = activate(shard_for_user(user_id))
+    try:
+        yield
+    finally:
+        deactivate(token)
+
+
+def shard_for_hints(hints):
+    """return the shard implied by the instance a query is made for"""
+    instance = hints.get('instance')
+    if instance is None:
+        return _current_shard.get()
+    if is_sharded(type(instance)):
+        if instance._state.db in settings.DATABASE_SHARDS:
+            return instance._state.db
+        return shard_for_user(instance.user_id)
+    if isinstance(instance, get_user_model()) and instance.pk is not None:
+        # e.g. user.recipe_set
+        return shard_for_user(instance.pk)
+    return _current_shard.get()
+
+
+class ShardedViewMixin:
+    """run the queries of a request on the shard of the requesting user"""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.user.is_authenticated:
+            self._shard_token = activate(shard_for_user(request.user.pk))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_shard_token', None)
+        if token is not None:
+            deactivate(token)
+            self._shard_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from .models import SlowQuery
+from .profiling import untracked_queries
+
+logger = logging.getLogger(__name__)
+
+# frames of the orm and of this instrumentation are never the origin
+_SKIPPED_PATHS = (
+    os.path.join('django', 'db', ''),
+    os.path.join('core', 'slow_queries.py'),
+    os.path.join('core', 'profiling.py'),
+    os.path.join('core', 'middleware.py'),
+)
+
+
+def _explain_prefix(connection):
+    """return the EXPLAIN syntax of the database vendor, if any"""
+    if connection.vendor == 'postgresql':
+        if settings.SLOW_QUERY_EXPLAIN_ANALYZE:
+            return 'EXPLAIN (ANALYZE, BUFFERS) '
+        return 'EXPLAIN '
+    if connection.vendor == 'sqlite':
+        return 'EXPLAIN QUERY PLAN '
+    if connection.vendor == 'mysql':
+        return 'EXPLAIN '
+    return None
+
+
+def caller_stack(limit):
+    """return the innermost frames that led to a query, innermost first"""
+    frames = [
+        frame for frame in reversed(traceback.extract_stack())
+        if not any(path in frame.filename for path in _SKIPPED_PATHS)
+    ]
+    return ''.join(traceback.format_list(frames[:limit]))
+
+
+class SlowQueryRecorder:
+    """execute wrapper collecting queries slower than a threshold"""
+
+    def __init__(self, threshold_ms):
+        self.threshold_ms = threshold_ms
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= self.threshold_ms and not many:
+            connection = context['connection']
+            self.queries.append({
+                'duration_ms': round(duration_ms, 3),
+                'sql': connection.ops.last_executed_query(
+                    context['cursor'].cursor, sql, params
+                ),
+                'plan': self.explain(connection, sql, params),
+                'stack': caller_stack(settings.SLOW_QUERY_STACK_DEPTH),
+            })
+        return result
+
+    def explain(self, connection, sql, params):
+        """return the plan of a slow SELECT"""
+        prefix = _explain_prefix(connection)
+        if prefix is None or not sql.lstrip().upper().startswith('SELECT'):
+            return ''
+        try:
+            # savepoint so a failing EXPLAIN can't break the transaction
+            with untracked_queries(), \
+                    transaction.atomic(using=connection.alias):
+                with connection.cursor() as cursor:
+                    cursor.execute(prefix + sql, params)
+                    rows = cursor.fetchall()
+        except DatabaseError as exc:
+            return f'EXPLAIN failed: {exc}'
+        return '\n'.join(
+            ' '.join(str(column) for column in row) for row in rows
+        )
+
+
+def save_slow_queries(queries, view, path):
+    """log slow queries and store them for the admin"""
+    for query in queries:
+        record = dict(query, view=view, path=path[:255])
+        logger.warning(json.dumps(record), extra={'slow_query': record})
+        with untracked_queries():
+            SlowQuery.objects.create(**record)
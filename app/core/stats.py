@@ -0,0 +1,393 @@
+"""
+Per user recipe statistics, materialized in RecipeStats and
+RecipeStatsCount instead of aggregating the recipes of a user on every
+read.
+
+Stats are built from the recipes the first time they are read and then
+kept up to date by model signals, inside the transaction of the change:
+saving or deleting recipes adjusts the totals and the number of recipes
+per price and time, linking tags and ingredients the number of recipes
+per tag and ingredient. Updates lock the stats row of the user, so
+concurrent changes and rebuilds are applied one after the other. The
+first build commits an empty row before counting, so changes made while
+it counts wait for it and apply on top; only a change that updated the
+stats before that row existed and commits after the count is missed.
+
+Queryset .update(), bulk_create() and raw SQL send no signal and leave
+the stats behind, check_recipe_stats finds such users and
+rebuild_recipe_stats (or check_recipe_stats --fix) recomputes them.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.db import router, transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .models import Ingredient, Recipe, RecipeStats, RecipeStatsCount, Tag
+from .sharding import shard_for_user
+
+# upper bounds (minutes) of the buckets of the time histogram
+TIME_BUCKETS = (10, 20, 30, 45, 60, 90, 120)
+TOP = 10
+
+LINKS = (
+    (RecipeStatsCount.TAG, Recipe.tags.through, 'tag_id'),
+    (RecipeStatsCount.INGREDIENT, Recipe.ingredients.through,
+     'ingredient_id'),
+)
+
+
+def _cents(price):
+    return int((Decimal(str(price)) * 100).to_integral_value())
+
+
+def compute(user_id, using):
+    """return the totals and counts of a user's recipes from the recipes"""
+    recipes = Recipe.objects.using(using).filter(user_id=user_id)
+    totals = recipes.aggregate(
+        recipes=Count('id'), price_total=Sum('price'),
+        time_total=Sum('time_minute')
+    )
+    totals = {
+        name: value if value is not None else 0
+        for name, value in totals.items()
+    }
+    counts = Counter()
+    for price, count in recipes.order_by().values('price').annotate(
+            count=Count('id')).values_list('price', 'count'):
+        counts[(RecipeStatsCount.PRICE, _cents(price))] += count
+    for minutes, count in recipes.order_by().values('time_minute').annotate(
+            count=Count('id')).values_list('time_minute', 'count'):
+        counts[(RecipeStatsCount.TIME, minutes)] += count
+    for kind, through, column in LINKS:
+        links = through.objects.using(using).filter(
+            recipe__user_id=user_id
+        ).order_by().values(column).annotate(count=Count('id'))
+        for value, count in links.values_list(column, 'count'):
+            counts[(kind, value)] += count
+    return totals, counts
+
+
+def rebuild(user_id, using=None):
+    """recompute the stats of a user from the recipes, return them
+
+    run outside of transactions, the row of a first build has to be
+    committed before the recipes are counted
+    """
+    using = using or shard_for_user(user_id)
+    # concurrent first builds create the row once, changes from now on
+    # update it
+    RecipeStats.objects.using(using).get_or_create(
+        user_id=user_id, defaults={'built': False}
+    )
+    with transaction.atomic(using=using):
+        # changes made meanwhile wait for the rebuild and apply after it
+        stats = RecipeStats.objects.using(using).select_for_update().get(
+            user_id=user_id
+        )
+        totals, counts = compute(user_id, using)
+        for name, value in totals.items():
+            setattr(stats, name, value)
+        stats.built = True
+        stats.save(using=using)
+        RecipeStatsCount.objects.using(using).filter(stats=stats).delete()
+        RecipeStatsCount.objects.using(using).bulk_create(
+            [
+                RecipeStatsCount(
+                    stats=stats, kind=kind, value=value, count=count
+                )
+                for (kind, value), count in counts.items()
+            ],
+            batch_size=1000
+        )
+    return stats
+
+
+def check(stats):
+    """return how the stored stats differ from the recipes"""
+    using = stats._state.db
+    totals, counts = compute(stats.user_id, using)
+    problems = [
+        f'{name} is {getattr(stats, name)}, expected {value}'
+        for name, value in totals.items()
+        if getattr(stats, name) != value
+    ]
+    stored = Counter({
+        (kind, value): count
+        for kind, value, count in RecipeStatsCount.objects.using(
+            using
+        ).filter(stats=stats).values_list('kind', 'value', 'count')
+    })
+    for key in sorted(set(stored) | set(counts)):
+        if stored[key] != counts[key]:
+            problems.append(
+                f'{key[0]} {key[1]} counts {stored[key]} recipes, '
+                f'expected {counts[key]}'
+            )
+    return problems
+
+
+def _apply(user_id, using, counts=None, **totals):
+    """add to the totals and counts of a user's stats, if built
+
+    counts is a function returning (kind, value, delta) triples, only
+    called when the user has stats
+    """
+    with transaction.atomic(using=using):
+        # also locks the row until the change commits
+        updated = RecipeStats.objects.using(using).filter(
+            user_id=user_id
+        ).update(
+            updated_at=timezone.now(),
+            **{name: F(name) + delta for name, delta in totals.items()}
+        )
+        if not updated or counts is None:
+            return
+        deltas = Counter()
+        for kind, value, delta in counts():
+            deltas[(kind, value)] += delta
+        for kind in {kind for kind, _ in deltas}:
+            _apply_counts(user_id, using, kind, {
+                value: delta for (k, value), delta in deltas.items()
+                if k == kind and delta
+            })
+
+
+def _apply_counts(user_id, using, kind, deltas):
+    if not deltas:
+        return
+    rows = RecipeStatsCount.objects.using(using).filter(
+        stats_id=user_id, kind=kind
+    )
+    existing = set(
+        rows.filter(value__in=deltas).values_list('value', flat=True)
+    )
+    by_delta = {}
+    for value in existing:
+        by_delta.setdefault(deltas[value], []).append(value)
+    for delta, values in by_delta.items():
+        rows.filter(value__in=values).update(count=F('count') + delta)
+    RecipeStatsCount.objects.using(using).bulk_create([
+        RecipeStatsCount(
+            stats_id=user_id, kind=kind, value=value, count=delta
+        )
+        for value, delta in deltas.items()
+        if value not in existing and delta > 0
+    ])
+    if any(delta < 0 for delta in deltas.values()):
+        rows.filter(value__in=deltas, count__lte=0).delete()
+
+
+def recipe_pre_save(sender, instance, raw, using, update_fields, **kwargs):
+    """remember the price and time a recipe is saved over"""
+    instance._stats_previous = None
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and \
+            not {'price', 'time_minute'} & set(update_fields):
+        return
+    loaded = getattr(instance, '_stats_loaded', None)
+    if loaded is not None:
+        instance._stats_previous = loaded
+        return
+    # not loaded from the database, only users with stats need the row
+    instance._stats_previous = Recipe.objects.using(using).filter(
+        Exists(RecipeStats.objects.filter(user_id=OuterRef('user_id'))),
+        pk=instance.pk,
+    ).values_list('price', 'time_minute').first()
+
+
+def recipe_saved(sender, instance, created, raw, using, update_fields,
+                 **kwargs):
+    if raw:
+        return
+    # the stored values the next save is compared with
+    loaded = getattr(instance, '_stats_loaded', None)
+    if update_fields is None:
+        instance._stats_loaded = (instance.price, instance.time_minute)
+    elif loaded is not None:
+        instance._stats_loaded = (
+            instance.price if 'price' in update_fields else loaded[0],
+            instance.time_minute if 'time_minute' in update_fields
+            else loaded[1],
+        )
+    price, minutes = _cents(instance.price), int(instance.time_minute)
+    if created:
+        _apply(
+            instance.user_id, using, recipes=1,
+            price_total=Decimal(price) / 100, time_total=minutes,
+            counts=lambda: [
+                (RecipeStatsCount.PRICE, price, 1),
+                (RecipeStatsCount.TIME, minutes, 1),
+            ]
+        )
+        return
+    previous = instance.__dict__.pop('_stats_previous', None)
+    if previous is None:
+        return
+    old_price, old_minutes = _cents(previous[0]), previous[1]
+    if (old_price, old_minutes) == (price, minutes):
+        return
+    _apply(
+        instance.user_id, using,
+        price_total=Decimal(price - old_price) / 100,
+        time_total=minutes - old_minutes,
+        counts=lambda: [
+            (RecipeStatsCount.PRICE, old_price, -1),
+            (RecipeStatsCount.PRICE, price, 1),
+            (RecipeStatsCount.TIME, old_minutes, -1),
+            (RecipeStatsCount.TIME, minutes, 1),
+        ]
+    )
+
+
+def recipe_pre_delete(sender, instance, using, **kwargs):
+    """remove a recipe while its tag and ingredient links still exist"""
+    price, minutes = _cents(instance.price), int(instance.time_minute)
+
+    def counts():
+        yield RecipeStatsCount.PRICE, price, -1
+        yield RecipeStatsCount.TIME, minutes, -1
+        for kind, through, column in LINKS:
+            for value in through.objects.using(using).filter(
+                    recipe_id=instance.pk).values_list(column, flat=True):
+                yield kind, value, -1
+
+    _apply(
+        instance.user_id, using, recipes=-1,
+        price_total=-Decimal(price) / 100, time_total=-minutes,
+        counts=counts
+    )
+
+
+def links_changed(sender, instance, action, reverse, pk_set, using,
+                  **kwargs):
+    """count the recipes of tags and ingredients as they are linked"""
+    kind, through, column = next(
+        link for link in LINKS if link[1] is sender
+    )
+    if action == 'post_add':
+        if reverse:
+            def counts():
+                return [(kind, instance.pk, len(pk_set))]
+        else:
+            def counts():
+                return [(kind, value, 1) for value in pk_set]
+    elif action in ('pre_remove', 'pre_clear'):
+        # counted before the links go, remove() accepts unlinked ids
+        if reverse:
+            links = through.objects.using(using).filter(
+                **{column: instance.pk}
+            )
+            if action == 'pre_remove':
+                links = links.filter(recipe_id__in=pk_set)
+
+            def counts():
+                return [(kind, instance.pk, -links.count())]
+        else:
+            links = through.objects.using(using).filter(
+                recipe_id=instance.pk
+            )
+            if action == 'pre_remove':
+                links = links.filter(**{f'{column}__in': pk_set})
+
+            def counts():
+                return [
+                    (kind, value, -1)
+                    for value in links.values_list(column, flat=True)
+                ]
+    else:
+        return
+    _apply(instance.user_id, using, counts=counts)
+
+
+def member_deleted(sender, instance, using, **kwargs):
+    """forget a deleted tag or ingredient, its links go with it"""
+    kind = RecipeStatsCount.TAG if sender is Tag else \
+        RecipeStatsCount.INGREDIENT
+    RecipeStatsCount.objects.using(using).filter(
+        stats_id=instance.user_id, kind=kind, value=instance.pk
+    ).delete()
+
+
+def _median(counts):
+    """return the median of values given as sorted (value, count)"""
+    total = sum(count for _, count in counts)
+    if not total:
+        return None
+    positions = {(total - 1) // 2, total // 2}
+    middle, seen = [], 0
+    for value, count in counts:
+        middle.extend(
+            value for position in sorted(positions)
+            if seen <= position < seen + count
+        )
+        seen += count
+    return sum(middle) / len(middle) if len(middle) > 1 else middle[0]
+
+
+def _average(total, count):
+    return total / count if count else None
+
+
+def _top(stats, kind, model):
+    names = model.objects.filter(pk=OuterRef('value')).values('name')
+    return [
+        {'id': value, 'name': name, 'recipes': count}
+        for value, name, count in RecipeStatsCount.objects.using(
+            stats._state.db
+        ).filter(
+            stats=stats, kind=kind
+        ).annotate(name=Subquery(names)).order_by(
+            '-count', 'value'
+        ).values_list('value', 'name', 'count')[:TOP]
+    ]
+
+
+def summary(user_id):
+    """return the statistics of a user's recipes, building them if new"""
+    stats = RecipeStats.objects.filter(user_id=user_id).first()
+    if stats is None or not stats.built:
+        stats = rebuild(user_id, router.db_for_write(RecipeStats))
+    distributions = {RecipeStatsCount.PRICE: [], RecipeStatsCount.TIME: []}
+    for kind, value, count in RecipeStatsCount.objects.using(
+            stats._state.db).filter(
+            stats=stats, kind__in=distributions).order_by(
+            'kind', 'value').values_list('kind', 'value', 'count'):
+        distributions[kind].append((value, count))
+    prices = distributions[RecipeStatsCount.PRICE]
+    times = distributions[RecipeStatsCount.TIME]
+
+    histogram = [{'le': bound, 'recipes': 0} for bound in TIME_BUCKETS]
+    histogram.append({'le': None, 'recipes': 0})
+    for minutes, count in times:
+        bucket = next(
+            (i for i, bound in enumerate(TIME_BUCKETS) if minutes <= bound),
+            len(TIME_BUCKETS)
+        )
+        histogram[bucket]['recipes'] += count
+
+    median_price = _median(prices)
+    return {
+        'recipes': stats.recipes,
+        'price': {
+            'total': stats.price_total,
+            'average': _average(stats.price_total, stats.recipes),
+            'median': (
+                Decimal(median_price) / 100
+                if median_price is not None else None
+            ),
+        },
+        'time_minute': {
+            'total': stats.time_total,
+            'average': _average(stats.time_total, stats.recipes),
+            'median': _median(times),
+            'histogram': histogram,
+        },
+        'top_tags': _top(stats, RecipeStatsCount.TAG, Tag),
+        'top_ingredients': _top(
+            stats, RecipeStatsCount.INGREDIENT, Ingredient
+        ),
+        'updated_at': stats.updated_at,
+    }
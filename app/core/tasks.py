@@ -0,0 +1,13 @@
+from . import jobs
+from .deletion import purge_user as _purge_user
+from .models import User
+
+
+@jobs.task('core.purge_user')
+def purge_user(user_id, batch_size=500):
+    """purge a user marked for deletion"""
+    user = User.objects.filter(
+        pk=user_id, deletion_requested_at__isnull=False
+    ).first()
+    if user is not None:
+        _purge_user(user, batch_size)
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+# databases of tests reaching the shards of their users. Replicas mirror
+# the primary in tests and are left out, TestCase checks the constraints
+# of every database it is given and sqlite reports the tables locked by
+# the primary through a mirror
+SHARD_DATABASES = frozenset(settings.DATABASE_SHARDS)
+
+# for tests creating their fixtures without choosing the shard of the
+# user and reading them back through requests, which a replica can't see
+# inside the transaction of a TestCase. ShardDatabaseTest and
+# ReplicaDatabaseTest cover those setups
+single_database = override_settings(
+    DATABASE_SHARDS=['default'], DATABASE_REPLICAS={}
+)
+
+
+class QueryBudgetTestMixin:
+    """assertions on the number of queries run by a request"""
+
+    def assertConstantQueries(self, request, grow, sizes=(1, 10),
+                              max_queries=None):
+        """assert request runs the same queries however big fixtures get
+
+        grow(size) is called before each measurement to add fixtures
+        """
+        counts = []
+        for size in sizes:
+            grow(size)
+            with CaptureQueriesContext(connection) as queries:
+                request()
+            counts.append(len(queries))
+        self.assertEqual(
+            len(set(counts)), 1,
+            f'queries grew with the fixtures: {dict(zip(sizes, counts))}'
+        )
+        if max_queries is not None:
+            self.assertLessEqual(counts[0], max_queries)
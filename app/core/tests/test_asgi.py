@@ -0,0 +1,88 @@
+import asyncio
+import json
+import threading
+
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from core.models import Tag
+from ..asgi import AsyncReadHandler
+from ..testing import single_database
+
+TAGS_URL = reverse('recipes:tag-list')
+
+
+def scope(path, method='GET', token=None):
+    headers = [(b'host', b'testserver')]
+    if token:
+        headers.append((b'authorization', f'Token {token}'.encode()))
+    return {
+        'type': 'http', 'method': method, 'path': path, 'root_path': '',
+        'query_string': b'', 'headers': headers,
+    }
+
+
+def call(application, scope):
+    """return the status and body of an asgi request"""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    return messages[0]['status'], messages[1]['body']
+
+
+@single_database
+class AsyncReadHandlerTest(TransactionTestCase):
+
+    def setUp(self):
+        self.handler = AsyncReadHandler(threads=2)
+        self.addCleanup(self.handler.executor.shutdown)
+
+    def test_routes_reads_of_async_views(self):
+        """test only safe requests to views with async_reads use the pool"""
+        self.assertTrue(self.handler.is_async_read(scope(TAGS_URL)))
+        self.assertTrue(self.handler.is_async_read(
+            scope(reverse('recipes:recipe-detail', args=[1]))
+        ))
+        self.assertFalse(
+            self.handler.is_async_read(scope(TAGS_URL, method='POST'))
+        )
+        self.assertFalse(
+            self.handler.is_async_read(scope(reverse('users:user')))
+        )
+        self.assertFalse(self.handler.is_async_read(scope('/missing/')))
+
+    def test_read_served_on_pool(self):
+        """test a read runs the view on a pool thread"""
+        user = get_user_model().objects.create_user(
+            'test@xontel.com', 'test123456'
+        )
+        Tag.objects.create(user=user, name='Vegan')
+        token = Token.objects.create(user=user)
+        threads = []
+        get_response = self.handler.get_response_sync
+
+        def record_thread(*args):
+            threads.append(threading.current_thread().name)
+            return get_response(*args)
+
+        self.handler.get_response_sync = record_thread
+
+        status, body = call(self.handler, scope(TAGS_URL, token=token.key))
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)[0]['name'], 'Vegan')
+        self.assertTrue(threads[0].startswith('async-read'))
+
+    def test_unauthenticated_read(self):
+        """test errors of views served on the pool are returned"""
+        status, _ = call(self.handler, scope(TAGS_URL))
+
+        self.assertEqual(status, 401)
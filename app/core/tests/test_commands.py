@@ -1,7 +1,11 @@
+from io import StringIO
 from unittest.mock import patch
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, override_settings
+
+from core.models import User, Tag, Ingredient, Recipe
 
 
 class CommandTest(TestCase):
@@ -9,19 +13,71 @@ class CommandTest(TestCase):
     def test_wait_for_db_ready(self):
         """test waiting for db when db is available"""
         # mocking django behavior when creating a connection with db
-        # function called when retrieving db is __getitem__
+        # the command looks the connection up then tries to connect
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 1)
+            call_command('wait_for_db', stdout=StringIO())
+            self.assertEqual(gi.return_value.ensure_connection.call_count, 1)
 
     # this mock replaces the behavior of time.sleep
     # with a mock function that returns True to speed the test
     @patch('time.sleep', return_value=True)
     # ts is what returned from the patch decorator passed as arg
     def test_wait_for_db(self, ts):
-        """test waiting for db"""
+        """test waiting for db backs off between attempts"""
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            connect = gi.return_value.ensure_connection
+            connect.side_effect = [OperationalError] * 5 + [None]
+            call_command('wait_for_db', stdout=StringIO())
+            self.assertEqual(connect.call_count, 6)
+            self.assertEqual(
+                [c[0][0] for c in ts.call_args_list],
+                [1, 2, 4, 5, 5]
+            )
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_timeout(self, ts):
+        """test waiting for db gives up after the timeout"""
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
+            gi.return_value.ensure_connection.side_effect = OperationalError
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=0, stdout=StringIO())
+
+
+# routing to shards is tested in test_sharding.ShardDatabaseTest
+@override_settings(DATABASE_SHARDS=['default'])
+class GenerateDataCommandTest(TestCase):
+
+    def generate(self, **options):
+        call_command('generate_data', stdout=StringIO(), **options)
+
+    def test_generate_fixed_counts(self):
+        """test fixed distribution creates the exact number of rows"""
+        self.generate(
+            users=3, recipes=4, tags=2, ingredients=5,
+            tags_per_recipe=2, ingredients_per_recipe=3,
+            distribution='fixed'
+        )
+
+        self.assertEqual(User.objects.count(), 3)
+        self.assertEqual(Tag.objects.count(), 6)
+        self.assertEqual(Ingredient.objects.count(), 15)
+        self.assertEqual(Recipe.objects.count(), 12)
+        recipe = Recipe.objects.first()
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertEqual(recipe.ingredients.count(), 3)
+        self.assertEqual(recipe.tags.first().user, recipe.user)
+
+    def test_generate_deterministic_by_seed(self):
+        """test the same seed generates the same data"""
+        def titles():
+            return list(
+                Recipe.objects.order_by('id').values_list('title', 'price')
+            )
+
+        self.generate(users=5, seed=7)
+        first = titles()
+        User.objects.all().delete()
+        self.generate(users=5, seed=7)
+
+        self.assertTrue(first)
+        self.assertEqual(titles(), first)
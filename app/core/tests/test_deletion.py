@@ -0,0 +1,104 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from rest_framework.authtoken.models import Token
+
+from ..deletion import schedule_user_deletion, purge_user
+from ..models import Tag, Ingredient, Recipe, Job
+from ..testing import single_database
+
+
+def create_user(email='test@xontel.com'):
+    return get_user_model().objects.create_user(email, 'test123456')
+
+
+def create_recipe(user, **params):
+    return Recipe.objects.create(
+        user=user, title='Soup', time_minute=5, price=2, **params
+    )
+
+
+@single_database
+class DeletionTest(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+
+    def test_schedule_user_deletion(self):
+        """test the user is locked out before any row is deleted"""
+        Token.objects.create(user=self.user)
+        create_recipe(self.user)
+
+        schedule_user_deletion(self.user)
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deletion_requested_at)
+        self.assertFalse(Token.objects.exists())
+        self.assertTrue(Recipe.objects.exists())
+        self.assertEqual(
+            Job.objects.get().kwargs, {'user_id': self.user.pk}
+        )
+
+    def test_purge_user_in_batches(self):
+        """test all rows of the user go and other users are untouched"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        for _ in range(5):
+            recipe = create_recipe(self.user)
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+        other = create_user('other@xontel.com')
+        create_recipe(other).tags.add(
+            Tag.objects.create(user=other, name='Dessert')
+        )
+
+        with self.assertLogs('core.deletion') as logs:
+            counts = purge_user(self.user, batch_size=2)
+
+        self.assertEqual(
+            logs.output,
+            [f'INFO:core.deletion:purged user {self.user.pk}: {counts}']
+        )
+        self.assertEqual(
+            counts, {'recipes': 5, 'tags': 1, 'ingredients': 1, 'images': 0}
+        )
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        )
+        self.assertEqual(Recipe.tags.through.objects.count(), 1)
+        self.assertEqual(Recipe.objects.get().user, other)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_purge_removes_images(self):
+        """test recipe images are deleted with their recipes"""
+        recipe = create_recipe(self.user, image=SimpleUploadedFile(
+            'soup.jpg', b'jpeg'
+        ))
+        path = recipe.image.path
+        self.assertTrue(os.path.exists(path))
+
+        with self.assertLogs('core.deletion'):
+            counts = purge_user(self.user)
+
+        self.assertEqual(counts['images'], 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_purge_deleted_users_command(self):
+        """test the command only purges users marked for deletion"""
+        create_recipe(self.user)
+        schedule_user_deletion(self.user)
+        create_recipe(create_user('other@xontel.com'))
+
+        with self.assertLogs('core.deletion') as logs:
+            call_command('purge_deleted_users', stdout=StringIO())
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertEqual(get_user_model().objects.count(), 1)
+        self.assertEqual(Recipe.objects.count(), 1)
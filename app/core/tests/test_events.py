@@ -0,0 +1,204 @@
+import asyncio
+import os
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe, Tag
+from .. import events
+from ..testing import SHARD_DATABASES
+
+
+def sample_user(email='test@xontel.com'):
+    return get_user_model().objects.create_user(email, 'test123456')
+
+
+class EventStoreTest(TestCase):
+
+    def test_locmem_store(self):
+        """test events are kept for the retention time, by user"""
+        store = events.LocMemEventStore()
+        first = store.append(1, {'type': 'tag.created'}, now=0)
+        store.append(2, {'type': 'tag.created'}, now=1)
+
+        self.assertEqual(
+            store.since(0, user_id=1), [(first, 1, {'type': 'tag.created'})]
+        )
+        with self.settings(EVENTS_RETENTION_SECONDS=10):
+            last = store.append(1, {'type': 'tag.deleted'}, now=12)
+
+        self.assertEqual([e[0] for e in store.since(0)], [last])
+        self.assertEqual(store.last_id(), last)
+
+    def test_sqlite_store_shared(self):
+        """test stores on the same file see each other's events"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.sqlite3')
+            writer = events.SQLiteEventStore(path)
+            reader = events.SQLiteEventStore(path)
+
+            first = writer.append(1, {'type': 'recipe.updated', 'id': 3})
+            writer.clear()
+            second = writer.append(1, {'type': 'recipe.deleted', 'id': 3})
+
+            self.assertGreater(second, first)
+            self.assertEqual(reader.last_id(), second)
+            self.assertEqual(
+                reader.since(first),
+                [(second, 1, {'type': 'recipe.deleted', 'id': 3})]
+            )
+
+
+@override_settings(EVENTS_STORE='locmem')
+class PublishTest(TestCase):
+
+    def setUp(self):
+        self.store = events.get_store()
+        self.store.clear()
+        self.start = self.store.last_id()
+        self.user = sample_user()
+
+    def published(self):
+        return [event for _, _, event in self.store.since(self.start)]
+
+    def test_changes_published_on_commit(self):
+        """test model changes are published once committed"""
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(user=self.user, name='Vegan')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                user=self.user, title='Cake', time_minute=5, price=5
+            )
+            recipe.tags.add(tag)
+            recipe.title = 'Cheese cake'
+            recipe.save()
+        tag_id = tag.id
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.delete()
+
+        # the link and the save in one transaction are one update
+        self.assertEqual(self.published(), [
+            {'type': 'tag.created', 'id': tag_id},
+            {'type': 'recipe.created', 'id': recipe.id},
+            {'type': 'recipe.updated', 'id': recipe.id},
+            {'type': 'tag.deleted', 'id': tag_id},
+        ])
+
+    def test_rolled_back_changes_not_published(self):
+        """test changes of a rolled back savepoint are not published"""
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Tag.objects.create(user=self.user, name='Vegan')
+                    raise ValueError
+            except ValueError:
+                pass
+
+        self.assertEqual(self.published(), [])
+
+    def test_muted(self):
+        """test nothing is published while muted"""
+        with self.captureOnCommitCallbacks(execute=True), events.muted():
+            Tag.objects.create(user=self.user, name='Vegan')
+
+        self.assertEqual(self.published(), [])
+
+
+def scope(query_string=b'', headers=()):
+    return {
+        'type': 'http', 'method': 'GET', 'path': '/api/recipes/events/',
+        'root_path': '', 'query_string': query_string,
+        'headers': [(b'host', b'testserver')] + list(headers),
+    }
+
+
+@override_settings(EVENTS_STORE='locmem', EVENTS_POLL_INTERVAL=0.05)
+class EventStreamTest(TransactionTestCase):
+    databases = SHARD_DATABASES
+
+    def setUp(self):
+        events.get_store().clear()
+        self.user = sample_user()
+        self.token = Token.objects.create(user=self.user).key
+
+    def stream(self, scope, until, during=None):
+        """run a stream until a body contains until, return the bodies"""
+        bodies = []
+
+        async def main():
+            received = asyncio.Event()
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                bodies.append(message.get('body', b''))
+                if until in message.get('body', b''):
+                    received.set()
+
+            task = asyncio.ensure_future(
+                events.EventStream()(scope, receive, send)
+            )
+            if during is not None:
+                while self.user.pk not in events.hub._subscriptions:
+                    await asyncio.sleep(0.01)
+                await asyncio.get_running_loop().run_in_executor(
+                    None, during
+                )
+            await asyncio.wait_for(received.wait(), 5)
+            disconnect.set()
+            await asyncio.wait_for(task, 5)
+
+        asyncio.run(main())
+        return b''.join(bodies)
+
+    def test_stream_live_changes(self):
+        """test changes of the user are pushed to their stream"""
+        other = sample_user('other@xontel.com')
+
+        def change():
+            Tag.objects.create(user=other, name='Other')
+            Tag.objects.create(user=self.user, name='Vegan')
+
+        body = self.stream(
+            scope(b'token=' + self.token.encode()), b'event: tag.created',
+            during=change
+        )
+
+        tag = Tag.objects.get(name='Vegan')
+        self.assertTrue(body.startswith(b'retry: '))
+        self.assertIn(f'"id": {tag.id}'.encode(), body)
+        self.assertEqual(body.count(b'event: '), 1)
+
+    def test_stream_resumes_from_last_event_id(self):
+        """test a reconnecting client gets the events it missed"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        last_id = events.get_store().last_id()
+        Tag.objects.filter(user=self.user).delete()
+
+        body = self.stream(
+            scope(headers=[
+                (b'authorization', f'Token {self.token}'.encode()),
+                (b'last-event-id', str(last_id).encode()),
+            ]),
+            b'event: tag.deleted'
+        )
+
+        self.assertNotIn(b'tag.created', body)
+        self.assertIn(f'id: {last_id + 1}\n'.encode(), body)
+
+    def test_stream_requires_token(self):
+        """test streams are refused without a valid token"""
+        bodies = []
+
+        async def send(message):
+            bodies.append(message)
+
+        asyncio.run(events.EventStream()(scope(b'token=wrong'), None, send))
+
+        self.assertEqual(bodies[0]['status'], 401)
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from ..generations import LocMemGenerationStore, SQLiteGenerationStore
+
+
+class GenerationStoreTest(SimpleTestCase):
+
+    def test_bump(self):
+        """test counters start at 0 and count the bumps"""
+        store = LocMemGenerationStore()
+
+        self.assertEqual(store.get('key'), 0)
+        self.assertEqual(store.bump('key'), 1)
+        self.assertEqual(store.bump('key'), 2)
+        self.assertEqual(store.get('other'), 0)
+
+    def test_sqlite_generations_shared(self):
+        """test a bump is seen by another store on the same file"""
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        store = SQLiteGenerationStore(path)
+        other = SQLiteGenerationStore(path)
+
+        store.bump('key')
+
+        self.assertEqual(other.get('key'), 1)
+        self.assertEqual(other.bump('key'), 2)
+        self.assertEqual(store.get('key'), 2)
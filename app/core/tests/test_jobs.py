@@ -0,0 +1,141 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from .. import jobs
+from ..deletion import schedule_user_deletion
+from ..models import Job
+from ..testing import SHARD_DATABASES
+
+calls = []
+
+
+@jobs.task('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@jobs.task('tests.fail')
+def fail():
+    raise ValueError('broken')
+
+
+@jobs.task('tests.long')
+def long_running(taken_over=False):
+    if taken_over:
+        # another worker claims the job after the lease expired
+        Job.objects.update(worker='other', attempts=F('attempts') + 1)
+    jobs.heartbeat()
+    calls.append(Job.objects.get().locked_until)
+
+
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_claim_ready_jobs_once(self):
+        """test a job is handed to a single worker"""
+        job = jobs.enqueue('tests.record', value=1)
+        jobs.enqueue('tests.record', delay=60, value=2)
+
+        self.assertEqual(jobs.claim('a', limit=5), [job])
+        self.assertEqual(jobs.claim('b', limit=5), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.worker, 'a')
+        self.assertEqual(job.attempts, 1)
+
+    def test_run_job(self):
+        """test a claimed job runs with its arguments"""
+        jobs.enqueue('tests.record', value='x')
+        job, = jobs.claim('a')
+
+        self.assertEqual(jobs.run(job), Job.DONE)
+        self.assertEqual(calls, ['x'])
+        job.refresh_from_db()
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failed_job_retried_with_backoff(self):
+        """test failures are retried later until max attempts"""
+        jobs.enqueue('tests.fail', max_attempts=2)
+        job, = jobs.claim('a')
+
+        with self.assertLogs('core.jobs', 'ERROR') as logs:
+            self.assertEqual(jobs.run(job), Job.PENDING)
+        self.assertIn('job tests.fail', logs.output[0])
+        self.assertIn('ValueError: broken', logs.output[0])
+        job.refresh_from_db()
+        self.assertIn('broken', job.error)
+        self.assertGreater(job.run_at, timezone.now())
+
+        Job.objects.update(run_at=timezone.now())
+        job, = jobs.claim('a')
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(jobs.run(job), Job.FAILED)
+
+    def test_expired_lease_reclaimed(self):
+        """test jobs of a dead worker are picked up again"""
+        jobs.enqueue('tests.record', value=1)
+        jobs.claim('dead')
+        Job.objects.update(locked_until=timezone.now() - timedelta(1))
+
+        job, = jobs.claim('alive')
+
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(jobs.run(job), Job.DONE)
+
+    def test_heartbeat_extends_lease(self):
+        """test long jobs keep their lease while they run"""
+        jobs.enqueue('tests.long')
+        job, = jobs.claim('a', lease=60)
+        Job.objects.update(locked_until=timezone.now())
+        job.locked_until = timezone.now()
+
+        self.assertEqual(jobs.run(job), Job.DONE)
+        self.assertGreater(calls[0], timezone.now() + timedelta(seconds=50))
+
+    def test_lost_lease_stops_job(self):
+        """test a job claimed again is left to its new worker"""
+        jobs.enqueue('tests.long', taken_over=True)
+        job, = jobs.claim('a', lease=0)
+
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(jobs.run(job), Job.RUNNING)
+        self.assertEqual(calls, [])
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.worker, 'other')
+
+    def test_unknown_job_fails(self):
+        """test jobs without a registered task aren't retried"""
+        jobs.enqueue('tests.missing')
+        job, = jobs.claim('a')
+
+        with self.assertLogs('core.jobs', 'ERROR') as logs:
+            self.assertEqual(jobs.run(job), Job.FAILED)
+        self.assertIn('no task registered as tests.missing', logs.output[0])
+
+
+class RunWorkerCommandTest(TransactionTestCase):
+    databases = SHARD_DATABASES
+
+    def test_run_worker_burst(self):
+        """test the worker runs queued jobs and exits when idle"""
+        user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456'
+        )
+        schedule_user_deletion(user)
+        jobs.enqueue('tests.record', value=1)
+
+        with self.assertLogs('core.deletion'):
+            call_command('run_worker', burst=True, stdout=StringIO())
+
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
+        self.assertFalse(get_user_model().objects.exists())
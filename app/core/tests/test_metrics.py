@@ -0,0 +1,98 @@
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from .. import metrics
+from ..testing import single_database
+
+METRICS_URL = reverse('metrics')
+
+
+class MetricsRegistryTest(TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.counter = self.registry.counter(
+            'jobs_total', 'Jobs run.', ('queue',)
+        )
+        self.histogram = self.registry.histogram(
+            'job_seconds', 'Job duration.', buckets=(1, 5)
+        )
+
+    def test_counter_and_histogram_exposition(self):
+        """test metrics are rendered in the prometheus text format"""
+        self.counter.inc(queue='default')
+        self.counter.inc(2, queue='default')
+        self.histogram.observe(0.5)
+        self.histogram.observe(3)
+        self.histogram.observe(7)
+
+        text = metrics.render(self.registry.snapshot())
+
+        self.assertIn('# TYPE jobs_total counter', text)
+        self.assertIn('jobs_total{queue="default"} 3.0', text)
+        self.assertIn('job_seconds_bucket{le="1.0"} 1.0', text)
+        self.assertIn('job_seconds_bucket{le="5.0"} 2.0', text)
+        self.assertIn('job_seconds_bucket{le="+Inf"} 3.0', text)
+        self.assertIn('job_seconds_sum 10.5', text)
+        self.assertIn('job_seconds_count 3.0', text)
+
+    def test_duplicate_metric_rejected(self):
+        """test a metric name can only be registered once"""
+        with self.assertRaises(ValueError):
+            self.registry.counter('jobs_total', 'Jobs run.')
+
+    def test_worker_snapshots_merged(self):
+        """test snapshots of several workers are summed"""
+        other = metrics.Registry()
+        other_counter = other.counter('jobs_total', 'Jobs run.', ('queue',))
+        self.counter.inc(queue='default')
+        other_counter.inc(4, queue='default')
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.registry.write_snapshot(directory, worker='1')
+            other.write_snapshot(directory, worker='2')
+            merged = metrics.merge_snapshots(
+                metrics.read_snapshots(directory)
+            )
+
+        self.assertEqual(
+            merged['jobs_total']['samples'],
+            [[['default'], 5]]
+        )
+
+
+@single_database
+class MetricsEndpointTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456'
+        )
+        self.client.force_authenticate(self.user)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_metrics_disabled(self):
+        """test metrics are not exposed unless enabled"""
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 404)
+
+    @override_settings(METRICS_ENABLED=True, METRICS_DIR=None)
+    def test_request_latency_recorded(self):
+        """test requests are recorded per view and action"""
+        self.client.get(reverse('recipes:tag-list'))
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(
+            'http_request_duration_seconds_count{view="TagViewSet.list"',
+            res.content.decode()
+        )
@@ -0,0 +1,91 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from core.testing import single_database
+
+RECIPES_URL = reverse('recipes:recipe-list')
+
+
+@single_database
+class RequestProfilingMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456'
+        )
+        self.client.force_authenticate(self.user)
+        Recipe.objects.create(
+            user=self.user,
+            title='CheeseCake',
+            time_minute=20,
+            price=20.00
+        )
+
+    @override_settings(REQUEST_PROFILING=True)
+    def test_server_timing_header(self):
+        """test profiled requests report their timings"""
+        with self.assertLogs('core.middleware', 'INFO') as logs:
+            res = self.client.get(RECIPES_URL)
+
+        timing = res['Server-Timing']
+        for metric in ('db;', 'serializer;', 'render;', 'total;'):
+            self.assertIn(metric, timing)
+        profile = logs.records[0].profile
+        self.assertEqual(profile['view'], 'RecipeViewSet.list')
+        self.assertGreater(profile['queries'], 0)
+        self.assertGreater(profile['serializer_ms'], 0)
+
+    @override_settings(REQUEST_PROFILING=False)
+    def test_profiling_disabled(self):
+        """test requests are not profiled unless enabled"""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+
+@override_settings(LEAN_PATH_PREFIXES=['/api/'])
+@single_database
+class PathDispatchMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(
+            'admin@xontel.com',
+            'test123456'
+        )
+
+    def test_api_skips_browser_middleware(self):
+        """test api requests run without session, csrf or frame options"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('X-Frame-Options', res)
+        self.assertFalse(hasattr(res.wsgi_request, 'session'))
+
+    def test_admin_keeps_full_stack(self):
+        """test the admin still gets sessions, csrf and messages"""
+        self.client.force_login(self.user)
+
+        res = self.client.get(reverse('admin:core_user_changelist'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['X-Frame-Options'], 'DENY')
+        self.assertEqual(res.wsgi_request.user, self.user)
+        self.assertIn('csrftoken', res.cookies)
+
+    def test_admin_csrf_enforced(self):
+        """test csrf checks still run for the admin"""
+        self.client = self.client_class(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+
+        res = self.client.post(reverse('admin:core_user_changelist'), {})
+
+        self.assertEqual(res.status_code, 403)
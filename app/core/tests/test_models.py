@@ -1,6 +1,7 @@
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from .. import models
+from ..testing import SHARD_DATABASES
 from unittest.mock import patch
 
 
@@ -10,6 +11,7 @@ def sample_user(email='test@xontel.com', password='test123456'):
 
 
 class ModelTest(TestCase):
+    databases = SHARD_DATABASES
 
     def test_create_user_with_email_successful(self):
         """test creating a new user with an email is successful"""
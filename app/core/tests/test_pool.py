@@ -0,0 +1,117 @@
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+
+from ..db.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def test_connections_reused(self):
+        """test released connections are handed out again"""
+        pool = ConnectionPool()
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection)
+
+        self.assertIs(pool.acquire(FakeConnection), connection)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_pool_size_limited(self):
+        """test acquiring past max_size times out"""
+        pool = ConnectionPool(max_size=1, timeout=0)
+        pool.acquire(FakeConnection)
+
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(FakeConnection)
+
+    def test_dead_connection_replaced(self):
+        """test idle connections failing the ping are replaced"""
+        pool = ConnectionPool(ping=lambda c: False, ping_interval=0)
+        dead = pool.acquire(FakeConnection)
+        pool.release(dead)
+
+        connection = pool.acquire(FakeConnection)
+
+        self.assertIsNot(connection, dead)
+        self.assertTrue(dead.closed)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_old_connection_recycled(self):
+        """test connections older than max_lifetime are closed"""
+        pool = ConnectionPool(max_lifetime=60)
+        with patch('time.monotonic', return_value=0):
+            old = pool.acquire(FakeConnection)
+        with patch('time.monotonic', return_value=61):
+            pool.release(old)
+
+        self.assertTrue(old.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_failed_reset_discards(self):
+        """test connections that can't be reset are not reused"""
+        pool = ConnectionPool(reset=lambda c: False)
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection)
+
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_fork_forgets_parent_connections(self):
+        """test a forked child opens its own connections"""
+        pool = ConnectionPool()
+        parent = pool.acquire(FakeConnection)
+        pool.release(parent)
+
+        with patch('os.getpid', return_value=-1):
+            child = pool.acquire(FakeConnection)
+
+        self.assertIsNot(child, parent)
+        self.assertFalse(parent.closed)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs PostgreSQL')
+class PooledBackendTest(TransactionTestCase):
+
+    def current_database(self, wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT current_database()')
+            return cursor.fetchone()[0]
+
+    def test_closed_connection_reused(self):
+        """test closing returns the session to the pool of its database"""
+        wrapper = connection.copy()
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+
+        wrapper.ensure_connection()
+
+        self.assertIs(wrapper.connection, raw)
+        wrapper.close()
+
+    def test_pools_keyed_by_database(self):
+        """test sessions of another database are never handed out"""
+        wrapper = connection.copy()
+        wrapper.ensure_connection()
+        wrapper.close()
+        other = connection.copy()
+        other.settings_dict['NAME'] = 'postgres'
+
+        self.assertIsNot(other.pool, wrapper.pool)
+        self.assertEqual(self.current_database(other), 'postgres')
+        self.assertEqual(
+            self.current_database(wrapper), connection.settings_dict['NAME']
+        )
+        other.close()
+        wrapper.close()
@@ -0,0 +1,58 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from recipes.views import TagViewSet
+from ..query_budget import QueryBudgetExceeded, QueryLog, check_budget
+from ..testing import single_database
+
+TAGS_URL = reverse('recipes:tag-list')
+
+
+@override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_RAISE=True)
+@single_database
+class QueryBudgetMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_within_budget(self):
+        """test requests within their budget pass"""
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+    @patch.object(TagViewSet, 'query_budget', {'list': 0})
+    def test_budget_exceeded_raises(self):
+        """test requests over their budget raise"""
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(TAGS_URL)
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    @patch.object(TagViewSet, 'query_budget', {'list': 0})
+    def test_budget_exceeded_logged(self):
+        """test budget problems are only logged when not raising"""
+        with self.assertLogs('core.query_budget', 'WARNING'):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, 200)
+
+
+class CheckBudgetTest(TestCase):
+
+    def test_repeated_queries_detected(self):
+        """test the same query repeated past the limit is reported"""
+        log = QueryLog()
+        log.statements = ['SELECT 1'] + ['SELECT %s'] * 4
+
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'repeated'):
+            check_budget(log, 10, 3, 'TestView.list', True)
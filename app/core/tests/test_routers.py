@@ -0,0 +1,163 @@
+import contextvars
+import os
+import tempfile
+from collections import Counter
+from unittest import skipUnless
+
+from django.conf import settings
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .. import routers
+from ..models import Tag
+from ..testing import SHARD_DATABASES
+
+TAGS_URL = reverse('recipes:tag-list')
+USER_URL = reverse('users:user')
+
+
+class ReplicaRouterTest(TestCase):
+
+    @override_settings(DATABASE_REPLICAS={'replica1': 3, 'replica2': 1})
+    def test_weighted_round_robin(self):
+        """test replicas are picked proportionally to their weight"""
+        picks = Counter(routers.choose_replica() for _ in range(8))
+
+        self.assertEqual(picks, {'replica1': 6, 'replica2': 2})
+
+    def test_reads_use_primary_by_default(self):
+        """test reads outside replica safe requests aren't routed"""
+        router = routers.ReplicaRouter()
+
+        self.assertIsNone(router.db_for_read(None))
+        self.assertIsNone(router.db_for_write(None))
+
+    @override_settings(DATABASE_REPLICAS={'replica1': 1})
+    def test_authentication_reads_primary(self):
+        """test tokens and users aren't read from the replica"""
+        router = routers.ReplicaRouter()
+        token = routers.use_replica('replica1')
+        self.addCleanup(routers.reset_replica, token)
+
+        self.assertIsNone(router.db_for_read(Token))
+        self.assertIsNone(router.db_for_read(get_user_model()))
+        self.assertEqual(router.db_for_read(Tag), 'replica1')
+
+    def test_reset_from_other_context(self):
+        """test the replica is cleared by a token of another context"""
+        token = contextvars.copy_context().run(
+            routers.use_replica, 'replica1'
+        )
+        # as asgi copies the value set in process_view back
+        routers.use_replica('replica1')
+
+        routers.reset_replica(token)
+
+        self.assertIsNone(routers.current_replica())
+
+    @override_settings(DATABASE_REPLICAS={'replica1': 1})
+    def test_writes_leave_replicas(self):
+        """test instances read from a replica are saved on the primary"""
+        router = routers.ReplicaRouter()
+        tag = Tag()
+        tag._state.db = 'replica1'
+
+        self.assertEqual(router.db_for_write(Tag, instance=tag), 'default')
+
+    @override_settings(DATABASE_REPLICAS={'replica1': 1})
+    def test_replicas_not_migrated(self):
+        """test migrations only run on the primary"""
+        router = routers.ReplicaRouter()
+
+        self.assertFalse(router.allow_migrate('replica1', 'core'))
+        self.assertIsNone(router.allow_migrate('default', 'core'))
+
+
+class PinStoreTest(TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def test_pin_expires(self):
+        """test pins only last the given seconds"""
+        store = routers.LocMemPinStore()
+        store.pin('client', 5, now=100)
+
+        self.assertTrue(store.is_pinned('client', now=104))
+        self.assertFalse(store.is_pinned('client', now=106))
+        self.assertFalse(store.is_pinned('other', now=104))
+
+    def test_sqlite_pins_shared(self):
+        """test a pin is seen by another store on the same file"""
+        routers.SQLitePinStore(self.path).pin('client', 5, now=100)
+        other = routers.SQLitePinStore(self.path)
+
+        self.assertTrue(other.is_pinned('client', now=104))
+        self.assertFalse(other.is_pinned('client', now=106))
+
+
+# the primary doubles as replica so requests can run on a single database
+@override_settings(DATABASE_REPLICAS={'default': 1})
+class ReplicaRoutingMiddlewareTest(TestCase):
+    databases = SHARD_DATABASES
+
+    def setUp(self):
+        routers.get_pin_store().clear()
+        self.user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456'
+        )
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_safe_reads_use_replica(self):
+        """test reads of replica safe views are sent to a replica"""
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.wsgi_request.db_replica, 'default')
+        self.assertIsNone(routers.current_replica())
+
+    def test_other_views_use_primary(self):
+        """test views without use_replicas read from the primary"""
+        res = self.client.get(USER_URL)
+
+        self.assertFalse(hasattr(res.wsgi_request, 'db_replica'))
+
+    def test_read_your_writes(self):
+        """test clients read from the primary right after writing"""
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertFalse(hasattr(res.wsgi_request, 'db_replica'))
+        self.assertEqual(res.data[0]['name'], 'Vegan')
+
+
+# run with real replicas, e.g. on two SQLite databases:
+# DB_SQLITE_DIR=/tmp/db DB_REPLICAS=replica python manage.py test core
+@skipUnless(settings.DATABASE_REPLICAS, 'no read replica configured')
+class ReplicaDatabaseTest(TransactionTestCase):
+    databases = '__all__'
+
+    def test_reads_served_by_replica(self):
+        """test written rows are read back through a replica"""
+        user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456'
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        client.post(TAGS_URL, {'name': 'Vegan'})
+        routers.get_pin_store().clear()
+
+        res = client.get(TAGS_URL)
+
+        self.assertIn(res.wsgi_request.db_replica, settings.DATABASE_REPLICAS)
+        self.assertEqual(res.data[0]['name'], 'Vegan')
@@ -0,0 +1,121 @@
+import os
+import socket
+import threading
+import time
+from unittest.mock import patch
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.test import TestCase
+from django.urls import reverse
+
+from ..server import PooledWSGIServer, PreforkServer, warmup
+
+
+def hello(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'hello']
+
+
+def start_server(**kwargs):
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(8)
+    sock.setblocking(False)
+    server = PooledWSGIServer(sock, hello, **kwargs)
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+    return server, thread, sock
+
+
+class ServerTest(TestCase):
+
+    def test_warmup_requests_recipes_routes(self):
+        """test warmup runs the recipes routes without any query"""
+        from app.wsgi import application
+
+        with self.assertNumQueries(0):
+            paths = warmup(application)
+
+        self.assertIn(reverse('recipes:recipe-list'), paths)
+        self.assertIn(reverse('recipes:tag-list'), paths)
+
+    def test_pooled_server_max_requests(self):
+        """test the server answers and stops after max requests"""
+        server, thread, sock = start_server(threads=2, max_requests=2)
+        url = 'http://127.0.0.1:%d/' % sock.getsockname()[1]
+
+        bodies = [urlopen(url, timeout=5).read() for _ in range(2)]
+        thread.join(5)
+        sock.close()
+
+        self.assertEqual(bodies, [b'hello', b'hello'])
+        self.assertFalse(thread.is_alive())
+
+    def test_idle_connections_time_out(self):
+        """test idle clients can't keep the threads from other requests"""
+        server, thread, sock = start_server(threads=1, request_timeout=0.2)
+        address = sock.getsockname()
+        idle = [socket.create_connection(address) for _ in range(2)]
+
+        try:
+            body = urlopen('http://%s:%d/' % address, timeout=5).read()
+        finally:
+            for connection in idle:
+                connection.close()
+            server.stop()
+            thread.join(5)
+            sock.close()
+
+        self.assertEqual(body, b'hello')
+
+    def test_large_body_refused(self):
+        """test bodies over max_body_size are answered with 413"""
+        server, thread, sock = start_server(threads=1, max_body_size=4)
+        url = 'http://127.0.0.1:%d/' % sock.getsockname()[1]
+
+        try:
+            with self.assertRaises(HTTPError) as cm:
+                urlopen(Request(url, data=b'hello'), timeout=5)
+            body = urlopen(Request(url, data=b'hi'), timeout=5).read()
+        finally:
+            server.stop()
+            thread.join(5)
+            sock.close()
+
+        self.assertEqual(cm.exception.code, 413)
+        self.assertEqual(body, b'hello')
+
+
+class PreforkServerTest(TestCase):
+
+    @patch('core.server.time.monotonic', return_value=100)
+    def test_crashing_workers_respawn_with_backoff(self, monotonic):
+        """test workers failing at start are respawned later and later"""
+        server = PreforkServer(
+            '127.0.0.1:0', respawn_delay=1, max_respawn_delay=4
+        )
+
+        with self.assertLogs('core.server', 'WARNING'):
+            for _ in range(4):
+                server.schedule_respawn(failed=True, lifetime=0.1)
+        # a worker exiting cleanly or after a while isn't a crash loop
+        server.schedule_respawn(failed=False, lifetime=0.1)
+        server.schedule_respawn(failed=True, lifetime=60)
+
+        self.assertEqual(server.respawns, [101, 102, 104, 104, 100, 100])
+
+    def test_retired_workers_not_respawned(self):
+        """test workers stopped by a reload aren't replaced"""
+        server = PreforkServer('127.0.0.1:0', graceful_timeout=5)
+        pid = os.fork()
+        if not pid:
+            time.sleep(30)
+            os._exit(0)
+
+        server.retire([pid])
+        server.wait_retired()
+        server.reap(respawn=True)
+
+        self.assertEqual(server.retiring, {})
+        self.assertEqual(server.respawns, [])
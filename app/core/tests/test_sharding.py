@@ -0,0 +1,169 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from .. import generations, sharding
+from ..models import Tag, Ingredient, Recipe, ShardAssignment
+from ..routers import ShardRouter
+from ..testing import SHARD_DATABASES
+
+TAGS_URL = reverse('recipes:tag-list')
+SHARDS = ['default', 'shard1']
+
+
+def create_user(email='test@xontel.com'):
+    return get_user_model().objects.create_user(email, 'test123456')
+
+
+class ShardingTest(TestCase):
+    databases = SHARD_DATABASES
+
+    def setUp(self):
+        sharding.forget_assignment()
+
+    @override_settings(DATABASE_SHARDS=['default'])
+    def test_single_shard_is_default(self):
+        """test users aren't assigned without extra shards"""
+        user = create_user()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(sharding.shard_for_user(user.pk), 'default')
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_assignment_is_stored(self):
+        """test users keep the shard picked on their first lookup"""
+        user = create_user()
+        expected = SHARDS[user.pk % 2]
+
+        self.assertEqual(sharding.shard_for_user(user.pk), expected)
+        ShardAssignment.objects.filter(user=user).update(shard='other')
+        sharding.forget_assignment(user.pk)
+        self.assertEqual(sharding.shard_for_user(user.pk), 'other')
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_assignment_is_cached(self):
+        """test repeated lookups don't query until the assignment changes"""
+        user = create_user()
+        sharding.shard_for_user(user.pk)
+
+        with self.assertNumQueries(0):
+            sharding.shard_for_user(user.pk)
+        ShardAssignment.objects.filter(user=user).update(shard='other')
+        self.assertNotEqual(sharding.shard_for_user(user.pk), 'other')
+        ShardAssignment.objects.update_or_create(
+            user=user, defaults={'shard': 'shard1'}
+        )
+        self.assertEqual(sharding.shard_for_user(user.pk), 'shard1')
+
+    @override_settings(DATABASE_SHARDS=SHARDS)
+    def test_router_uses_instance_user(self):
+        """test writes follow the user of the instance"""
+        user = create_user()
+        ShardAssignment.objects.create(user=user, shard='shard1')
+        router = ShardRouter()
+
+        self.assertEqual(
+            router.db_for_write(Tag, instance=Tag(user=user)), 'shard1'
+        )
+        self.assertEqual(router.db_for_read(Recipe, instance=user), 'shard1')
+        self.assertIsNone(router.db_for_write(get_user_model()))
+
+    def test_router_uses_current_shard(self):
+        """test queries without hints go to the active shard"""
+        router = ShardRouter()
+        token = sharding.activate('shard1')
+        try:
+            self.assertEqual(router.db_for_read(Ingredient), 'shard1')
+        finally:
+            sharding.deactivate(token)
+
+        self.assertIsNone(router.db_for_read(Ingredient))
+
+    @override_settings(DATABASE_SHARDS=['default'])
+    def test_view_activates_user_shard(self):
+        """test the shard is only active during the request"""
+        client = APIClient()
+        client.force_authenticate(create_user())
+
+        res = client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(Tag.objects.get(id=res.data['id']).name, 'Vegan')
+        self.assertIsNone(sharding.current_shard())
+
+
+# run with real shards, e.g. on several SQLite databases:
+# DB_SQLITE_DIR=/tmp/db DB_SHARDS=s1 python manage.py test core
+@skipUnless(len(settings.DATABASE_SHARDS) > 1, 'no shard configured')
+class ShardDatabaseTest(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.shard = settings.DATABASE_SHARDS[1]
+        self.user = create_user()
+        ShardAssignment.objects.create(user=self.user, shard=self.shard)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_rows_written_to_user_shard(self):
+        """test the api reads and writes the shard of the user"""
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertFalse(Tag.objects.using('default').exists())
+        self.assertEqual(Tag.objects.using(self.shard).get().name, 'Vegan')
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.data[0]['name'], 'Vegan')
+
+    @override_settings(SHARD_ASSIGNMENT_CACHE_SECONDS=0)
+    def test_move_user_shard(self):
+        """test moving a user copies its recipes with their links"""
+        with sharding.user_shard(self.user.pk):
+            tag = Tag.objects.create(user=self.user, name='Vegan')
+            recipe = Recipe.objects.create(
+                user=self.user, title='Soup', time_minute=5, price=2
+            )
+            recipe.tags.add(tag)
+        # taken id on the target shard
+        Tag.objects.using('default').create(
+            user=create_user('other@xontel.com'), name='Dessert'
+        )
+
+        key = f'recipe_index:{self.user.pk}'
+        generation = generations.get_store().get(key)
+
+        call_command('move_user_shard', self.user.email, 'default',
+                     stdout=StringIO())
+
+        self.assertEqual(sharding.shard_for_user(self.user.pk), 'default')
+        self.assertGreater(
+            generations.get_store().get(key), generation
+        )
+        self.assertFalse(Recipe.objects.using(self.shard).exists())
+        moved = Recipe.objects.using('default').get(user=self.user)
+        self.assertEqual(list(moved.tags.values_list('name', flat=True)),
+                         ['Vegan'])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+
+    def test_generate_data_on_user_shards(self):
+        """test generated rows are written to the shard of their user"""
+        call_command('generate_data', users=4, recipes=2, tags=2,
+                     ingredients=2, distribution='fixed', stdout=StringIO())
+
+        for user in get_user_model().objects.filter(
+                email__startswith='synthetic'):
+            shard = sharding.shard_for_user(user.pk)
+            self.assertEqual(
+                Recipe.objects.using(shard).filter(user=user).count(), 2
+            )
+            for other in settings.DATABASE_SHARDS:
+                if other != shard:
+                    self.assertFalse(
+                        Tag.objects.using(other).filter(user=user).exists()
+                    )
@@ -0,0 +1,57 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Recipe, SlowQuery
+from core.testing import single_database
+
+RECIPES_URL = reverse('recipes:recipe-list')
+
+
+@single_database
+class SlowQueryMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456'
+        )
+        self.client.force_authenticate(self.user)
+        Recipe.objects.create(
+            user=self.user,
+            title='CheeseCake',
+            time_minute=20,
+            price=20.00
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_query_recorded_with_plan(self):
+        """test queries over the threshold are stored with their plan"""
+        with self.assertLogs('core.slow_queries', 'WARNING'):
+            self.client.get(RECIPES_URL)
+
+        query = SlowQuery.objects.filter(sql__contains='core_recipe').first()
+        self.assertEqual(query.view, 'RecipeViewSet.list')
+        self.assertEqual(query.path, RECIPES_URL)
+        self.assertTrue(query.plan)
+        self.assertTrue(query.stack)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=10 ** 6)
+    def test_fast_query_ignored(self):
+        """test queries under the threshold are not recorded"""
+        self.client.get(RECIPES_URL)
+
+        self.assertFalse(SlowQuery.objects.exists())
+
+    @override_settings(
+        SLOW_QUERY_THRESHOLD_MS=0,
+        SLOW_QUERY_PATHS=['/api/users/']
+    )
+    def test_other_paths_ignored(self):
+        """test only the configured paths are instrumented"""
+        self.client.get(RECIPES_URL)
+
+        self.assertFalse(SlowQuery.objects.exists())
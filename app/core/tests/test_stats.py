@@ -0,0 +1,150 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import sharding, stats
+from ..deletion import purge_user
+from ..models import Ingredient, Recipe, RecipeStats, RecipeStatsCount, Tag
+from ..testing import SHARD_DATABASES
+
+
+def create_recipe(user, price=2, time_minute=5, **params):
+    return Recipe.objects.create(
+        user=user, title='Soup', time_minute=time_minute, price=price,
+        **params
+    )
+
+
+class RecipeStatsTest(TestCase):
+    # the stats live on the shard of the user
+    databases = SHARD_DATABASES
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@xontel.com', 'test123456'
+        )
+        token = sharding.activate(sharding.shard_for_user(self.user.id))
+        self.addCleanup(sharding.deactivate, token)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Salt'
+        )
+        self.recipe = create_recipe(self.user, price=4, time_minute=15)
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(self.ingredient)
+        create_recipe(self.user, price='1.50', time_minute=200)
+
+    def assertConsistent(self):
+        user_stats = RecipeStats.objects.get(user=self.user)
+        self.assertEqual(stats.check(user_stats), [])
+
+    def test_summary_builds_stats(self):
+        """test the stats are built from the recipes on first read"""
+        summary = stats.summary(self.user.id)
+
+        self.assertEqual(summary['recipes'], 2)
+        self.assertEqual(summary['price']['total'], Decimal('5.50'))
+        self.assertEqual(summary['price']['median'], Decimal('2.75'))
+        self.assertEqual(summary['time_minute']['average'], 107.5)
+        histogram = {
+            b['le']: b['recipes'] for b in summary['time_minute']['histogram']
+        }
+        self.assertEqual(histogram[20], 1)
+        self.assertEqual(histogram[None], 1)
+        self.assertEqual(summary['top_tags'], [
+            {'id': self.tag.id, 'name': 'Vegan', 'recipes': 1}
+        ])
+        self.assertConsistent()
+
+    def test_changes_update_stats(self):
+        """test recipe and link changes are applied incrementally"""
+        stats.rebuild(self.user.id)
+
+        recipe = create_recipe(self.user, price=3)
+        recipe.tags.add(self.tag)
+        recipe.ingredients.add(self.ingredient)
+        self.assertConsistent()
+
+        recipe.price = 6
+        recipe.time_minute = 45
+        recipe.save()
+        self.tag.recipe_set.remove(self.recipe, recipe)
+        recipe.ingredients.clear()
+        self.assertConsistent()
+
+        self.ingredient.delete()
+        self.recipe.delete()
+        self.assertConsistent()
+        summary = stats.summary(self.user.id)
+        self.assertEqual(summary['recipes'], 2)
+        self.assertEqual(summary['top_ingredients'], [])
+
+    def test_unbuilt_stats_not_updated(self):
+        """test changes of users without stats don't create them"""
+        create_recipe(self.user)
+
+        self.assertFalse(RecipeStats.objects.exists())
+
+    def test_unbuilt_row_rebuilt(self):
+        """test a row left by an interrupted first build is counted again"""
+        RecipeStats.objects.create(user=self.user, built=False)
+        create_recipe(self.user, price=3)
+
+        summary = stats.summary(self.user.id)
+
+        self.assertEqual(summary['recipes'], 3)
+        self.assertTrue(RecipeStats.objects.get(user=self.user).built)
+        self.assertConsistent()
+
+    def test_save_without_stats_skips_select(self):
+        """test saving a loaded recipe reads nothing for users without
+        stats"""
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        recipe.price = 7
+
+        with CaptureQueriesContext(connection) as queries:
+            recipe.save()
+
+        self.assertFalse(
+            [q for q in queries if q['sql'].startswith('SELECT')]
+        )
+        stats.rebuild(self.user.id)
+        recipe.price = 8
+        recipe.save()
+        self.assertConsistent()
+
+    def test_check_command(self):
+        """test stats left behind by bulk updates are found and fixed"""
+        stats.rebuild(self.user.id)
+        Recipe.objects.filter(user=self.user).update(price=10)
+
+        with self.assertRaises(CommandError):
+            call_command('check_recipe_stats', stdout=StringIO())
+        call_command('check_recipe_stats', fix=True, stdout=StringIO())
+
+        self.assertConsistent()
+
+    def test_rebuild_command(self):
+        """test the stats of users are recomputed"""
+        call_command(
+            'rebuild_recipe_stats', self.user.email, stdout=StringIO()
+        )
+
+        self.assertEqual(RecipeStats.objects.get(user=self.user).recipes, 2)
+        self.assertConsistent()
+
+    def test_purge_user_deletes_stats(self):
+        """test purged users leave no stats behind"""
+        stats.rebuild(self.user.id)
+
+        with self.assertLogs('core.deletion'):
+            purge_user(self.user, batch_size=1)
+
+        self.assertFalse(RecipeStats.objects.exists())
+        self.assertFalse(RecipeStatsCount.objects.exists())
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import threading
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from .. import throttling
+from ..testing import single_database
+
+TOKEN_URL = reverse('users:auth_token')
+TAGS_URL = reverse('recipes:tag-list')
+
+
+class TokenBucketTest(TestCase):
+
+    def test_take_until_empty_then_refill(self):
+        """test a bucket allows bursts of its capacity then its rate"""
+        state = None
+        for _ in range(3):
+            state, wait = throttling.take(state, 1, 3, now=0)
+            self.assertEqual(wait, 0)
+
+        state, wait = throttling.take(state, 1, 3, now=0.5)
+        self.assertEqual(wait, 0.5)
+        state, wait = throttling.take(state, 1, 3, now=1)
+        self.assertEqual(wait, 0)
+
+    def test_locmem_store(self):
+        """test buckets are kept per key"""
+        store = throttling.LocMemBucketStore()
+
+        self.assertEqual(store.take('a', 1, 1, now=0), 0)
+        self.assertGreater(store.take('a', 1, 1, now=0), 0)
+        self.assertEqual(store.take('b', 1, 1, now=0), 0)
+
+    def test_sqlite_store_shared(self):
+        """test stores on the same file share buckets atomically"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'throttle.sqlite3')
+            stores = [throttling.SQLiteBucketStore(path) for _ in range(2)]
+            allowed = []
+
+            def worker(store):
+                for _ in range(20):
+                    if not store.take('key', 0.001, 25):
+                        allowed.append(1)
+
+            threads = [
+                threading.Thread(target=worker, args=(store,))
+                for store in stores for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(allowed), 25)
+
+
+@override_settings(THROTTLE_ENABLED=True)
+@single_database
+class ThrottleApiTest(TestCase):
+
+    def setUp(self):
+        throttling.get_store().clear()
+        self.client = APIClient()
+
+    def test_login_throttled(self):
+        """test token requests have their own per ip bucket"""
+        payload = {'email': 'test@xontel.com', 'password': 'wrong'}
+        for _ in range(10):
+            res = self.client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', res)
+
+    def test_user_bucket(self):
+        """test authenticated requests use the per user bucket"""
+        user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456'
+        )
+        self.client.force_authenticate(user)
+        key = f'throttle_user_{user.pk}'
+        # leave a single token in the bucket
+        for _ in range(599):
+            throttling.get_store().take(key, 10, 600)
+
+        self.assertEqual(self.client.get(TAGS_URL).status_code, 200)
+        self.assertEqual(
+            self.client.get(TAGS_URL).status_code,
+            status.HTTP_429_TOO_MANY_REQUESTS
+        )
@@ -0,0 +1,172 @@
+"""
+Token bucket throttles for the api.
+
+DRF's throttles keep the timestamp of every request in the window and
+rewrite the whole list on each request. A bucket only needs how many
+tokens it held and when: a rate of 'N/period' holds up to N tokens and
+regains N per period, every request takes one.
+
+Buckets live in THROTTLE_STORE: 'locmem' for one process, 'sqlite' to
+share them between the workers of a host through THROTTLE_SQLITE_PATH.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from rest_framework import throttling
+
+
+def take(state, rate, capacity, now):
+    """take a token from a bucket
+
+    state is (tokens, updated) or None for a full bucket, returns the new
+    state and the seconds to wait for a token, 0 when one was taken
+    """
+    if state is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, state[0] + (now - state[1]) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+def _full_at(state, rate, capacity):
+    """time at which a bucket is full again and can be forgotten"""
+    tokens, updated = state
+    return updated + (capacity - tokens) / rate
+
+
+class LocMemBucketStore:
+    """buckets of the current process"""
+    # forget full buckets once this many are stored
+    max_entries = 10000
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            state, wait = take(
+                self._buckets.get(key, (None,))[0], rate, capacity, now
+            )
+            self._buckets[key] = (state, _full_at(state, rate, capacity))
+            if len(self._buckets) > self.max_entries:
+                self._buckets = {
+                    k: v for k, v in self._buckets.items() if v[1] > now
+                }
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBucketStore:
+    """buckets shared by the processes of a host through a sqlite file"""
+    # one take in this many also deletes full buckets
+    cleanup_every = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # connections are per thread and can't be inherited by forks
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS bucket ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                'updated REAL NOT NULL, full_at REAL NOT NULL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.takes = 0
+        return self._local.connection
+
+    def take(self, key, rate, capacity, now=None):
+        now = time.time() if now is None else now
+        connection = self._connection()
+        # the write lock is taken up front so concurrent takes of the
+        # same bucket are serialized instead of failing on upgrade
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            state = connection.execute(
+                'SELECT tokens, updated FROM bucket WHERE key = ?', (key,)
+            ).fetchone()
+            state, wait = take(state, rate, capacity, now)
+            connection.execute(
+                'INSERT OR REPLACE INTO bucket VALUES (?, ?, ?, ?)',
+                (key, *state, _full_at(state, rate, capacity))
+            )
+            self._local.takes += 1
+            if self._local.takes % self.cleanup_every == 0:
+                connection.execute(
+                    'DELETE FROM bucket WHERE full_at <= ?', (now,)
+                )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+    def clear(self):
+        self._connection().execute('DELETE FROM bucket')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    """return the bucket store configured by THROTTLE_STORE"""
+    if settings.THROTTLE_STORE == 'sqlite':
+        key = ('sqlite', settings.THROTTLE_SQLITE_PATH)
+    else:
+        key = ('locmem',)
+    with _stores_lock:
+        if key not in _stores:
+            if key[0] == 'sqlite':
+                _stores[key] = SQLiteBucketStore(key[1])
+            else:
+                _stores[key] = LocMemBucketStore()
+        return _stores[key]
+
+
+class TokenBucketThrottle(throttling.SimpleRateThrottle):
+    """SimpleRateThrottle keeping a token bucket per key"""
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0
+        if not settings.THROTTLE_ENABLED or self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        self.wait_seconds = get_store().take(
+            self.key, self.num_requests / self.duration, self.num_requests
+        )
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, TokenBucketThrottle):
+    """limit anonymous requests per ip with the 'anon' rate"""
+
+
+class UserRateThrottle(throttling.UserRateThrottle, TokenBucketThrottle):
+    """limit requests per user (or ip) with the 'user' rate"""
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, TokenBucketThrottle):
+    """limit views with a throttle_scope by the rate of their scope"""
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+from . import metrics as core_metrics
+
+
+def metrics(request):
+    """expose the application metrics in the prometheus text format"""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(
+        core_metrics.registry.exposition(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -1,5 +1,37 @@
 from django.apps import AppConfig
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save
+)
 
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        from core import stats
+        from core.models import Ingredient, Recipe, Tag
+        from . import autocomplete, index, signals
+
+        for model in (Tag, Ingredient, Recipe):
+            post_save.connect(signals.object_saved, sender=model)
+            post_delete.connect(signals.object_deleted, sender=model)
+        for through in (Recipe.tags.through, Recipe.ingredients.through):
+            m2m_changed.connect(signals.recipe_links_changed, sender=through)
+
+        for through in (Recipe.tags.through, Recipe.ingredients.through):
+            m2m_changed.connect(index.links_changed, sender=through)
+        post_delete.connect(index.recipe_deleted, sender=Recipe)
+        for model in (Tag, Ingredient):
+            post_delete.connect(index.member_deleted, sender=model)
+
+        pre_save.connect(stats.recipe_pre_save, sender=Recipe)
+        post_save.connect(stats.recipe_saved, sender=Recipe)
+        pre_delete.connect(stats.recipe_pre_delete, sender=Recipe)
+        for through in (Recipe.tags.through, Recipe.ingredients.through):
+            m2m_changed.connect(stats.links_changed, sender=through)
+        for model in (Tag, Ingredient):
+            pre_delete.connect(stats.member_deleted, sender=model)
+
+        for model in (Tag, Ingredient):
+            post_save.connect(autocomplete.name_saved, sender=model)
+            post_delete.connect(autocomplete.name_deleted, sender=model)
@@ -0,0 +1,84 @@
+"""
+Per user sorted names of tags and ingredients, completing what is typed
+in the recipe editor without a query per keystroke.
+
+Names are kept casefolded in a sorted list, the completions of a prefix
+are the names from its bisection point on that start with it. Indexes
+are cached per process like the recipe index (recipes.index), saving or
+deleting a tag or ingredient updates them once the transaction commits
+and bumps their generation, so other processes rebuild theirs.
+"""
+import bisect
+import threading
+
+from core.models import Ingredient, Tag
+
+from .index import IndexCache
+
+
+class NameIndex:
+    """names of a user's tags or ingredients in case insensitive order"""
+
+    def __init__(self, rows=()):
+        self.keys = []
+        self.names = {}
+        self.lock = threading.Lock()
+        for id_, name in rows:
+            self.names[id_] = name
+        self.keys = sorted(
+            (name.casefold(), id_) for id_, name in self.names.items()
+        )
+
+    def add(self, id_, name):
+        self.remove(id_)
+        bisect.insort(self.keys, (name.casefold(), id_))
+        self.names[id_] = name
+
+    def remove(self, id_):
+        name = self.names.pop(id_, None)
+        if name is None:
+            return
+        del self.keys[bisect.bisect_left(self.keys, (name.casefold(), id_))]
+
+    def complete(self, prefix, limit=10):
+        """return (id, name) of the first names starting with prefix"""
+        prefix = prefix.casefold()
+        with self.lock:
+            start = bisect.bisect_left(self.keys, (prefix,))
+            matches = []
+            for key, id_ in self.keys[start:start + limit]:
+                if not key.startswith(prefix):
+                    break
+                matches.append((id_, self.names[id_]))
+            return matches
+
+
+def _builder(model):
+    def build(user_id):
+        return NameIndex(
+            model.objects.filter(user_id=user_id).values_list('id', 'name')
+            .iterator()
+        )
+    return build
+
+
+tag_names = IndexCache('tag_names', _builder(Tag))
+ingredient_names = IndexCache('ingredient_names', _builder(Ingredient))
+
+
+def _names(model):
+    return tag_names if model is Tag else ingredient_names
+
+
+def name_saved(sender, instance, using, **kwargs):
+    id_, name = instance.pk, instance.name
+    _names(sender).on_commit(
+        instance.user_id, lambda index: index.add(id_, name), using
+    )
+
+
+def name_deleted(sender, instance, using, **kwargs):
+    id_ = instance.pk
+    _names(sender).on_commit(
+        instance.user_id, lambda index: index.remove(id_), using
+    )
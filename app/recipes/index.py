@@ -0,0 +1,295 @@
+"""
+Per user index of the ingredients and tags of recipes, answering which
+recipes a set of ingredients covers and which recipes are alike without
+joining the link tables.
+
+An index keeps the ingredients (and tags) of every recipe and, per
+ingredient, the recipes using it: counting the postings of a pantry, or
+of the ingredients and tags of a recipe, gives how many of them every
+other recipe shares, touching only recipes that share any. Each process
+keeps the indexes of its RECIPE_INDEX_MAX_USERS most recently used users.
+
+Committed changes of links update the indexes of the process
+in place and bump a per user generation (core.generations), indexes of
+other processes are rebuilt when they see it or after
+RECIPE_INDEX_SECONDS. Queryset .update() and bulk operations send no
+signal, callers bump the generation themselves (IndexCache.invalidate)
+or leave it to the timeout.
+"""
+import math
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+from core import generations, metrics
+from core.models import Ingredient, Recipe
+
+Match = namedtuple('Match', 'recipe_id coverage missing')
+Similar = namedtuple('Similar', 'recipe_id similarity shared')
+
+METRICS = ('jaccard', 'cosine')
+
+
+class SetIndex:
+    """sets of ids per recipe, with the recipes of every id"""
+
+    def __init__(self):
+        self.sets = {}
+        self.postings = {}
+
+    def add(self, recipe_id, ids):
+        self.sets.setdefault(recipe_id, set()).update(ids)
+        for id_ in ids:
+            self.postings.setdefault(id_, set()).add(recipe_id)
+
+    def remove(self, recipe_id, ids=None):
+        """remove ids from the set of a recipe, all of them by default"""
+        members = self.sets.get(recipe_id, set())
+        if ids is None:
+            ids = set(members)
+        for id_ in ids:
+            members.discard(id_)
+            recipes = self.postings.get(id_, set())
+            recipes.discard(recipe_id)
+            if not recipes:
+                self.postings.pop(id_, None)
+        if not members:
+            self.sets.pop(recipe_id, None)
+
+    def remove_member(self, id_):
+        for recipe_id in list(self.postings.get(id_, ())):
+            self.remove(recipe_id, (id_,))
+
+    def overlaps(self, ids):
+        """return how many of ids the set of every recipe has"""
+        counts = Counter()
+        for id_ in ids:
+            counts.update(self.postings.get(id_, ()))
+        return counts
+
+    def size(self, recipe_id):
+        return len(self.sets.get(recipe_id, ()))
+
+
+class RecipeIndex:
+    """ingredients and tags of the recipes of one user"""
+
+    def __init__(self, ingredient_links=(), tag_links=()):
+        self.ingredients = SetIndex()
+        self.tags = SetIndex()
+        self.lock = threading.Lock()
+        for recipe_id, ingredient_id in ingredient_links:
+            self.ingredients.add(recipe_id, (ingredient_id,))
+        for recipe_id, tag_id in tag_links:
+            self.tags.add(recipe_id, (tag_id,))
+
+    def remove(self, recipe_id):
+        self.ingredients.remove(recipe_id)
+        self.tags.remove(recipe_id)
+
+    def cookable(self, pantry, min_coverage=1.0, limit=None):
+        """return recipes whose ingredients the pantry covers at least by
+        min_coverage, best covered first"""
+        pantry = set(pantry)
+        with self.lock:
+            ranked = []
+            covered = self.ingredients.overlaps(pantry)
+            for recipe_id, count in covered.items():
+                coverage = count / self.ingredients.size(recipe_id)
+                if coverage >= min_coverage:
+                    ranked.append((-coverage, -count, recipe_id))
+            ranked.sort()
+            return [
+                Match(
+                    recipe_id, -coverage,
+                    sorted(self.ingredients.sets[recipe_id] - pantry)
+                )
+                for coverage, _, recipe_id in ranked[:limit]
+            ]
+
+    def similar(self, recipe_id, metric='jaccard', limit=None):
+        """return the recipes sharing most ingredients and tags with a
+        recipe, most similar first"""
+        with self.lock:
+            shared = Counter()
+            size = 0
+            for sets in (self.ingredients, self.tags):
+                shared.update(sets.overlaps(sets.sets.get(recipe_id, ())))
+                size += sets.size(recipe_id)
+            shared.pop(recipe_id, None)
+            ranked = []
+            for other, count in shared.items():
+                other_size = (
+                    self.ingredients.size(other) + self.tags.size(other)
+                )
+                if metric == 'cosine':
+                    similarity = count / math.sqrt(size * other_size)
+                else:
+                    similarity = count / (size + other_size - count)
+                ranked.append((-similarity, -count, other))
+            ranked.sort()
+            return [
+                Similar(other, -similarity, -count)
+                for similarity, count, other in ranked[:limit]
+            ]
+
+
+def build_index(user_id):
+    """return the index of a user's recipes read from the database"""
+    ingredient_links = Recipe.ingredients.through.objects.filter(
+        recipe__user_id=user_id
+    ).values_list('recipe_id', 'ingredient_id')
+    tag_links = Recipe.tags.through.objects.filter(
+        recipe__user_id=user_id
+    ).values_list('recipe_id', 'tag_id')
+    return RecipeIndex(ingredient_links.iterator(), tag_links.iterator())
+
+
+class IndexCache:
+    """least recently used indexes of this process, one per user"""
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _generation_key(self, user_id):
+        return f'{self.name}:{user_id}'
+
+    def get(self, user_id):
+        """return the index of a user, building it if stale or missing"""
+        generation = generations.get_store().get(
+            self._generation_key(user_id)
+        )
+        with self._lock:
+            entry = self._entries.get(user_id)
+            hit = (
+                entry is not None
+                and entry['generation'] == generation
+                and entry['expires'] > time.monotonic()
+            )
+            if hit:
+                self._entries.move_to_end(user_id)
+        metrics.record_cache(self.name, hit)
+        if hit:
+            return entry['index']
+
+        # the generation read before the rows, a change committed
+        # meanwhile makes the next request rebuild
+        index = self.build(user_id)
+        with self._lock:
+            self._entries[user_id] = {
+                'index': index,
+                'generation': generation,
+                'expires': time.monotonic() + settings.RECIPE_INDEX_SECONDS,
+            }
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > settings.RECIPE_INDEX_MAX_USERS:
+                self._entries.popitem(last=False)
+        return index
+
+    def changed(self, user_id, updates):
+        """apply committed changes to the index of a user, if loaded, and
+        make other processes rebuild theirs"""
+        generation = generations.get_store().bump(
+            self._generation_key(user_id)
+        )
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry['generation'] != generation - 1:
+                # another process changed the rows too, its changes
+                # aren't in this index
+                del self._entries[user_id]
+                entry = None
+        if entry is None:
+            return
+        with entry['index'].lock:
+            for update in updates:
+                update(entry['index'])
+            entry['generation'] = generation
+
+    def invalidate(self, user_id):
+        """make every process rebuild the index of a user, e.g. after
+        changes that send no signal"""
+        generations.get_store().bump(self._generation_key(user_id))
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def on_commit(self, user_id, update, using):
+        """apply update once the transaction commits, batched per user"""
+        key = (self.name, user_id)
+        connection = transaction.get_connection(using)
+        for _, func in connection.run_on_commit:
+            if getattr(func, 'index_key', None) == key:
+                func.updates.append(update)
+                return
+
+        def apply():
+            # updates made after the callback ran get their own
+            apply.index_key = None
+            self.changed(user_id, apply.updates)
+
+        apply.index_key = key
+        apply.updates = [update]
+        transaction.on_commit(apply, using=using)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+indexes = IndexCache('recipe_index', build_index)
+
+
+def _sets(index, model):
+    if model in (Recipe.ingredients.through, Ingredient):
+        return index.ingredients
+    return index.tags
+
+
+def links_changed(sender, instance, action, reverse, pk_set, using,
+                  **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    pk_set = set(pk_set or ())
+    if not reverse:
+        if action == 'post_add':
+            def update(index):
+                _sets(index, sender).add(instance.pk, pk_set)
+        else:
+            def update(index):
+                _sets(index, sender).remove(
+                    instance.pk, pk_set if action == 'post_remove' else None
+                )
+    elif action == 'post_add':
+        def update(index):
+            for recipe_id in pk_set:
+                _sets(index, sender).add(recipe_id, (instance.pk,))
+    elif action == 'post_remove':
+        def update(index):
+            for recipe_id in pk_set:
+                _sets(index, sender).remove(recipe_id, (instance.pk,))
+    else:
+        def update(index):
+            _sets(index, sender).remove_member(instance.pk)
+    indexes.on_commit(instance.user_id, update, using)
+
+
+def recipe_deleted(sender, instance, using, **kwargs):
+    recipe_id = instance.pk
+    indexes.on_commit(
+        instance.user_id, lambda index: index.remove(recipe_id), using
+    )
+
+
+def member_deleted(sender, instance, using, **kwargs):
+    """drop a deleted ingredient or tag from the recipes using it"""
+    id_ = instance.pk
+    indexes.on_commit(
+        instance.user_id,
+        lambda index: _sets(index, sender).remove_member(id_), using
+    )
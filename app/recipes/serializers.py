@@ -1,8 +1,10 @@
 from rest_framework import serializers
 from core.models import Tag, Ingredient, Recipe
+from core.profiling import ProfiledSerializerMixin
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(ProfiledSerializerMixin,
+                    serializers.ModelSerializer):
     """serializer for tag objects"""
     class Meta:
         model = Tag
@@ -10,7 +12,8 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(ProfiledSerializerMixin,
+                           serializers.ModelSerializer):
     """serializer for ingredents object"""
     class Meta:
         model = Ingredient
@@ -18,7 +21,8 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(ProfiledSerializerMixin,
+                       serializers.ModelSerializer):
     """serializer for a recipe"""
     ingredients = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -44,7 +48,82 @@ class RecipeDetailSerializer(RecipeSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+class CookableRecipeSerializer(RecipeSerializer):
+    """serialize a recipe with how much of it the pantry covers"""
+    coverage = serializers.SerializerMethodField()
+    missing = serializers.SerializerMethodField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('coverage', 'missing')
+
+    def get_coverage(self, recipe):
+        return round(self.context['matches'][recipe.id].coverage, 4)
+
+    def get_missing(self, recipe):
+        return self.context['matches'][recipe.id].missing
+
+
+class SimilarRecipeSerializer(RecipeSerializer):
+    """serialize a recipe with its similarity to another"""
+    similarity = serializers.SerializerMethodField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('similarity',)
+
+    def get_similarity(self, recipe):
+        return round(self.context['similar'][recipe.id].similarity, 4)
+
+
+class RecipeCountSerializer(serializers.Serializer):
+    """serialize a tag or ingredient with a number of recipes"""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    recipes = serializers.IntegerField()
+
+
+class ShoppingListSerializer(serializers.Serializer):
+    """serialize the merged ingredients and totals of recipes"""
+    recipes = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=None, decimal_places=2)
+    time_minute = serializers.IntegerField()
+    ingredients = RecipeCountSerializer(many=True)
+
+
+class PriceStatsSerializer(serializers.Serializer):
+    total = serializers.DecimalField(max_digits=None, decimal_places=2)
+    average = serializers.DecimalField(
+        max_digits=None, decimal_places=2, allow_null=True
+    )
+    median = serializers.DecimalField(
+        max_digits=None, decimal_places=2, allow_null=True
+    )
+
+
+class TimeBucketSerializer(serializers.Serializer):
+    # null for the bucket of the longest recipes
+    le = serializers.IntegerField(allow_null=True)
+    recipes = serializers.IntegerField()
+
+
+class TimeStatsSerializer(serializers.Serializer):
+    total = serializers.IntegerField()
+    average = serializers.FloatField(allow_null=True)
+    median = serializers.FloatField(allow_null=True)
+    histogram = TimeBucketSerializer(many=True)
+
+
+class RecipeStatsSerializer(serializers.Serializer):
+    """serialize the statistics of a user's recipes"""
+    recipes = serializers.IntegerField()
+    price = PriceStatsSerializer()
+    time_minute = TimeStatsSerializer()
+    top_tags = RecipeCountSerializer(many=True)
+    top_ingredients = RecipeCountSerializer(many=True)
+    updated_at = serializers.DateTimeField()
+
+
+class RecipeImageSerializer(ProfiledSerializerMixin,
+                            serializers.ModelSerializer):
     """Serializer for uploading images to recipes"""
 
     class Meta:
@@ -0,0 +1,35 @@
+from core import events
+
+
+def object_saved(sender, instance, created, using, **kwargs):
+    """publish the creation or update of a tag, ingredient or recipe"""
+    action = 'created' if created else 'updated'
+    events.publish(
+        instance.user_id, f'{sender._meta.model_name}.{action}',
+        instance.pk, using=using
+    )
+
+
+def object_deleted(sender, instance, using, **kwargs):
+    """publish the deletion of a tag, ingredient or recipe"""
+    events.publish(
+        instance.user_id, f'{sender._meta.model_name}.deleted',
+        instance.pk, using=using
+    )
+
+
+def recipe_links_changed(sender, instance, action, reverse, model, pk_set,
+                         using, **kwargs):
+    """publish recipes whose tags or ingredients changed"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        events.publish(
+            instance.user_id, 'recipe.updated', instance.pk, using=using
+        )
+        return
+    # tag.recipe_set.add(...), the recipes are those of the tag's user
+    for recipe_id in pk_set or ():
+        events.publish(
+            instance.user_id, 'recipe.updated', recipe_id, using=using
+        )
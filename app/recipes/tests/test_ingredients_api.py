@@ -7,6 +7,7 @@ from rest_framework.test import APIClient
 from rest_framework import status
 
 from core.models import Ingredient, Recipe
+from core.testing import single_database
 
 from ..serializers import IngredientSerializer
 
@@ -25,6 +26,7 @@ class PublicIngredientsApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@single_database
 class PrivateIngredientsApiTests(TestCase):
     """test authorized ingredients api"""
 
@@ -7,6 +7,7 @@ from rest_framework.test import APIClient
 from rest_framework import status
 
 from core.models import Recipe, Tag, Ingredient
+from core.testing import QueryBudgetTestMixin, single_database
 
 from ..serializers import RecipeSerializer, RecipeDetailSerializer
 
@@ -17,6 +18,8 @@ from PIL import Image
 
 # /api/recipes/recipes
 RECIPES_URL = reverse('recipes:recipe-list')
+SHOPPING_LIST_URL = reverse('recipes:recipe-shopping-list')
+STATS_URL = reverse('recipes:recipe-stats')
 
 
 def image_upload_url(recipe_id):
@@ -64,6 +67,7 @@ class PublicRecipeApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@single_database
 class PrivateRecipeApiTest(TestCase):
     """test authenticated recipe api access"""
 
@@ -209,6 +213,7 @@ class PrivateRecipeApiTest(TestCase):
         self.assertEqual(len(tags), 0)
 
 
+@single_database
 class RecipeImageUpload(TestCase):
     """test uploading image"""
 
@@ -291,3 +296,224 @@ class RecipeImageUpload(TestCase):
         self.assertIn(serializer1.data, res.data)
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
+
+
+@single_database
+class RecipeListFilterOrderingTests(TestCase):
+    """test range filters, ordering and cursor pages of recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456'
+        )
+        self.client.force_authenticate(self.user)
+        self.cheap = sample_recipe(
+            user=self.user, title='b', price=2, time_minute=10
+        )
+        self.tie = sample_recipe(
+            user=self.user, title='c', price=2, time_minute=30
+        )
+        self.dear = sample_recipe(
+            user=self.user, title='a', price=9, time_minute=20
+        )
+
+    def ids(self, res):
+        return [recipe['id'] for recipe in res.data]
+
+    def test_range_filters(self):
+        """test recipes are filtered by price and time ranges"""
+        res = self.client.get(
+            RECIPES_URL, {'price_min': '1.50', 'price_max': 5}
+        )
+        self.assertEqual(self.ids(res), [self.tie.id, self.cheap.id])
+
+        res = self.client.get(RECIPES_URL, {'time_max': 20})
+        self.assertEqual(self.ids(res), [self.dear.id, self.cheap.id])
+
+    def test_invalid_filters(self):
+        """test non numeric bounds and unknown orderings are rejected"""
+        for params in ({'price_min': 'abc'}, {'price_max': 'NaN'},
+                       {'time_max': '1.5'}, {'ordering': 'link'},
+                       {'ordering': '--price'}):
+            res = self.client.get(RECIPES_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ordering(self):
+        """test orderings break ties by id in the same direction"""
+        res = self.client.get(RECIPES_URL, {'ordering': 'price'})
+        self.assertEqual(
+            self.ids(res), [self.cheap.id, self.tie.id, self.dear.id]
+        )
+
+        res = self.client.get(RECIPES_URL, {'ordering': '-price'})
+        self.assertEqual(
+            self.ids(res), [self.dear.id, self.tie.id, self.cheap.id]
+        )
+
+        res = self.client.get(RECIPES_URL, {'ordering': 'title'})
+        self.assertEqual(
+            self.ids(res), [self.dear.id, self.cheap.id, self.tie.id]
+        )
+
+    def test_cursor_pagination(self):
+        """test pages follow the ordering when a page size is given"""
+        res = self.client.get(
+            RECIPES_URL, {'ordering': 'price', 'page_size': 2}
+        )
+
+        self.assertEqual(
+            [r['id'] for r in res.data['results']],
+            [self.cheap.id, self.tie.id]
+        )
+        res = self.client.get(res.data['next'])
+        self.assertEqual(
+            [r['id'] for r in res.data['results']], [self.dear.id]
+        )
+        self.assertIsNone(res.data['next'])
+
+
+@single_database
+class ShoppingListApiTests(TestCase):
+    """test merging the ingredients of recipes into a shopping list"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_shopping_list(self):
+        """test ingredients are merged and price and time totalled"""
+        egg = sample_ingredient(user=self.user, name='egg')
+        flour = sample_ingredient(user=self.user, name='flour')
+        omelette = sample_recipe(
+            user=self.user, title='omelette', price=2.50, time_minute=5
+        )
+        omelette.ingredients.add(egg)
+        pancakes = sample_recipe(
+            user=self.user, title='pancakes', price=3, time_minute=20
+        )
+        pancakes.ingredients.add(egg, flour)
+        sample_recipe(user=self.user).ingredients.add(flour)
+
+        res = self.client.get(
+            SHOPPING_LIST_URL, {'recipes': f'{omelette.id},{pancakes.id}'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipes'], 2)
+        self.assertEqual(res.data['price'], '5.50')
+        self.assertEqual(res.data['time_minute'], 25)
+        self.assertEqual(res.data['ingredients'], [
+            {'id': egg.id, 'name': 'egg', 'recipes': 2},
+            {'id': flour.id, 'name': 'flour', 'recipes': 1},
+        ])
+
+    def test_shopping_list_other_users_recipes(self):
+        """test recipes of other users are rejected"""
+        other = get_user_model().objects.create_user(
+            'other@xontel.com',
+            'test123456'
+        )
+        recipe = sample_recipe(user=other)
+
+        res = self.client.get(SHOPPING_LIST_URL, {'recipes': recipe.id})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_shopping_list_requires_recipes(self):
+        """test the recipe ids are required"""
+        res = self.client.get(SHOPPING_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@single_database
+class RecipeStatsApiTests(TestCase):
+    """test the statistics of the user's recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_recipe_stats(self):
+        """test stats are built once then read from the stats tables"""
+        recipe = sample_recipe(user=self.user, price=4)
+        recipe.tags.add(sample_tag(user=self.user))
+        sample_recipe(user=self.user, price=2)
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipes'], 2)
+        self.assertEqual(res.data['price']['average'], '3.00')
+        self.assertEqual(res.data['top_tags'][0]['recipes'], 1)
+
+        sample_recipe(user=self.user, price=9)
+        with self.assertNumQueries(4):
+            res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['recipes'], 3)
+        self.assertEqual(res.data['price']['median'], '4.00')
+
+
+@single_database
+class RecipeQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """test recipe endpoints queries don't grow with the library"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456'
+        )
+        self.client.force_authenticate(self.user)
+
+    def add_recipes(self, count):
+        """add recipes each with a tag and an ingredient"""
+        for i in range(count):
+            recipe = sample_recipe(user=self.user, title=f'recipe {i}')
+            recipe.tags.add(sample_tag(user=self.user, name=f'tag {i}'))
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f'ingredient {i}')
+            )
+
+    def test_list_recipes_constant_queries(self):
+        """test listing recipes doesn't run a query per recipe"""
+        self.assertConstantQueries(
+            lambda: self.client.get(RECIPES_URL),
+            self.add_recipes,
+            max_queries=3
+        )
+
+    def test_list_tags_constant_queries(self):
+        """test listing tags doesn't run a query per tag"""
+        self.assertConstantQueries(
+            lambda: self.client.get(reverse('recipes:tag-list')),
+            self.add_recipes,
+            max_queries=1
+        )
+
+    def test_shopping_list_constant_queries(self):
+        """test a shopping list doesn't run a query per recipe"""
+        recipe_ids = []
+
+        def grow(count):
+            self.add_recipes(count)
+            recipe_ids[:] = Recipe.objects.values_list('id', flat=True)
+
+        self.assertConstantQueries(
+            lambda: self.client.get(SHOPPING_LIST_URL, {
+                'recipes': ','.join(str(i) for i in recipe_ids)
+            }),
+            grow,
+            max_queries=2
+        )
@@ -0,0 +1,203 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import generations
+from core.models import Ingredient, Recipe, Tag
+from core.testing import single_database
+
+from ..index import RecipeIndex, indexes
+
+COOKABLE_URL = reverse('recipes:recipe-cookable')
+
+
+def similar_url(recipe_id):
+    return reverse('recipes:recipe-similar', args=[recipe_id])
+
+
+class RecipeIndexTests(TestCase):
+    """test matching pantries against the recipe index"""
+
+    def setUp(self):
+        self.index = RecipeIndex([
+            (1, 10), (1, 11),
+            (2, 10), (2, 11), (2, 12), (2, 13),
+            (3, 12),
+        ])
+
+    def test_full_coverage(self):
+        """test only recipes with every ingredient in the pantry match"""
+        matches = self.index.cookable({10, 11, 12})
+
+        self.assertEqual([m.recipe_id for m in matches], [1, 3])
+        self.assertEqual(matches[0].missing, [])
+
+    def test_partial_coverage_ranked(self):
+        """test recipes are ranked by coverage with what is missing"""
+        matches = self.index.cookable({10, 11, 12}, min_coverage=0.5)
+
+        self.assertEqual([m.recipe_id for m in matches], [1, 3, 2])
+        self.assertEqual(matches[2].coverage, 0.75)
+        self.assertEqual(matches[2].missing, [13])
+
+    def test_similar(self):
+        """test recipes are ranked by shared ingredients and tags"""
+        self.index.tags.add(1, {20})
+        self.index.tags.add(2, {20})
+
+        jaccard = self.index.similar(1)
+        cosine = self.index.similar(1, metric='cosine')
+
+        self.assertEqual([s.recipe_id for s in jaccard], [2])
+        self.assertEqual(jaccard[0].similarity, 3 / 5)
+        self.assertEqual(jaccard[0].shared, 3)
+        self.assertAlmostEqual(cosine[0].similarity, 3 / (3 * 5) ** 0.5)
+        self.assertEqual(self.index.similar(4), [])
+
+    def test_incremental_updates(self):
+        """test adding and removing links changes the matches"""
+        ingredients = self.index.ingredients
+        ingredients.add(3, {14})
+        ingredients.remove(1, {11})
+        ingredients.remove_member(12)
+
+        self.assertEqual(ingredients.sets[3], {14})
+        self.assertNotIn(12, ingredients.postings)
+        self.assertEqual(
+            [m.recipe_id for m in self.index.cookable({10})], [1]
+        )
+
+
+@single_database
+class CookableApiTests(TestCase):
+    """test the what can I cook endpoint"""
+
+    def setUp(self):
+        indexes.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@xontel.com', 'test123456'
+        )
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.egg, self.flour, self.milk = (
+                Ingredient.objects.create(user=self.user, name=name)
+                for name in ('egg', 'flour', 'milk')
+            )
+            self.omelette = Recipe.objects.create(
+                user=self.user, title='omelette', time_minute=5, price=2
+            )
+            self.omelette.ingredients.add(self.egg)
+            self.pancakes = Recipe.objects.create(
+                user=self.user, title='pancakes', time_minute=20, price=3
+            )
+            self.pancakes.ingredients.add(self.egg, self.flour, self.milk)
+            self.breakfast = Tag.objects.create(
+                user=self.user, name='breakfast'
+            )
+            self.omelette.tags.add(self.breakfast)
+            self.pancakes.tags.add(self.breakfast)
+
+    def get(self, ingredients, **params):
+        return self.client.get(COOKABLE_URL, dict(
+            params, ingredients=','.join(str(i.id) for i in ingredients)
+        ))
+
+    def test_cookable_recipes(self):
+        """test recipes are ranked by coverage above the threshold"""
+        res = self.get([self.egg, self.flour])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [self.omelette.id])
+
+        res = self.get([self.egg, self.flour], min_coverage=0.5)
+
+        self.assertEqual(
+            [r['id'] for r in res.data], [self.omelette.id, self.pancakes.id]
+        )
+        self.assertEqual(res.data[1]['coverage'], 0.6667)
+        self.assertEqual(res.data[1]['missing'], [self.milk.id])
+
+    def test_other_users_recipes_excluded(self):
+        """test recipes of other users never match"""
+        other = get_user_model().objects.create_user(
+            'other@xontel.com', 'test123456'
+        )
+        recipe = Recipe.objects.create(
+            user=other, title='eggs', time_minute=5, price=2
+        )
+        recipe.ingredients.add(self.egg)
+
+        res = self.get([self.egg])
+
+        self.assertEqual([r['id'] for r in res.data], [self.omelette.id])
+
+    def test_index_updated_on_commit(self):
+        """test committed ingredient changes update the loaded index"""
+        self.get([self.egg])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pancakes.ingredients.remove(self.milk, self.flour)
+            self.omelette.delete()
+
+        with self.assertNumQueries(3):
+            res = self.get([self.egg])
+
+        self.assertEqual([r['id'] for r in res.data], [self.pancakes.id])
+
+    def test_change_by_other_process_rebuilds(self):
+        """test a generation bumped elsewhere makes the index rebuild"""
+        self.get([self.egg])
+        # another worker's change: no signal reaches this process
+        Recipe.ingredients.through.objects.filter(
+            recipe=self.omelette
+        ).delete()
+        generations.get_store().bump(f'recipe_index:{self.user.id}')
+
+        res = self.get([self.egg], min_coverage=0.3)
+
+        self.assertEqual([r['id'] for r in res.data], [self.pancakes.id])
+
+    def test_invalid_params(self):
+        """test bad ingredients or thresholds are rejected"""
+        self.assertEqual(
+            self.client.get(COOKABLE_URL).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        res = self.get([self.egg], min_coverage=0)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_similar_recipes(self):
+        """test similar recipes share ingredients or tags"""
+        soup = Recipe.objects.create(
+            user=self.user, title='soup', time_minute=30, price=4
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            soup.ingredients.add(self.milk)
+
+        res = self.client.get(similar_url(self.omelette.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id'] for r in res.data], [self.pancakes.id])
+        self.assertEqual(res.data[0]['similarity'], 0.5)
+
+    def test_similar_recipe_of_other_user(self):
+        """test similar recipes of another user's recipe are not found"""
+        other = get_user_model().objects.create_user(
+            'other@xontel.com', 'test123456'
+        )
+        recipe = Recipe.objects.create(
+            user=other, title='eggs', time_minute=5, price=2
+        )
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_similar_recipe_invalid_id(self):
+        """test a non numeric recipe id is not found"""
+        res = self.client.get(similar_url('abc'))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
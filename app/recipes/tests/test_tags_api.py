@@ -6,11 +6,15 @@ from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core import generations
 from core.models import Tag, Recipe
+from core.testing import single_database
 
+from ..autocomplete import tag_names
 from ..serializers import TagSerializer
 
 TAGS_URL = reverse('recipes:tag-list')
+AUTOCOMPLETE_URL = reverse('recipes:tag-autocomplete')
 
 
 class PublicTagsApiTests(TestCase):
@@ -26,6 +30,7 @@ class PublicTagsApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@single_database
 class PrivateTagsApiTests(TestCase):
     """test authorized tags API"""
 
@@ -133,3 +138,61 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
         self.assertEqual(len(res.data), 1)
+
+
+@single_database
+class TagAutocompleteTests(TestCase):
+    """test completing tag names"""
+
+    def setUp(self):
+        tag_names.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@xontel.com',
+            'test123456',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            for name in ('Vegan', 'vegetarian', 'Dessert', 'Very hot'):
+                Tag.objects.create(user=self.user, name=name)
+
+    def names(self, **params):
+        res = self.client.get(AUTOCOMPLETE_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [tag['name'] for tag in res.data]
+
+    def test_autocomplete(self):
+        """test names starting with the prefix are listed in order"""
+        self.assertEqual(
+            self.names(prefix='VEG'), ['Vegan', 'vegetarian']
+        )
+        self.assertEqual(self.names(prefix='ve', limit=1), ['Vegan'])
+        self.assertEqual(self.names(prefix='x'), [])
+
+    def test_autocomplete_from_memory(self):
+        """test completions after the first are served from memory"""
+        self.names(prefix='v')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(user=self.user, name='Vodka')
+            Tag.objects.get(name='Vegan').delete()
+
+        with self.assertNumQueries(0):
+            names = self.names(prefix='v')
+
+        self.assertEqual(names, ['vegetarian', 'Very hot', 'Vodka'])
+
+    def test_name_added_by_other_process(self):
+        """test tags created by another worker show up once it bumps the
+        generation"""
+        self.names(prefix='v')
+        # saved without signals, like a change made in another process
+        Tag.objects.bulk_create([Tag(user=self.user, name='Vodka')])
+        generations.get_store().bump(f'tag_names:{self.user.id}')
+
+        self.assertIn('Vodka', self.names(prefix='v'))
+
+    def test_list_prefix_filter(self):
+        """test the tag list is filtered by name prefix"""
+        res = self.client.get(TAGS_URL, {'prefix': 'de'})
+
+        self.assertEqual([tag['name'] for tag in res.data], ['Dessert'])
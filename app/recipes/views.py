@@ -1,34 +1,68 @@
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+from django.http import Http404
 from rest_framework import viewsets, mixins, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
+from core import metrics, stats as recipe_stats
 from core.models import Tag, Ingredient, Recipe
-from . import serializers
+from core.sharding import ShardedViewMixin
+from . import autocomplete, serializers
+from .pagination import RecipeCursorPagination
+from .index import METRICS, indexes
 
 # action add custom action to viewset
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 
-class BaseRecipeViewSet(viewsets.GenericViewSet,
+class BaseRecipeViewSet(ShardedViewMixin,
+                        viewsets.GenericViewSet,
                         mixins.ListModelMixin,
                         mixins.CreateModelMixin):
     """base viewset for user owned recipe attributes"""
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    # safe reads may be served by read replicas
+    use_replicas = True
+    # and under asgi on the read thread pool
+    async_reads = True
 
     def get_queryset(self):
         """return objects for the current authenticated user only"""
         assigned_only = bool(
             int(self.request.query_params.get('assigned_only', 0))
         )
+        prefix = self.request.query_params.get('prefix')
         queryset = self.queryset
         if assigned_only:
             queryset = queryset.filter(recipe__isnull=False)
+        if prefix:
+            # served by the case insensitive (user, name) index
+            queryset = queryset.filter(name__istartswith=prefix)
         return queryset.filter(
             user=self.request.user
         ).order_by('-name').distinct()
 
+    @action(methods=['GET'], detail=False)
+    def autocomplete(self, request):
+        """list the first names starting with ?prefix= in name order"""
+        prefix = request.query_params.get('prefix', '')
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= 50:
+            raise ValidationError({'limit': 'must be between 1 and 50'})
+        matches = self.names.get(request.user.id).complete(prefix, limit)
+        serializer = self.get_serializer(
+            [{'id': id_, 'name': name} for id_, name in matches], many=True
+        )
+        return Response(serializer.data)
+
     # allows hookup in the create process
     def perform_create(self, serializer):
         """create new object"""
@@ -39,25 +73,72 @@ class TagViewSet(BaseRecipeViewSet):
     """manage tags in database"""
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    names = autocomplete.tag_names
+    # token lookup and loading the names on a miss
+    query_budget = {'list': 2, 'autocomplete': 2}
 
 
 class IngredientViewSet(BaseRecipeViewSet):
     """manage ingredients in database"""
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    names = autocomplete.ingredient_names
+    query_budget = {'list': 2, 'autocomplete': 2}
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ShardedViewMixin, viewsets.ModelViewSet):
     """review recipe in the database"""
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all().order_by('-id')
+    use_replicas = True
+    async_reads = True
+    # token lookup, recipes and one prefetch per m2m, plus building the
+    # recipe index (recipes.index) when it isn't loaded, and the recipe
+    # stats (core.stats) on their first read
+    query_budget = {
+        'list': 4, 'retrieve': 4, 'cookable': 6, 'similar': 7,
+        'shopping_list': 3, 'stats': 19,
+    }
+    # set per action, e.g. upload_image uses the 'upload' rate
+    throttle_scope = None
+    pagination_class = RecipeCursorPagination
+    # ?ordering= values, each served by an index on (user, field, id)
+    orderings = ('price', 'time_minute', 'title', 'id')
 
     def _params_to_ints(self, qs):
         """convert list of strings(ids) to list of integers"""
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _param(self, name, convert):
+        """return a converted query parameter, None when absent"""
+        value = self.request.query_params.get(name)
+        if value is None:
+            return None
+        try:
+            value = convert(value)
+        except (ValueError, ArithmeticError):
+            raise ValidationError({name: 'must be a number'})
+        if isinstance(value, Decimal) and not value.is_finite():
+            raise ValidationError({name: 'must be a number'})
+        return value
+
+    def get_ordering(self):
+        """return the requested ordering, ties broken by id"""
+        ordering = self.request.query_params.get('ordering', '-id')
+        field = ordering[1:] if ordering.startswith('-') else ordering
+        if field not in self.orderings:
+            raise ValidationError(
+                {'ordering': f'one of {", ".join(self.orderings)}, '
+                             'optionally prefixed by -'}
+            )
+        # in the same direction, so one index scan serves both
+        direction = '-' if ordering.startswith('-') else ''
+        if field == 'id':
+            return (ordering,)
+        return (ordering, f'{direction}id')
+
     def get_queryset(self):
         """return recipes for the current authenticated user only"""
         tags = self.request.query_params.get('tags')
@@ -71,7 +152,21 @@ class RecipeViewSet(viewsets.ModelViewSet):
             ingredient_ids = self._params_to_ints(ingredients)
             queryset = queryset.filter(ingredients__id__in=ingredient_ids)
 
-        return queryset.filter(user=self.request.user)
+        price_min = self._param('price_min', Decimal)
+        if price_min is not None:
+            queryset = queryset.filter(price__gte=price_min)
+        price_max = self._param('price_max', Decimal)
+        if price_max is not None:
+            queryset = queryset.filter(price__lte=price_max)
+        time_max = self._param('time_max', int)
+        if time_max is not None:
+            queryset = queryset.filter(time_minute__lte=time_max)
+
+        return queryset.filter(
+            user=self.request.user
+        ).order_by(*self.get_ordering()).prefetch_related(
+            'tags', 'ingredients'
+        )
 
     def get_serializer_class(self):
         """return appropriate serializer class"""
@@ -79,6 +174,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeDetailSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'cookable':
+            return serializers.CookableRecipeSerializer
+        elif self.action == 'similar':
+            return serializers.SimilarRecipeSerializer
+        elif self.action == 'shopping_list':
+            return serializers.ShoppingListSerializer
+        elif self.action == 'stats':
+            return serializers.RecipeStatsSerializer
         return self.serializer_class
 
     def perform_create(self, serializer):
@@ -86,16 +189,23 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
 
     # detail=True add image to already exist recipes
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @action(methods=['POST'], detail=True, url_path='upload-image',
+            throttle_scope='upload')
     def upload_image(self, request, pk=None):
         """upload an image to a recipe"""
         recipe = self.get_object()
-        serializer = self.get_serializer(
-            recipe,
-            data=request.data
-        )
-        if serializer.is_valid():
-            serializer.save()
+        image = request.FILES.get('image')
+        if image is not None:
+            metrics.IMAGE_UPLOAD_BYTES.observe(image.size)
+        with metrics.IMAGE_UPLOAD_DURATION.time():
+            serializer = self.get_serializer(
+                recipe,
+                data=request.data
+            )
+            valid = serializer.is_valid()
+            if valid:
+                serializer.save()
+        if valid:
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -104,3 +214,105 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    def _limit(self):
+        """return the number of ranked recipes requested"""
+        try:
+            limit = int(self.request.query_params.get('limit', 20))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= 100:
+            raise ValidationError({'limit': 'must be between 1 and 100'})
+        return limit
+
+    def _ranked_response(self, ranked, context_name):
+        """respond with the recipes of ranked index results, in order"""
+        ranked = {item.recipe_id: item for item in ranked}
+        recipes = self.queryset.filter(
+            user=self.request.user, id__in=ranked
+        ).prefetch_related('tags', 'ingredients')
+        rank = {recipe_id: i for i, recipe_id in enumerate(ranked)}
+        recipes = sorted(recipes, key=lambda recipe: rank[recipe.id])
+        serializer = self.get_serializer(
+            recipes, many=True, context=dict(
+                self.get_serializer_context(), **{context_name: ranked}
+            )
+        )
+        return Response(serializer.data)
+
+    @action(methods=['GET'], detail=False)
+    def cookable(self, request):
+        """list recipes the given ingredients cover, best covered first"""
+        params = request.query_params
+        try:
+            pantry = self._params_to_ints(params['ingredients'])
+        except (KeyError, ValueError):
+            raise ValidationError(
+                {'ingredients': 'comma separated ingredient ids required'}
+            )
+        try:
+            min_coverage = float(params.get('min_coverage', 1))
+        except ValueError:
+            min_coverage = 0
+        if not 0 < min_coverage <= 1:
+            raise ValidationError(
+                {'min_coverage': 'must be greater than 0 and at most 1'}
+            )
+
+        matches = indexes.get(request.user.id).cookable(
+            pantry, min_coverage, self._limit()
+        )
+        return self._ranked_response(matches, 'matches')
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """list the recipes sharing most ingredients and tags with one"""
+        metric = request.query_params.get('metric', 'jaccard')
+        if metric not in METRICS:
+            raise ValidationError(
+                {'metric': f'one of {", ".join(METRICS)}'}
+            )
+        limit = self._limit()
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise Http404
+        if not self.queryset.filter(user=request.user, pk=pk).exists():
+            raise Http404
+        similar = indexes.get(request.user.id).similar(pk, metric, limit)
+        return self._ranked_response(similar, 'similar')
+
+    @action(methods=['GET'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """merge the ingredients of recipes and total their price and time"""
+        try:
+            recipe_ids = set(
+                self._params_to_ints(request.query_params['recipes'])
+            )
+        except (KeyError, ValueError):
+            raise ValidationError(
+                {'recipes': 'comma separated recipe ids required'}
+            )
+        if len(recipe_ids) > 200:
+            raise ValidationError({'recipes': 'at most 200 recipes'})
+
+        recipes = Recipe.objects.filter(user=request.user, id__in=recipe_ids)
+        totals = recipes.aggregate(
+            recipes=Count('id'), price=Sum('price'),
+            time_minute=Sum('time_minute')
+        )
+        if totals['recipes'] != len(recipe_ids):
+            raise ValidationError({'recipes': 'unknown recipe ids'})
+        totals['ingredients'] = Ingredient.objects.filter(
+            recipe__in=recipes
+        ).values('id', 'name').annotate(
+            recipes=Count('recipe')
+        ).order_by('name', 'id')
+        return Response(self.get_serializer(totals).data)
+
+    @action(methods=['GET'], detail=False)
+    def stats(self, request):
+        """return statistics of the user's recipes"""
+        return Response(
+            self.get_serializer(recipe_stats.summary(request.user.id)).data
+        )
@@ -0,0 +1,72 @@
+"""
+Remember successful logins for LOGIN_CACHE_SECONDS so clients that ask
+for a token again with the same credentials (e.g. on every app launch)
+get it without hashing the password again.
+
+Entries are keyed by an HMAC of the credentials, never the password, and
+hold the issued token with a fingerprint of the password hash it was
+checked against. The cache is per process, so a hit is only trusted
+after reading the token and its user in one query: the token must still
+exist, the user be active, keep the email and the same password hash. A
+password change or deactivation made by any process ends the entries.
+"""
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authtoken.models import Token
+
+from core import metrics
+
+
+def _digest(message):
+    return hmac.new(
+        settings.SECRET_KEY.encode(), message.encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def _entry_key(email, password):
+    return 'login:' + _digest(f'{email}\0{password}')
+
+
+def _fingerprint(user):
+    """stands for the password hash, which is never cached itself"""
+    return _digest(user.password)
+
+
+def _valid(entry, email):
+    token = Token.objects.select_related('user').filter(
+        key=entry['token']
+    ).first()
+    if token is None:
+        return False
+    user = token.user
+    return (
+        user.is_active
+        and getattr(user, user.USERNAME_FIELD) == email
+        and hmac.compare_digest(_fingerprint(user), entry['password'])
+    )
+
+
+def lookup(email, password):
+    """return the token key of a cached login that still holds or None"""
+    if not settings.LOGIN_CACHE_SECONDS:
+        return None
+    key = _entry_key(email, password)
+    entry = cache.get(key)
+    hit = entry is not None and _valid(entry, email)
+    if entry is not None and not hit:
+        cache.delete(key)
+    metrics.record_cache('login', hit)
+    return entry['token'] if hit else None
+
+
+def store(email, password, user, token_key):
+    """remember a successful login"""
+    if not settings.LOGIN_CACHE_SECONDS:
+        return
+    cache.set(_entry_key(email, password), {
+        'token': token_key,
+        'password': _fingerprint(user),
+    }, settings.LOGIN_CACHE_SECONDS)
@@ -1,9 +1,11 @@
 from django.contrib.auth import get_user_model, authenticate
 from rest_framework import serializers
 from django.utils.translation import ugettext_lazy as _
+from core.profiling import ProfiledSerializerMixin
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ProfiledSerializerMixin,
+                     serializers.ModelSerializer):
     """serializer for user object """
 
     class Meta:
@@ -1,8 +1,10 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher
 from django.urls import reverse
 
 # rest framework testing helpers
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
 
@@ -117,6 +119,85 @@ class publicUserApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+class LoginTests(TestCase):
+    """test token requests skip password hashing when possible"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.payload = {'email': 'test@xontel.com', 'password': 'test123456'}
+        self.user = create_user(**self.payload)
+
+    def test_repeated_login_is_cached(self):
+        """test the same token is returned checking it in one query"""
+        token = self.client.post(TOKEN_URL, self.payload).data['token']
+
+        with self.assertNumQueries(1):
+            res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.data['token'], token)
+
+    def test_cached_login_checks_password(self):
+        """test a wrong password never matches a cached login"""
+        self.client.post(TOKEN_URL, self.payload)
+
+        res = self.client.post(TOKEN_URL, {**self.payload, 'password': 'x'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_password_change_invalidates_login(self):
+        """test cached logins are forgotten when the user is saved"""
+        self.client.post(TOKEN_URL, self.payload)
+        self.user.set_password('new123456')
+        self.user.save()
+
+        res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_change_by_other_process_invalidates_login(self):
+        """test cached logins are checked against the stored user"""
+        user_model = get_user_model()
+        self.client.post(TOKEN_URL, self.payload)
+        # updates send no signal, like changes made by another worker
+        user_model.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(
+            self.client.post(TOKEN_URL, self.payload).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+
+        user_model.objects.filter(pk=self.user.pk).update(is_active=True)
+        self.client.post(TOKEN_URL, self.payload)
+        self.user.set_password('new123456')
+        user_model.objects.filter(pk=self.user.pk).update(
+            password=self.user.password
+        )
+        self.assertEqual(
+            self.client.post(TOKEN_URL, self.payload).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+
+    def test_logout_invalidates_login(self):
+        """test a cached login isn't returned once its token is gone"""
+        token = self.client.post(TOKEN_URL, self.payload).data['token']
+        Token.objects.filter(key=token).delete()
+
+        res = self.client.post(TOKEN_URL, self.payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res.data['token'], token)
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_login_upgrades_hash(self):
+        """test hashes with other iterations are rehashed on login"""
+        self.client.post(TOKEN_URL, self.payload)
+
+        self.user.refresh_from_db()
+        hasher = identify_hasher(self.user.password)
+        self.assertEqual(
+            hasher.decode(self.user.password)['iterations'], 1000
+        )
+
+
 class PrivateUserApiTests(TestCase):
     """test api requests that requires authentication"""
 
@@ -154,3 +235,12 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_user_deactivates(self):
+        """test deleting the user locks it out and schedules the purge"""
+        res = self.client.delete(USER_URL)
+
+        self.user.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deletion_requested_at)
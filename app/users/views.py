@@ -1,6 +1,13 @@
-from rest_framework import generics, authentication, permissions
+import time
+
+from rest_framework import generics, authentication, permissions, status
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from core import metrics
+from core.deletion import schedule_user_deletion
+from . import login_cache
 from .serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -13,14 +20,50 @@ class CreateTokenView(ObtainAuthToken):
     """create new auth token for user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken disables throttling
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    throttle_scope = 'login'
+
+    def post(self, request, *args, **kwargs):
+        """create token and record how long authentication took"""
+        start = time.perf_counter()
+        result = 'failure'
+        email = request.data.get('email')
+        password = request.data.get('password')
+        cacheable = isinstance(email, str) and isinstance(password, str)
+        try:
+            token_key = cacheable and login_cache.lookup(email, password)
+            if token_key:
+                result = 'cached'
+                return Response({'token': token_key})
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            user = serializer.validated_data['user']
+            # repeated logins get the token issued the first time
+            token, _ = Token.objects.get_or_create(user=user)
+            if cacheable:
+                login_cache.store(email, password, user, token.key)
+            result = 'success'
+            return Response({'token': token.key})
+        finally:
+            metrics.TOKEN_AUTH_DURATION.observe(
+                time.perf_counter() - start,
+                result=result
+            )
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """manage the authenticated user"""
     serializer_class = UserSerializer
     authentication_classes = (authentication.TokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
+    query_budget = {'get': 1}
 
     def get_object(self):
         """retrieve and return authenticated user"""
         return self.request.user
+
+    def destroy(self, request, *args, **kwargs):
+        """deactivate the user now, its data is purged in the background"""
+        schedule_user_deletion(self.get_object())
+        return Response(status=status.HTTP_202_ACCEPTED)